@@ -24,6 +24,9 @@ def add_common_args(psr):
                      help="EDU pair features (libsvm)")
     psr.add_argument("vocab", metavar="FILE",
                      help="feature vocabulary")
+    psr.add_argument("--cache-dir", metavar="DIR",
+                     help="binary cache for the input files "
+                     "(much faster loading after the first time)")
     psr.add_argument("--quiet", action="store_true",
                      help="Supress all feedback")
 
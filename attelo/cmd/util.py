@@ -19,6 +19,7 @@ def load_args_multipack(args):
                           args.pairings,
                           args.features,
                           args.vocab,
+                          cache_dir=args.cache_dir,
                           verbose=not args.quiet)
 
 
@@ -16,15 +16,13 @@ from __future__ import print_function
 import copy
 import sys
 import numpy
-from collections import defaultdict, namedtuple
+from collections import namedtuple
 from enum import Enum
 
 from attelo.optimisation.astar import State, Search, BeamSearch
 from .interface import Decoder
-from .util import (convert_prediction,
-                   get_sorted_edus,
-                   get_prob_map,
-                   simple_candidates)
+from .util import (convert_edges,
+                   ScoreMatrix)
 
 # pylint: disable=too-few-public-methods
 
@@ -116,6 +114,41 @@ class RfcConstraint(Enum):
 # pylint: enable=no-init
 
 
+class RightFrontier(namedtuple('RightFrontier', 'edu below')):
+    """
+    Persistent stack of the edus on the right frontier: `edu` is the top
+    of the stack (most recently attached) and `below` is the rest of the
+    frontier, or `None` at the bottom.
+
+    Frontiers are never modified, so the states of a search can share
+    their common parts
+    """
+    def nodes(self):
+        """return the stack nodes from the bottom of the frontier to
+        its top (in the order of `DiscData.accessible`)
+
+        :rtype: [RightFrontier]
+        """
+        res = []
+        node = self
+        while node is not None:
+            res.append(node)
+            node = node.below
+        res.reverse()
+        return res
+
+    @classmethod
+    def from_list(cls, edus):
+        """build a frontier from a list of edus, bottom first
+
+        :rtype: RightFrontier or None
+        """
+        frontier = None
+        for edu in edus:
+            frontier = cls(edu, frontier)
+        return frontier
+
+
 class DiscData(object):
     """
     Natural reading order decoding: incremental building of tree in order of
@@ -127,78 +160,136 @@ class DiscData(object):
 
     RF: right frontier, = admissible attachment point of current discourse unit
 
+    EDUs are designated by their position in the document (see
+    :py:class:`attelo.decoding.util.ScoreMatrix`)
+
+    Data are immutable: linking an edu returns a new DiscData that shares
+    the sequence of edus to link (we just move a cursor along it) and as
+    much of the right frontier as possible with its parent
+
     :param parent: parent state (previous decision)
 
     :param link: current decision (a triplet: target edu, source edu, relation)
-    :type link: (string, string, string)
+    :type link: (int, int, string)
 
     :param tolink: remaining unattached discourse units
-    :type tolink: [string]
+    :type tolink: [int]
     """
     def __init__(self, parent=None, accessible=None, tolink=None):
-        self._accessible = accessible or []
         self.parent = parent
+        self._frontier = RightFrontier.from_list(accessible or [])
         self._link = None
-        self._tolink = tolink or []
+        self._tolink = tuple(tolink or [])
+        self._cursor = 0
+
+    def _successor(self, frontier, link):
+        """return a child of this data, with the given frontier and
+        last link, and the current edu linked"""
+        new = self.__class__.__new__(self.__class__)
+        new.parent = self
+        new._frontier = frontier
+        new._link = link
+        new._tolink = self._tolink
+        new._cursor = self._cursor + 1
+        return new
+
+    def frontier(self):
+        """return the right frontier as a persistent stack
+
+        :rtype: RightFrontier or None
+        """
+        return self._frontier
 
     def accessible(self):
         """return the list of edus that are on the right frontier
 
-        :rtype: [string]
+        :rtype: [int]
         """
-        return self._accessible
+        if self._frontier is None:
+            return []
+        return [node.edu for node in self._frontier.nodes()]
 
     def final(self):
         "return `True` if there are no more links to be made"
-        return self._tolink == []
+        return self._cursor >= len(self._tolink)
 
     def tobedone(self):
         """return the list of edus to be linked
 
-        :rtype: [string]
+        :rtype: [int]
         """
-        return self._tolink
+        return list(self._tolink[self._cursor:])
+
+    def next_edu(self):
+        """return the next edu to be linked
+
+        :rtype: int
+        """
+        return self._tolink[self._cursor]
 
     def last_link(self):
         "return the link that was made to get to this state, if any"
         return self._link
 
-    def link(self, to_edu, from_edu, relation,
-             rfc=RfcConstraint.full):
+    def signature(self):
+        """return what determines the rest of the search from this data:
+        how many edus were linked so far, and the right frontier
+
+        :rtype: (int, (int, ...))
         """
+        return (self._cursor, tuple(self.accessible()))
+
+    def link_at(self, node, from_edu, relation,
+                rfc=RfcConstraint.full):
+        """
+        Return the data we get by attaching `from_edu` (the next edu to
+        be linked) to the edu on top of `node`, a node of the right
+        frontier ; this takes constant time.
+
         rfc = "full": use the distinction coord/subord
         rfc = "simple": consider everything as subord
         rfc = "none" no constraint on attachment
+
+        :rtype: DiscData
         """
-        #if to_edu not in self.accessible():
-        #    print("error: unreachable node", to_edu, "(ignored)", file= sys.stderr)
-        if True:
-            index = self.accessible().index(to_edu)
-            self._link = (to_edu, from_edu, relation)
-            # update the right frontier -- coord relations replace their
-            # attachment points, subord are appended, and evrything below
-            # disappear from the RF
-            # unknown relations are subord
-            #print(type(relation), file= sys.stderr)
-            #print(map(type, SUBORD_COORD.values()), file= sys.stderr)
-            if rfc == RfcConstraint.full and\
-                SUBORD_COORD.get(relation, "subord") == "coord":
-                self._accessible = self._accessible[:index]
-            elif rfc == RfcConstraint.simple:
-                self._accessible = self._accessible[:index + 1]
-            elif rfc == RfcConstraint.none:
-                pass
-            else:
-                raise Exception("Unknown RFC: {}".format(rfc))
-            self._accessible.append(from_edu)
+        # update the right frontier -- coord relations replace their
+        # attachment points, subord are appended, and evrything below
+        # disappear from the RF
+        # unknown relations are subord
+        if rfc == RfcConstraint.full and\
+            SUBORD_COORD.get(relation, "subord") == "coord":
+            below = node.below
+        elif rfc in (RfcConstraint.full, RfcConstraint.simple):
+            below = node
+        elif rfc == RfcConstraint.none:
+            below = self._frontier
+        else:
+            raise Exception("Unknown RFC: {}".format(rfc))
+        return self._successor(RightFrontier(from_edu, below),
+                               (node.edu, from_edu, relation))
+
+    def link(self, to_edu, from_edu, relation,
+             rfc=RfcConstraint.full):
+        """
+        Return the data we get by attaching `from_edu` (the next edu to
+        be linked) to `to_edu`, an edu of the right frontier
+
+        See `link_at`
+
+        :rtype: DiscData
+        """
+        node = self._frontier
+        while node.edu != to_edu:
+            node = node.below
+        return self.link_at(node, from_edu, relation, rfc=rfc)
 
     def __str__(self):
         template = ("{link}/ "
                     "accessibility={accessibility}/ "
                     "to attach={to_attach}")
         return template.format(link=self._link,
-                               accessibility=self._accessible,
-                               to_attach=[str(x) for x in self._tolink])
+                               accessibility=self.accessible(),
+                               to_attach=[str(x) for x in self.tobedone()])
 
     def __repr__(self):
         return str(self)
@@ -239,12 +330,22 @@ class DiscourseState(State):
         or `("no", None)` if we don't have a prediction for the pair
 
         :rtype: (string, float or None)"""
-        return self._shared["probs"].get(edu_pair, ("no", None))
+        smat = self._shared["smat"]
+        if not smat.mask[edu_pair]:
+            return ("no", None)
+        label = self._shared["labels"][smat.label[edu_pair]]
+        return (label, smat.attach[edu_pair])
 
     def shared(self):
         "information shared between states"
         return self._shared
 
+    def signature(self):
+        """states that have linked as many edus with the same right
+        frontier and RFC are equivalent, whatever the links they made
+        """
+        return (self.data().signature(), self.strategy())
+
     def strategy(self):
         """ full or not, if the RFC is applied to labelled edu pairs
         """
@@ -270,16 +371,16 @@ class DiscourseState(State):
         TODO: adapt to disc parse, according to choice made for data -> especially update to RFC
         """
         res = []
-        one = self.data().tobedone()[0]
+        data = self.data()
+        one = data.next_edu()
         transform = self._mk_score_transform()
         #print ">> taking care of node ", one
-        for attachmt in self.data().accessible():
-            new = copy.deepcopy(self.data())
-            new.tobedone().pop(0)
-            relation, prob = self.proba((attachmt, one))
+        if data.frontier() is None:
+            return res
+        for node in data.frontier().nodes():
+            relation, prob = self.proba((node.edu, one))
             if prob is not None:
-                new.link(attachmt, one, relation, rfc=self.strategy())
-                new.parent = self.data()
+                new = data.link_at(node, one, relation, rfc=self.strategy())
                 score = transform(prob)
                 res.append((new, score))
         return res
@@ -331,10 +432,13 @@ class TwoStageNROData(DiscData):
     accessible is list of starting edus (only one for now)
     """
 
+    # pylint: disable=super-init-not-called
     def __init__(self, parent=None, accessible=None, tolink=None):
-        super(TwoStageNROData, self).__init__(parent=parent,
-                                              accessible=accessible,
-                                              tolink=tolink)
+        # WIP: unlike DiscData, this is mutable (copied and updated in
+        # place by TwoStageNRO)
+        self.parent = parent
+        self._link = None
+        self._tolink = tolink or []
         self._accessible_global = accessible or []
         self._accessible_sentence = accessible or []
         self._intra = True
@@ -349,6 +453,21 @@ class TwoStageNROData(DiscData):
         else:
             return self._accessible_global
 
+    def final(self):
+        "return `True` if there are no more links to be made"
+        return self._tolink == []
+
+    def tobedone(self):
+        """return the (mutable) list of edus to be linked
+        """
+        return self._tolink
+
+    def signature(self):
+        "WIP: see DiscData.signature"
+        return (len(self._tolink), self._intra,
+                tuple(self._accessible_global),
+                tuple(self._accessible_sentence))
+
     def update_mode(self):
         "switch between intra/inter-sentential parsing mode"
         self._intra = not self._intra
@@ -486,24 +605,20 @@ class AstarArgs(namedtuple('AstarArgs',
 
 
 
-def preprocess_heuristics(cands):
+def preprocess_heuristics(smat):
     """precompute a set of useful information used by heuristics, such as
              - best probability
              - table of best probability when attaching a node, indexed on that node
 
-    format of cands is format given in main decoder: a list of
-    (arg1,arg2,proba,best_relation)
+    smat is the ScoreMatrix given in main decoder ; per node tables are
+    arrays indexed on EDU positions (0 for nodes that cannot be attached)
     """
     result = {}
-    result["best_overall"] = max([x[2] for x in cands])
-    result["best_attach"] = defaultdict(float)
-    result["average"] = defaultdict(list)
-    for du1, du2, score, label in cands:
-        result["best_attach"][du2.id] = max(result["best_attach"][du2.id], score)
-        result["average"][du2.id].append(score)
-
-    for one in result["average"]:
-        result["average"][one] = sum(result["average"][one])/len(result["average"][one])
+    scores = numpy.where(smat.mask, smat.attach, 0.)
+    nb_incoming = smat.mask.sum(axis=0)
+    result["best_overall"] = smat.attach[smat.mask].max()
+    result["best_attach"] = scores.max(axis=0)
+    result["average"] = scores.sum(axis=0) / numpy.maximum(nb_incoming, 1)
     #print(result, file= sys.stderr)
     return result
 
@@ -521,16 +636,17 @@ class AstarDecoder(Decoder):
         self._heuristic = astar_args.heuristics
         self._args = astar_args
 
-    def decode(self, dpack):
-        cands = simple_candidates(dpack)
-        probs = get_prob_map(cands)
-        edus = [x.id for x in get_sorted_edus(cands)]
+    def decode(self, dpack, nonfixed_pairs=None):
+        smat = ScoreMatrix.from_dpack(dpack)
+        # EDUs are designated by their position in the score matrix
+        edus = list(range(len(smat)))
         print("\t %s nodes to attach"%(len(edus)-1), file=sys.stderr)
 
         heuristic = HEURISTICS[self._heuristic]
-        search_shared = {"probs": probs,
+        search_shared = {"smat": smat,
+                         "labels": dpack.labels,
                          "use_prob": self._args.use_prob,
-                         "heuristics": preprocess_heuristics(cands),
+                         "heuristics": preprocess_heuristics(smat),
                          "RFC": self._args.rfc}
         if self._args.beam:
             astar = DiscourseBeamSearch(heuristic=heuristic,
@@ -539,8 +655,9 @@ class AstarDecoder(Decoder):
         else:
             astar = DiscourseSearch(heuristic=heuristic,
                                     shared=search_shared)
-            genall = astar.launch(DiscData(accessible=[edus[0]], tolink=edus[1:]),
-                                  norepeat=True, verbose=False)
-        endstate = genall.next()
+        # merge equivalent states (see DiscourseState.signature)
+        genall = astar.launch(DiscData(accessible=[edus[0]], tolink=edus[1:]),
+                              norepeat=False, verbose=False)
+        endstate = next(genall)
         sol = astar.recover_solution(endstate)
-        return convert_prediction(dpack, sol)
+        return convert_edges(dpack, smat, [(src, tgt) for src, tgt, _ in sol])
@@ -2,12 +2,12 @@
 Baseline decoders
 """
 
+import numpy as np
+
 from .interface import Decoder
-from .util import (convert_prediction,
-                   get_sorted_edus,
-                   get_prob_map,
+from .util import (convert_rows,
                    DecoderException,
-                   simple_candidates)
+                   pairing_positions)
 
 # pylint: disable=too-few-public-methods
 
@@ -19,10 +19,12 @@ class LocalBaseline(Decoder):
 
     def decode(self, dpack, nonfixed_pairs=None):
         # TODO integrate nonfixed_pairs, maybe?
-        cands = simple_candidates(dpack)
-        results = [(e1.id, e2.id, lab) for e1, e2, w, lab in cands
-                   if w > self._threshold]
-        return convert_prediction(dpack, results)
+        if dpack.graph is None:
+            raise ValueError("Tried to extract weights from an "
+                             "unweighted datapack")
+        rows = np.flatnonzero(np.asarray(dpack.graph.attach) >
+                              self._threshold)
+        return convert_rows(dpack, rows)
 
 
 class LastBaseline(Decoder):
@@ -30,29 +32,19 @@ class LastBaseline(Decoder):
 
     def decode(self, dpack, nonfixed_pairs=None):
         # TODO integrate nonfixed_pairs, maybe?
-        cands = simple_candidates(dpack)
-        labels_probs = get_prob_map(cands)
-
-        def get_prediction(edu1, edu2):
-            """Return triple of EDU ids and label from the probability
-            distribution (or None if no attachment)"""
-            span1 = edu1.span()
-            span2 = edu2.span()
-            id_pair = (edu1.id, edu2.id)
-            if id_pair in labels_probs:
-                label, _ = labels_probs[id_pair]
-                return (edu1.id, edu2.id, label)
-            elif span1 == span2:
-                return None
-            else:
+        edus, src, tgt = pairing_positions(dpack)
+        nb_edus = len(edus)
+        # the row of the pairing from each position to the next one
+        # (-1 if there is none)
+        next_row = np.empty(max(nb_edus - 1, 0), dtype=np.intp)
+        next_row[:] = -1
+        consecutive = np.flatnonzero(tgt == src + 1)
+        next_row[src[consecutive]] = consecutive
+        # consecutive EDUs with the same span need not be paired
+        for pos1 in np.flatnonzero(next_row < 0):
+            edu1 = edus[pos1]
+            edu2 = edus[pos1 + 1]
+            if edu1.span() != edu2.span():
                 raise DecoderException("Could not find row with EDU pairs "
                                        "%s and %s: " % (edu1.id, edu2.id))
-
-        edus = get_sorted_edus(cands)
-        ordered_pairs = zip(edus[:-1], edus[1:])
-        results = []
-        for edu1, edu2 in ordered_pairs:
-            prediction = get_prediction(edu1, edu2)
-            if prediction:
-                results.append(prediction)
-        return convert_prediction(dpack, results)
+        return convert_rows(dpack, next_row[next_row >= 0])
@@ -1,13 +1,404 @@
 """Eisner decoder
 """
 
+import heapq
+
 import numpy as np
 
 from .interface import Decoder
-# temporary? imports
-from ..table import _edu_positions
-from .util import (cap_score, convert_prediction, simple_candidates,
-                   MIN_SCORE)
+from .util import (convert_edges, ScoreMatrix, MIN_SCORE)
+
+
+# chart layout: [start][end][dir][complete]
+# dir: 0 for a head on the left (right arc), 1 for a head on the right
+# (left arc) ; complete: 0 for open (incomplete), 1 for closed (complete)
+_RIGHT, _LEFT = 0, 1
+_OPEN, _CLOSED = 0, 1
+
+
+def _first_max(cands):
+    """Return the value and index of the first maximum in each row of
+    a 2D array of candidates, ignoring NaNs.
+
+    Rows that contain only NaNs yield NaN and index 0.
+    This mimics the `np.nanmax` / `list.index` idiom of the reference
+    implementation (`eisner_chart_naive` in the decoding tests).
+
+    Parameters
+    ----------
+    cands : 2D array of float
+        Candidate scores, one row per span, one column per split point.
+
+    Returns
+    -------
+    max_cands : 1D array of float
+        Best score for each row.
+
+    argmax_cands : 1D array of int
+        Offset of the (first) best split point in each row.
+    """
+    argmax_cands = np.argmax(cands, axis=1)
+    rows = np.arange(cands.shape[0])
+    max_cands = cands[rows, argmax_cands]
+    # np.argmax favours NaNs, fall back to a careful scan for the
+    # (rare) rows where this happened
+    for i in np.flatnonzero(np.isnan(max_cands)):
+        valid = np.flatnonzero(~np.isnan(cands[i]))
+        if valid.size:
+            argmax_cands[i] = valid[np.argmax(cands[i][valid])]
+            max_cands[i] = cands[i][argmax_cands[i]]
+        else:
+            argmax_cands[i] = 0
+    return max_cands, argmax_cands
+
+
+def eisner_chart(score, unique_real_root=True):
+    """Fill the Eisner chart for a dense matrix of attachment scores.
+
+    All spans of a given width are processed at once, and the split
+    points of each span are explored with array operations.
+
+    Parameters
+    ----------
+    score : 2D array of float
+        `score[src, tgt]` is the score of the edge from the EDU at
+        position `src` to the EDU at position `tgt` ; position 0 is
+        the (fake) root. Missing edges should be set to `MIN_SCORE`.
+
+    unique_real_root : boolean, optional
+        If True, the fake root has a unique child.
+
+    Returns
+    -------
+    cscores : 4D array of float
+        Chart of scores, indexed by [start][end][dir][complete].
+
+    csplits : 4D array of int
+        Chart of backpointers (split points), same layout.
+    """
+    nb_edus = score.shape[0]
+    # the fake root can never be a dependent
+    score = np.array(score, dtype=np.float64)
+    score[:, 0] = MIN_SCORE
+
+    cscores = np.zeros((nb_edus, nb_edus, 2, 2), dtype=np.float64)
+    csplits = np.zeros((nb_edus, nb_edus, 2, 2), dtype=np.int32)
+
+    # iterate over span widths: all spans of a given width depend only
+    # on narrower spans (open cells) or on the open cells of the same
+    # span (closed cells)
+    for span in range(1, nb_edus):
+        starts = np.arange(nb_edus - span)
+        ends = starts + span
+        # split points: starts[i] + offsets[j]
+        offsets = np.arange(span)
+        splits = starts[:, np.newaxis] + offsets[np.newaxis, :]
+        s_col = starts[:, np.newaxis]
+        e_col = ends[:, np.newaxis]
+
+        # open cells share the sum of closed subspans
+        # range_k = [start, end)
+        closed_sum = (cscores[s_col, splits, _RIGHT, _CLOSED] +
+                      cscores[splits + 1, e_col, _LEFT, _CLOSED])
+
+        # left open
+        cands = closed_sum + score[ends, starts][:, np.newaxis]
+        max_cands, argmax_cands = _first_max(cands)
+        cscores[starts, ends, _LEFT, _OPEN] = max_cands
+        csplits[starts, ends, _LEFT, _OPEN] = starts + argmax_cands
+
+        # right open
+        cands = closed_sum + score[starts, ends][:, np.newaxis]
+        if unique_real_root:
+            # if start == 0, restricting range_k to [0]
+            # enforces that the tree has a unique real root
+            cands[0, 1:] = np.nan
+        max_cands, argmax_cands = _first_max(cands)
+        cscores[starts, ends, _RIGHT, _OPEN] = max_cands
+        csplits[starts, ends, _RIGHT, _OPEN] = starts + argmax_cands
+
+        # left closed
+        # range_k = [start, end)
+        cands = (cscores[s_col, splits, _LEFT, _CLOSED] +
+                 cscores[splits, e_col, _LEFT, _OPEN])
+        max_cands, argmax_cands = _first_max(cands)
+        cscores[starts, ends, _LEFT, _CLOSED] = max_cands
+        csplits[starts, ends, _LEFT, _CLOSED] = starts + argmax_cands
+
+        # right closed
+        # range_k = [start + 1, end]
+        cands = (cscores[s_col, splits + 1, _RIGHT, _OPEN] +
+                 cscores[splits + 1, e_col, _RIGHT, _CLOSED])
+        max_cands, argmax_cands = _first_max(cands)
+        cscores[starts, ends, _RIGHT, _CLOSED] = max_cands
+        csplits[starts, ends, _RIGHT, _CLOSED] = starts + 1 + argmax_cands
+
+    return cscores, csplits
+
+
+def eisner_edges(csplits):
+    """Recover the best tree from the backpointers of an Eisner chart.
+
+    Parameters
+    ----------
+    csplits : 4D array of int
+        Chart of backpointers, as returned by `eisner_chart`.
+
+    Returns
+    -------
+    edges : list of (int, int)
+        Edges of the best tree, as (src, tgt) pairs of EDU positions.
+    """
+    nb_edus = csplits.shape[0]
+    # solution: C[0][n][->][1]
+    # use the backpointers in csplits to get the best tree
+    edges = []
+    backpointers = [(0, nb_edus - 1, 0, 1)]
+    while backpointers:
+        start, end, dir_la, complete = backpointers.pop()
+        if start == end:
+            continue
+        k = csplits[start][end][dir_la][complete]
+        if complete:
+            # queue backpointers
+            if dir_la:
+                backpointers.extend([(start, k, dir_la, 1),
+                                     (k, end, dir_la, 0)])
+            else:
+                backpointers.extend([(start, k, dir_la, 0),
+                                     (k, end, dir_la, 1)])
+        else:
+            # add the underlying edge to the set of predictions
+            if dir_la:
+                edges.append((end, start))
+            else:
+                edges.append((start, end))
+            # queue backpointers
+            backpointers.extend([(start, k, 0, 1),
+                                 (k + 1, end, 1, 1)])
+    return edges
+
+
+def _eisner_hyperedges(item, unique_real_root):
+    """Return the ways of building a chart item from smaller ones, as
+    an array of split points and the two items they combine.
+
+    Parameters
+    ----------
+    item : (int, int, int, int)
+        Chart item: (start, end, dir, complete).
+
+    unique_real_root : boolean
+        If True, the fake root has a unique child.
+
+    Returns
+    -------
+    splits : 1D array of int
+        Split points.
+
+    children : function
+        Items combined at a given split point (or array of them).
+    """
+    start, end, dir_la, complete = item
+    if not complete:
+        if dir_la == _RIGHT and unique_real_root and start == 0:
+            # see eisner_chart
+            splits = np.array([0])
+        else:
+            splits = np.arange(start, end)
+        children = lambda k: ((start, k, _RIGHT, _CLOSED),
+                              (k + 1, end, _LEFT, _CLOSED))
+    elif dir_la == _LEFT:
+        splits = np.arange(start, end)
+        children = lambda k: ((start, k, _LEFT, _CLOSED),
+                              (k, end, _LEFT, _OPEN))
+    else:
+        splits = np.arange(start + 1, end + 1)
+        children = lambda k: ((start, k, _RIGHT, _OPEN),
+                              (k, end, _RIGHT, _CLOSED))
+    return splits, children
+
+
+class _KBestChart(object):
+    """Lazy enumeration of the best derivations of each item of an
+    Eisner chart, after Algorithm 3 of Huang and Chiang (2005),
+    "Better k-best parsing".
+
+    The 1-best chart gives the best derivation of every item. The next
+    ones are only computed on demand: the candidates of an item are the
+    best derivations of its top `k` hyperedges (split points), and
+    each time a derivation is used, its neighbours (same split point,
+    next best derivation of one of the two children) become candidates
+    ("cube pruning").
+
+    Parameters
+    ----------
+    score : 2D array of float
+        Attachment scores, as passed to `eisner_chart`.
+
+    cscores : 4D array of float
+        Chart of (1-best) scores, as returned by `eisner_chart`.
+
+    k : int
+        Number of derivations we will need at most, for any item.
+
+    unique_real_root : boolean
+        If True, the fake root has a unique child.
+    """
+    def __init__(self, score, cscores, k, unique_real_root):
+        self._score = np.array(score, dtype=np.float64)
+        self._score[:, 0] = MIN_SCORE
+        self._cscores = cscores
+        self._k = k
+        self._unique_real_root = unique_real_root
+        # item -> [(score, split, rank of child 1, rank of child 2)]
+        self._derivs = {}
+        # item -> heap of (-score, split, rank 1, rank 2) ; set of the
+        # (split, rank 1, rank 2) that made it to the heap
+        self._cands = {}
+        self._seen = {}
+
+    def _arc(self, item):
+        "score of the arc added when building `item` (if open)"
+        start, end, dir_la, complete = item
+        if complete:
+            return 0.
+        elif dir_la == _RIGHT:
+            return self._score[start, end]
+        else:
+            return self._score[end, start]
+
+    def _first_derivs(self, item):
+        "fill the candidates of an item with its best hyperedges"
+        start, end, dir_la, complete = item
+        splits, children = _eisner_hyperedges(item, self._unique_real_root)
+        (s_1, e_1, d_1, c_1), (s_2, e_2, d_2, c_2) = children(splits)
+        cands = (self._cscores[s_1, e_1, d_1, c_1] +
+                 self._cscores[s_2, e_2, d_2, c_2])
+        if not complete:
+            cands = cands + self._arc(item)
+        if len(splits) > self._k:
+            best = np.argpartition(-cands, self._k - 1)[:self._k]
+            splits = splits[best]
+            cands = cands[best]
+        heap = [(-cand, split, 0, 0)
+                for cand, split in zip(cands.tolist(), splits.tolist())]
+        heapq.heapify(heap)
+        self._cands[item] = heap
+        self._seen[item] = set((split, 0, 0) for _, split, _, _ in heap)
+        self._derivs[item] = []
+
+    def _expand(self, item, rank):
+        """make sure `item` has a `rank`-th best derivation, if there is
+        one ; this is a generator that yields the (item, rank) it needs
+        first (see `derivation`)
+        """
+        start, end, _, _ = item
+        if start == end:
+            self._derivs[item] = [(0., None, 0, 0)]
+            return
+        if item not in self._derivs:
+            self._first_derivs(item)
+        derivs = self._derivs[item]
+        heap = self._cands[item]
+        seen = self._seen[item]
+        _, children = _eisner_hyperedges(item, self._unique_real_root)
+        while len(derivs) <= rank:
+            if derivs:
+                # neighbours of the last derivation
+                _, split, rank_1, rank_2 = derivs[-1]
+                child_1, child_2 = children(split)
+                for nxt in [(split, rank_1 + 1, rank_2),
+                            (split, rank_1, rank_2 + 1)]:
+                    if nxt in seen:
+                        continue
+                    _, nxt_1, nxt_2 = nxt
+                    yield (child_1, nxt_1)
+                    yield (child_2, nxt_2)
+                    derivs_1 = self._derivs[child_1]
+                    derivs_2 = self._derivs[child_2]
+                    if nxt_1 < len(derivs_1) and nxt_2 < len(derivs_2):
+                        seen.add(nxt)
+                        cand = (derivs_1[nxt_1][0] + derivs_2[nxt_2][0] +
+                                self._arc(item))
+                        heapq.heappush(heap, (-cand, split, nxt_1, nxt_2))
+            if not heap:
+                break
+            neg_cand, split, rank_1, rank_2 = heapq.heappop(heap)
+            derivs.append((-neg_cand, split, rank_1, rank_2))
+
+    def derivation(self, item, rank):
+        """Return the `rank`-th best derivation of an item, as a
+        (score, split, rank 1, rank 2) tuple, or None if there is
+        no such derivation.
+        """
+        # explicit stack of generators instead of recursive calls:
+        # derivations can be much deeper than the recursion limit
+        stack = [self._expand(item, rank)]
+        while stack:
+            try:
+                stack.append(self._expand(*next(stack[-1])))
+            except StopIteration:
+                stack.pop()
+        derivs = self._derivs[item]
+        return derivs[rank] if rank < len(derivs) else None
+
+    def edges(self, item, rank):
+        """Return the edges of the `rank`-th best derivation of an
+        item, as (src, tgt) pairs of EDU positions.
+        """
+        edges = []
+        todo = [(item, rank)]
+        while todo:
+            item, rank = todo.pop()
+            start, end, dir_la, complete = item
+            if start == end:
+                continue
+            _, split, rank_1, rank_2 = self.derivation(item, rank)
+            if not complete:
+                edges.append((end, start) if dir_la else (start, end))
+            _, children = _eisner_hyperedges(item, self._unique_real_root)
+            child_1, child_2 = children(split)
+            todo.extend([(child_1, rank_1), (child_2, rank_2)])
+        return edges
+
+
+def eisner_kbest(score, k, unique_real_root=True):
+    """Return the `k` best trees for a dense matrix of attachment
+    scores, by decreasing score.
+
+    Trees that need edges scored `MIN_SCORE` (ie. missing edges) are
+    left out, unless there is no other tree.
+
+    Parameters
+    ----------
+    score : 2D array of float
+        Attachment scores, see `eisner_chart`.
+
+    k : int
+        Maximum number of trees to return.
+
+    unique_real_root : boolean, optional
+        If True, the fake root has a unique child.
+
+    Returns
+    -------
+    trees : list of (float, list of (int, int))
+        Score and edges (as in `eisner_edges`) of each tree, best first.
+    """
+    nb_edus = score.shape[0]
+    if nb_edus == 0 or k < 1:
+        return []
+    cscores, _ = eisner_chart(score, unique_real_root=unique_real_root)
+    chart = _KBestChart(score, cscores, k, unique_real_root)
+    root = (0, nb_edus - 1, _RIGHT, _CLOSED)
+    trees = []
+    for rank in range(k):
+        deriv = chart.derivation(root, rank)
+        if deriv is None or (rank > 0 and deriv[0] <= MIN_SCORE / 2):
+            break
+        trees.append((deriv[0], chart.edges(root, rank)))
+    return trees
 
 
 class EisnerDecoder(Decoder):
@@ -44,145 +435,36 @@ class EisnerDecoder(Decoder):
         dpack_pred: DataPack
             A copy of the argument DataPack with predictions set.
         """
-        # whether the output tree should contain a unique real root
-        unique_real_root = self._unique_real_root
-
-        # get number of EDUs and possible labels
-        nb_edus = len(dpack.edus)
-        # nb_lbls = dpack.graph.label.shape[0]
-
-        # map EDU ids to their index in the document
-        edu_id2idx = _edu_positions(dpack)
-        # we will need the reverse mapping to produce the result
-        edu_idx2id = {edu_idx: edu_id
-                      for edu_id, edu_idx in edu_id2idx.items()}
-        # build dict((src_idx, tgt_idx), (attach_score, lbl_scores))
-        simple_cands = simple_candidates(dpack)
+        smat = ScoreMatrix.from_dpack(dpack)
         # FIXME scores (probabilities or discriminative scores) should
-        # be adapted before this point ;
-        # should be (src, tgt): attach_score
-        score = {(edu_id2idx[src.id], edu_id2idx[tgt.id]):
-                 (cap_score(np.log(attach_score)) if self._use_prob
-                  else attach_score)
-                 for src, tgt, attach_score, best_lbl
-                 in simple_cands}
-        label = {(edu_id2idx[src.id], edu_id2idx[tgt.id]):
-                 dpack.label_number(best_lbl)
-                 for src, tgt, attach_score, best_lbl
-                 in simple_cands}
-        # end attelo-isms
-
-        # Eisner algorithm
-        # arrays of substructures for dynamic programming
-        # [start][end][dir][complete]
-        # scores
-        cscores = np.zeros((nb_edus, nb_edus, 2, 2), dtype=np.float64)
-        # backpointers: index of split point
-        csplits = np.zeros((nb_edus, nb_edus, 2, 2), dtype=np.int32)
-
-        # iterate over all possible spans of increasing size
-        for span in range(1, nb_edus):
-            for start in range(nb_edus - span):
-                end = start + span
-
-                # left open
-                range_k = range(start, end)
-                # find argmax and max on range_k
-                cands = [(cscores[start][k][0][1] +
-                          cscores[k + 1][end][1][1] +
-                          (score[(end, start)]
-                           if start > 0 and (end, start) in score
-                           else MIN_SCORE))
-                         for k in range_k]
-                max_cand = np.nanmax(cands)
-                argmax_cand = (range_k[cands.index(max_cand)]
-                               if not np.isnan(max_cand)
-                               else range_k[0])
-                # update tables
-                cscores[start][end][1][0] = max_cand
-                csplits[start][end][1][0] = argmax_cand
-
-                # right open
-                # if start == 0, restricting range_k to [0]
-                # enforces that the tree has a unique real root
-                range_k = ([0] if unique_real_root and start == 0
-                           else range(start, end))
-                # find argmax and max on range_k
-                cands = [(cscores[start][k][0][1] +
-                          cscores[k + 1][end][1][1] +
-                          (score[(start, end)]
-                           if (start, end) in score
-                           else MIN_SCORE))
-                         for k in range_k]
-                max_cand = np.nanmax(cands)
-                argmax_cand = (range_k[cands.index(max_cand)]
-                               if not np.isnan(max_cand)
-                               else range_k[0])
-                # update tables
-                cscores[start][end][0][0] = max_cand
-                csplits[start][end][0][0] = argmax_cand
-
-                # left closed
-                range_k = range(start, end)
-                # find argmax and max on range_k
-                cands = [(cscores[start][k][1][1] +
-                          cscores[k][end][1][0])
-                         for k in range_k]
-                max_cand = np.nanmax(cands)
-                argmax_cand = (range_k[cands.index(max_cand)]
-                               if not np.isnan(max_cand)
-                               else range_k[0])
-                # update tables
-                cscores[start][end][1][1] = max_cand
-                csplits[start][end][1][1] = argmax_cand
-
-                # right closed
-                range_k = range(start + 1, end + 1)
-                # find argmax and max on range_k
-                cands = [(cscores[start][k][0][0] +
-                          cscores[k][end][0][1])
-                         for k in range_k]
-                max_cand = np.nanmax(cands)
-                argmax_cand = (range_k[cands.index(max_cand)]
-                               if not np.isnan(max_cand)
-                               else range_k[0])
-                # update tables
-                cscores[start][end][0][1] = max_cand
-                csplits[start][end][0][1] = argmax_cand
-
-        # solution: C[0][n][->][1]
-        # use the backpointers in csplits to get the best tree
-        predictions = []
-        backpointers = [(0, nb_edus - 1, 0, 1)]
-        while backpointers:
-            start, end, dir_la, complete = backpointers.pop()
-            if start == end:
-                continue
-            k = csplits[start][end][dir_la][complete]
-            if complete:
-                # queue backpointers
-                if dir_la:
-                    backpointers.extend([(start, k, dir_la, 1),
-                                         (k, end, dir_la, 0)])
-                else:
-                    backpointers.extend([(start, k, dir_la, 0),
-                                         (k, end, dir_la, 1)])
-            else:
-                # add the underlying edge to the set of predictions
-                if dir_la:
-                    predictions.append((end, start, label[(end, start)]))
-                else:
-                    predictions.append((start, end, label[(start, end)]))
-                # queue backpointers
-                backpointers.extend([(start, k, 0, 1),
-                                     (k + 1, end, 1, 1)])
-
-        # resume attelo-isms
-        # transform predictions to the expected format
-        # back to EDU ids and relation labels as strings
-        att_preds = [(edu_idx2id[src], edu_idx2id[tgt], dpack.get_label(lbl))
-                     for src, tgt, lbl in predictions]
-        # and integrate predictions into the datapack
-        dpack_pred = convert_prediction(dpack, att_preds)
+        # be adapted before this point
+        score = smat.transformed(use_prob=self._use_prob)
+        _, csplits = eisner_chart(score,
+                                  unique_real_root=self._unique_real_root)
+        # integrate predictions into the datapack
+        dpack_pred = convert_edges(dpack, smat, eisner_edges(csplits))
 
         return dpack_pred
+
+    def decode_kbest(self, dpack, k, nonfixed_pairs=None):
+        """Return the `k` best projective trees.
+
+        Parameters
+        ----------
+        dpack: DataPack
+            Datapack that describes the (sub)document to be parsed.
+
+        k: int
+            Maximum number of trees.
+
+        Returns
+        -------
+        dpack_preds: list of DataPack
+            Copies of the argument DataPack with predictions set, one
+            for each tree, best first (see `eisner_kbest`).
+        """
+        smat = ScoreMatrix.from_dpack(dpack)
+        score = smat.transformed(use_prob=self._use_prob)
+        trees = eisner_kbest(score, k,
+                             unique_real_root=self._unique_real_root)
+        return [convert_edges(dpack, smat, edges) for _, edges in trees]
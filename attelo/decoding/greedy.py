@@ -9,13 +9,13 @@ July 2012
 '''
 
 from __future__ import print_function
-import sys
+import heapq
+
+import numpy as np
 
 from .interface import Decoder
-from .util import (convert_prediction,
-                   get_sorted_edus,
-                   get_prob_map,
-                   simple_candidates)
+from .util import (convert_edges,
+                   ScoreMatrix)
 
 # pylint: disable=too-few-public-methods
 
@@ -54,6 +54,45 @@ def is_embedded(one, two):
     return two.id != one.id and two.start <= one.start and one.end <= two.end
 
 
+def neighbour_matrix(edus):
+    """ Return a boolean matrix that tells which EDUs are neighbours:
+        strictly adjacent (see `are_strictly_adjacent`) or embedded one
+        in the other (see `is_embedded`).
+
+        Rather than scanning all EDUs for each pair, we count the span
+        boundaries that fall between the two EDUs of a pair with a
+        sorted index of all boundaries: they are strictly adjacent if
+        these are all theirs.
+
+        :type edus: [Edu]
+        :rtype: 2D array of bool
+    """
+    starts = np.array([edu.start for edu in edus])
+    ends = np.array([edu.end for edu in edus])
+    bounds = np.sort(np.concatenate([starts, ends]))
+    # nb_between[i, j]: number of boundaries (of any EDU) in the
+    # interval [end of i, start of j]
+    nb_between = np.maximum(0,
+                            np.searchsorted(bounds, starts,
+                                            side='right')[np.newaxis, :] -
+                            np.searchsorted(bounds, ends,
+                                            side='left')[:, np.newaxis])
+    # minus the boundaries of i and j themselves
+    lo_bound = ends[:, np.newaxis]
+    hi_bound = starts[np.newaxis, :]
+    for own in [starts[:, np.newaxis], ends[:, np.newaxis],
+                starts[np.newaxis, :], ends[np.newaxis, :]]:
+        nb_between -= (lo_bound <= own) & (own <= hi_bound)
+    # [one] [two] and [two] [one]
+    adjacent = (nb_between == 0) & (nb_between.T == 0)
+    # [two ... [one] ... ]
+    embedded = ((starts[np.newaxis, :] <= starts[:, np.newaxis]) &
+                (ends[:, np.newaxis] <= ends[np.newaxis, :]))
+    res = adjacent | embedded | embedded.T
+    res[np.diag_indices(len(edus))] = False
+    return res
+
+
 def get_neighbours(edus):
     '''
     Return a mapping from each EDU to its neighbours
@@ -61,36 +100,47 @@ def get_neighbours(edus):
     :type edus: [Edu]
     :rtype: Dict Edu [Edu]
     '''
-
-    neighbours = dict()
-    for one in edus:
-        one_neighbours = []
-        one_neighbours_ids = set()
-        for two in edus:
-            if one.id != two.id:
-                if are_strictly_adjacent(one, two, edus):
-                    if two.id not in one_neighbours_ids:
-                        one_neighbours_ids.add(two.id)
-                        one_neighbours.append(two)
-                if is_embedded(one, two) or is_embedded(two, one):
-                    if two.id not in one_neighbours_ids:
-                        one_neighbours_ids.add(two.id)
-                        one_neighbours.append(two)
-
-        neighbours[one] = one_neighbours
-
-    return neighbours
+    nmat = neighbour_matrix(edus)
+    return {one: [edus[j] for j in np.flatnonzero(nmat[i])]
+            for i, one in enumerate(edus)}
 
 
 class LocallyGreedyState(object):
     '''
     the mutable parts of the locally greedy algorithm
+
+    Candidate attachments (source, target) are kept in a priority
+    queue, best probability first. Ties go to the source that comes
+    first in the document, then to the target that joined the
+    neighbourhood of the source first.
+
+    EDUs are designated by their position in the score matrix.
     '''
-    def __init__(self, instances):
-        self._edus = get_sorted_edus(instances)
-        self._edu_ids = set(x.id for x in self._edus)
-        self._neighbours = get_neighbours(self._edus)
-        self._prob_dist = get_prob_map(instances)
+    def __init__(self, smat):
+        self._smat = smat
+        nmat = neighbour_matrix(smat.edus)
+        self._remaining = set(range(len(smat.edus)))
+        # neighbours of each EDU: {target: rank}, in order of arrival
+        self._neighbours = [{} for _ in smat.edus]
+        self._queue = []
+        for src in range(len(smat.edus)):
+            self._add_neighbours(src, np.flatnonzero(nmat[src]))
+
+    def _add_neighbours(self, src, targets):
+        '''
+        Extend the neighbourhood of an EDU, queue the new candidate
+        attachments
+        '''
+        neighbours = self._neighbours[src]
+        smat = self._smat
+        for tgt in targets:
+            if tgt in neighbours:
+                continue
+            rank = len(neighbours)
+            neighbours[tgt] = rank
+            prob = smat.attach[src, tgt]
+            if smat.mask[src, tgt] and prob > 0.0:
+                heapq.heappush(self._queue, (-prob, src, rank, tgt))
 
     def _remove_edu(self, original, target):
         '''
@@ -98,14 +148,11 @@ class LocallyGreedyState(object):
         (that the original in meant to point to): remove the original
         edu and merge its neighbourhood into that of the target
         '''
-        self._edus.remove(original)
-        self._edu_ids.remove(original.id)
+        self._remaining.remove(original)
         # PM : added to propagate locality to percolated span heads
-        tgt_neighbours = self._neighbours[target]
-        tgt_neighbours.extend(self._neighbours[original])
-        # print(neighbours[new_span], file=sys.stderr)
-        tgt_neighbours = [x for x in tgt_neighbours
-                          if x.id in self._edu_ids and x.id != target.id]
+        old_neighbours = self._neighbours[original]
+        self._add_neighbours(target,
+                             sorted(old_neighbours, key=old_neighbours.get))
 
     def _attach_best(self):
         '''
@@ -113,48 +160,28 @@ class LocallyGreedyState(object):
         highest probability link between any two neighbours.
         Remove the source EDU from future consideration.
 
-        :rtype: None
+        :rtype: (int, int) or None
         '''
-        highest = 0.0
-        to_remove = None
-        attachment = None
-        new_span = None
-
-        for source in self._edus:
-            for target in self._neighbours[source]:
-                if (source.id, target.id) in self._prob_dist:
-                    label, prob = self._prob_dist[(source.id, target.id)]
-                    if prob > highest:
-                        highest = prob
-                        to_remove = source
-                        new_span = target
-                        attachment = (source.id, target.id, label)
-
-        if to_remove is not None:
-            self._remove_edu(to_remove, new_span)
-            return attachment
-        else:  # stop if nothing to attach, but this is wrong
-            # print("warning: no attachment found", file=sys.stderr)
-            # print(edus)
-            # print(edus_id)
-            # print([neighbours[x] for x in edus])
-            # sys.exit(0)
-            self._edus = []
-            return None
+        while self._queue:
+            _, src, _, tgt = heapq.heappop(self._queue)
+            if src in self._remaining:
+                self._remove_edu(src, tgt)
+                return (src, tgt)
+        # stop if nothing to attach, but this is wrong
+        self._remaining = set()
+        return None
 
     def decode(self):
         '''
         Run the decoder
 
-        :rtype [(EDU, EDU, string)]
+        :rtype [(int, int)]
         '''
         attachments = []
-        while len(self._edus) > 1:
-            print(len(self._edus), end=' ', file=sys.stderr)
+        while len(self._remaining) > 1:
             attach = self._attach_best()
             if attach is not None:
                 attachments.append(attach)
-        print("", file=sys.stderr)
         return attachments
 
 
@@ -163,8 +190,8 @@ class LocallyGreedy(Decoder):
     '''
     The locally greedy decoder
     '''
-    def decode(self, dpack):
-        cands = simple_candidates(dpack)
-        prediction = LocallyGreedyState(cands).decode()
-        return convert_prediction(dpack, prediction)
+    def decode(self, dpack, nonfixed_pairs=None):
+        smat = ScoreMatrix.from_dpack(dpack)
+        prediction = LocallyGreedyState(smat).decode()
+        return convert_edges(dpack, smat, prediction)
 # pylint: enable=unused-argument
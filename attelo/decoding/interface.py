@@ -17,8 +17,8 @@ class Decoder(with_metaclass(ABCMeta, Parser)):
     and some control parameters, returns a sequence of predictions.
 
     Most decoders only really return one prediction in practice, but some,
-    like the A* decoder might have able to return a ranked sequence of
-    the "N best" predictions it can find
+    like the Eisner and MST decoders, are able to return a ranked sequence
+    of the "N best" predictions they can find (see `decode_kbest`)
 
     We have a few informal types to consider here:
 
@@ -43,11 +43,20 @@ class Decoder(with_metaclass(ABCMeta, Parser)):
     @abstractmethod
     def decode(self, dpack):
         '''
-        Return the N-best predictions in the form of a datapack per
-        prediction.
+        Return the best prediction, in the form of a datapack.
         '''
         raise NotImplementedError
 
+    def decode_kbest(self, dpack, k, nonfixed_pairs=None):
+        '''
+        Return the (at most) `k` best predictions in the form of a
+        datapack per prediction, best first.
+
+        Decoders that cannot do better only return their best
+        prediction.
+        '''
+        return [self.decode(dpack, nonfixed_pairs=nonfixed_pairs)]
+
     def fit(self, dpacks, targets, nonfixed_pairs=None, cache=None):
         return
 
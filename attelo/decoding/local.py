@@ -2,9 +2,74 @@
 Local decoders make decisions for each edge independently.
 """
 
+import numpy as np
+
 from .interface import Decoder
-from .util import (convert_prediction,
-                   simple_candidates)
+from .util import (convert_rows,
+                   pairing_positions)
+
+
+def top_rows(scores, nb_rows):
+    """Return the indices of the `nb_rows` highest scores, in increasing
+    order of index.
+
+    This is the same selection as taking the head of a stable sort
+    in decreasing order (ties go to the lowest index, NaNs come last),
+    but it only takes a partition of the scores.
+
+    Parameters
+    ----------
+    scores : 1D array of float
+
+    nb_rows : int
+
+    Returns
+    -------
+    rows : 1D array of int
+    """
+    if nb_rows >= len(scores):
+        return np.arange(len(scores))
+    elif nb_rows <= 0:
+        return np.arange(0)
+    # score of the last selected row
+    threshold = -np.partition(-scores, nb_rows - 1)[nb_rows - 1]
+    # fill up with ties (or NaNs if we are short of real scores)
+    if np.isnan(threshold):
+        filler = np.isnan(scores)
+        above = ~filler
+    else:
+        with np.errstate(invalid='ignore'):
+            above = scores > threshold
+        filler = scores == threshold
+    nb_missing = nb_rows - np.count_nonzero(above)
+    filler_rows = np.flatnonzero(filler)[:nb_missing]
+    above[filler_rows] = True
+    return np.flatnonzero(above)
+
+
+def best_incoming_rows(scores, tgt):
+    """Return the index of the best scored row for each distinct
+    target ; ties go to the lowest index.
+
+    Parameters
+    ----------
+    scores : 1D array of float
+
+    tgt : 1D array of int
+        target of each row
+
+    Returns
+    -------
+    rows : 1D array of int
+    """
+    if not len(scores):
+        return np.arange(0)
+    # group by target, best score first, then by index
+    order = np.lexsort((np.arange(len(scores)), -scores, tgt))
+    sorted_tgt = tgt[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = sorted_tgt[1:] != sorted_tgt[:-1]
+    return order[first]
 
 
 class AsManyDecoder(Decoder):
@@ -15,18 +80,13 @@ class AsManyDecoder(Decoder):
     It can be non-connex, contain cycles and re-entrancies.
     """
 
-    def decode(self, dpack):
+    def decode(self, dpack, nonfixed_pairs=None):
         """Return the set of top N edges
         """
-        cands = simple_candidates(dpack)
-        # number of real EDUs
-        nb_edus = len(dpack.edus)
-        # sort candidates by their scores (in reverse order)
-        sorted_cands = sorted(cands, key=lambda c: c[2], reverse=True)
         # take the top N candidates, where N is the number of real EDUs
-        predicted = [(src.id, tgt.id, lbl)
-                     for src, tgt, _, lbl in sorted_cands[:nb_edus]]
-        return convert_prediction(dpack, predicted)
+        rows = top_rows(np.asarray(dpack.graph.attach, dtype=np.float64),
+                        len(dpack.edus))
+        return convert_rows(dpack, rows)
 
 
 class BestIncomingDecoder(Decoder):
@@ -38,20 +98,11 @@ class BestIncomingDecoder(Decoder):
     It can be non-connex or contain cycles, but no re-entrancy.
     """
 
-    def decode(self, dpack):
+    def decode(self, dpack, nonfixed_pairs=None):
         """Return the best incoming edge for each EDU
         """
-        # best incoming edge for each EDU
-        inc_edges = {}
-        for cand in simple_candidates(dpack):
-            src, tgt, score, lbl = cand
-            if tgt.id in inc_edges:
-                cur_best = inc_edges[tgt.id][2]
-                if score > cur_best:
-                    inc_edges[tgt.id] = cand
-            else:
-                inc_edges[tgt.id] = cand
-
-        predicted = [(src.id, tgt.id, lbl)
-                     for src, tgt, score, lbl in inc_edges.values()]
-        return convert_prediction(dpack, predicted)
+        _, _, tgt = pairing_positions(dpack)
+        rows = best_incoming_rows(np.asarray(dpack.graph.attach,
+                                             dtype=np.float64),
+                                  tgt)
+        return convert_rows(dpack, rows)
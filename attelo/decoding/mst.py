@@ -5,63 +5,633 @@ Created on Jun 27, 2012
 '''
 
 from __future__ import print_function
-from collections import defaultdict
+import heapq
 
-from depparse.graph import Digraph
+import numpy as np
 # pylint: disable=no-name-in-module
 from scipy.special import logit
 # pylint: enable=no-name-in-module
 
-from ..edu import FAKE_ROOT_ID
 from ..util import ArgparserEnum
 from .interface import Decoder
 from .util import (DecoderException,
-                   cap_score,
-                   convert_prediction,
-                   simple_candidates)
+                   ScoreMatrix,
+                   cap_scores,
+                   convert_edges)
 
 # pylint: disable=too-few-public-methods
 
+# status of the nodes during the MST search
+_TODO, _ON_PATH, _DONE, _DEAD = 0, 1, 2, 3
 
-def _leftmost_edu(edus):
-    """ Returns the default root node for MST/MSDAG algorithm
 
-        Currently, the EDU in first position.
-
-        The Chu-Liu-Edmonds algorithm used for MST/MSDAG requires a
-        root node (with no incoming edges). We ensure there is one.
+def _reachable(mask, root):
+    """ Return a boolean array marking the nodes that can be reached
+        from the root following the edges in mask
     """
-    return sorted(edus, key=lambda e: e.span)[0]
-
-
-def _msdag(graph):
-    """ Returns a subgraph of graph (a Digraph) corresponding to its
-        Maximum Spanning Directed Acyclic Graph
+    seen = np.zeros(mask.shape[0], dtype=bool)
+    seen[root] = True
+    frontier = np.array([root])
+    while frontier.size:
+        succs = np.any(mask[frontier], axis=0) & ~seen
+        seen |= succs
+        frontier = np.flatnonzero(succs)
+    return seen
+
+
+def mst_edges(scores, root):
+    """ Returns the edges of the maximum spanning arborescence of a
+        dense graph, rooted at `root`
+
+        This is the Chu-Liu-Edmonds algorithm, in the efficient variant
+        of Tarjan (1977) for dense graphs: we grow a path of best
+        incoming edges from each node, contracting cycles as soon as
+        they appear, then expand the contracted nodes. Each step costs
+        O(n) array operations and there are O(n) steps, hence O(n^2)
+        overall.
+
+        Nodes that cannot be reached from the root are left out of
+        the arborescence.
+
+        Parameters
+        ----------
+        scores : 2D array of float
+            `scores[src, tgt]` is the score of the edge from `src` to
+            `tgt` ; missing edges are `-inf`
+        root : int
+            The root node (incoming edges are ignored)
+
+        Returns
+        -------
+        edges : [(int, int)]
+            Edges of the arborescence, as (src, tgt) pairs
+    """
+    nb_nodes = scores.shape[0]
+    if nb_nodes == 0:
+        return []
+    reach = _reachable(np.isfinite(scores), root)
+    # working copy of the scores, between the nodes currently
+    # represented by each slot (contracted cycles reuse the slot
+    # of one of their members)
+    wgt = np.where(reach[:, np.newaxis] & reach[np.newaxis, :],
+                   scores, -np.inf)
+    wgt[:, root] = -np.inf
+    wgt[np.diag_indices(nb_nodes)] = -np.inf
+    # original edge behind each cell
+    osrc = np.repeat(np.arange(nb_nodes)[:, np.newaxis], nb_nodes, axis=1)
+    otgt = np.repeat(np.arange(nb_nodes)[np.newaxis, :], nb_nodes, axis=0)
+
+    status = np.where(reach, _TODO, _DEAD)
+    status[root] = _DONE
+    # node held by each slot: original nodes are 0..n-1, contracted
+    # cycles get fresh numbers
+    slot_node = list(range(nb_nodes))
+    in_wgt = np.zeros(nb_nodes)  # weight of the chosen incoming cell
+    in_edge = {}  # node -> original edge chosen to enter it
+    parent_node = {}  # node -> contracted node it belongs to
+    members = {}  # contracted node -> its nodes
+
+    def contract(cycle):
+        "merge the slots in the cycle into a single one, return it"
+        cyc = np.array(cycle)
+        rep = cyc[0]
+        slots = np.arange(nb_nodes)
+        # incoming edges: best edge into the cycle, adjusted by the
+        # cycle edge it would replace
+        adj = wgt[:, cyc] - in_wgt[cyc]
+        best_idx = np.argmax(adj, axis=1)
+        best = cyc[best_idx]
+        new_in = adj[slots, best_idx]
+        new_in_src = osrc[slots, best]
+        new_in_tgt = otgt[slots, best]
+        # outgoing edges: best edge out of the cycle
+        best = cyc[np.argmax(wgt[cyc], axis=0)]
+        new_out = wgt[best, slots]
+        new_out_src = osrc[best, slots]
+        new_out_tgt = otgt[best, slots]
+        wgt[:, rep] = new_in
+        osrc[:, rep] = new_in_src
+        otgt[:, rep] = new_in_tgt
+        wgt[rep] = new_out
+        osrc[rep] = new_out_src
+        otgt[rep] = new_out_tgt
+        wgt[cyc[1:]] = -np.inf
+        wgt[:, cyc[1:]] = -np.inf
+        wgt[rep, rep] = -np.inf
+        status[cyc[1:]] = _DEAD
+        # bookkeeping for the expansion phase
+        new_node = nb_nodes + len(members)
+        members[new_node] = [slot_node[x] for x in cycle]
+        for node in members[new_node]:
+            parent_node[node] = new_node
+        slot_node[rep] = new_node
+        return rep
+
+    for start in range(nb_nodes):
+        if status[start] != _TODO:
+            continue
+        path = [start]
+        status[start] = _ON_PATH
+        tgt = start
+        while True:
+            src = np.argmax(wgt[:, tgt])
+            in_wgt[tgt] = wgt[src, tgt]
+            in_edge[slot_node[tgt]] = (osrc[src, tgt], otgt[src, tgt])
+            if status[src] == _DONE:
+                # the path hangs from the (partial) arborescence
+                status[path] = _DONE
+                break
+            elif status[src] == _ON_PATH:
+                # cycle: contract it and look for the best way in
+                idx = path.index(src)
+                tgt = contract(path[idx:])
+                del path[idx:]
+                path.append(tgt)
+            else:
+                path.append(src)
+                status[src] = _ON_PATH
+                tgt = src
+
+    # expansion: the edge entering a contracted node replaces the
+    # cycle edge of the member it points to
+    final = {slot_node[x]: in_edge[slot_node[x]]
+             for x in np.flatnonzero(status == _DONE) if x != root}
+    for new_node in sorted(members, reverse=True):
+        src, tgt = final[new_node]
+        entered = tgt
+        while parent_node[entered] != new_node:
+            entered = parent_node[entered]
+        for node in members[new_node]:
+            final[node] = (src, tgt) if node == entered else in_edge[node]
+    return [(int(final[x][0]), x) for x in range(nb_nodes) if x in final]
+
+
+class _Contractions(object):
+    """ A run of the Chu-Liu-Edmonds algorithm that remembers how it
+        got to its arborescence, so that it can tell what the next
+        best arborescence would be, and be resumed when some edges
+        are taken away (see `mst_kbest`)
+
+        Nodes are the original nodes, then the contracted cycles. Each
+        node picks the best edge entering it; the score of that edge
+        at the level of the node is that of the original edge, minus
+        those of the edges it would replace inside the node (the
+        `offset` of its target).
+
+        Use `solve` or `resumed` to get one; the result is not to be
+        modified afterwards, so it can be shared between subproblems.
+    """
+    def __init__(self, nb_nodes, root):
+        self.nb_nodes = nb_nodes
+        self.root = root
+        # for each node: picked edge, its score at the level of the
+        # node, and the contracted node it belongs to (-1 if none)
+        self.pick_src = [-1] * nb_nodes
+        self.pick_tgt = [-1] * nb_nodes
+        self.pick_wgt = [0.] * nb_nodes
+        self.parent = [-1] * nb_nodes
+        self.status = [_TODO] * nb_nodes
+        self.members = {}  # contracted node -> its nodes
+        self.orig = {}  # contracted node -> original nodes in it
+        self.free = []  # numbers of dissolved contracted nodes
+        # for each original node: sum of the scores of the picks
+        # of the nodes it belongs to, below its top level node
+        self.offset = np.zeros(nb_nodes)
+        self.top = np.arange(nb_nodes)
+        # parent of each node in the arborescence, and its DFS
+        # numbering (-1 for nodes that are not in it)
+        self.tree = None
+        self.tin = None
+        self.tout = None
+
+    @classmethod
+    def solve(cls, scores, root):
+        """ Find the maximum spanning arborescence of a dense graph,
+            where all the nodes with an incoming edge can be reached
+            from the root
+
+            :rtype: `_Contractions`
+        """
+        nb_nodes = scores.shape[0]
+        res = cls(nb_nodes, root)
+        dead = ~np.isfinite(scores).any(axis=0)
+        for node in np.flatnonzero(dead):
+            res.status[node] = _DEAD
+        res.status[root] = _DONE
+        for start in range(nb_nodes):
+            if res.status[start] == _TODO:
+                res._grow(scores, start, [start])
+        res._expand()
+        return res
+
+    def resumed(self, scores, tgt):
+        """ Return the contractions for the same scores, minus some
+            edges entering `tgt` (this if none of them were picked):
+            the nodes whose picks are still there are kept, and only
+            the lowest node that lost its pick, and the nodes it
+            belonged to, are reconsidered
+
+            :rtype: `_Contractions` or None (if no arborescence is
+                    left)
+        """
+        chain = [tgt]
+        while self.parent[chain[-1]] >= 0:
+            chain.append(self.parent[chain[-1]])
+        for idx, node in enumerate(chain):
+            if not scores[self.pick_src[node], self.pick_tgt[node]] > -np.inf:
+                break
+        else:
+            return self
+        res = self._copy()
+        start = chain[idx]
+        for node in reversed(chain[idx + 1:]):
+            res._dissolve(node)
+        # the nodes that used to hang from the top of the chain now
+        # hang from `start`
+        entry = self.pick_tgt[chain[-1]]
+        below = (self.tin >= self.tin[entry]) & (self.tin < self.tout[entry])
+        pending = [start] + [x for x in set(res.top[below].tolist())
+                             if x != start]
+        if not res._grow(scores, start, pending):
+            return None
+        res._expand()
+        return res
+
+    def _copy(self):
+        "a copy that can be modified"
+        res = _Contractions(self.nb_nodes, self.root)
+        for name in ['pick_src', 'pick_tgt', 'pick_wgt', 'parent',
+                     'status', 'free']:
+            setattr(res, name, list(getattr(self, name)))
+        res.members = dict(self.members)
+        res.orig = dict(self.orig)
+        res.offset = self.offset.copy()
+        res.top = self.top.copy()
+        return res
+
+    def _original(self, node):
+        "original nodes in a node"
+        return self.orig[node] if node >= self.nb_nodes else [node]
+
+    def _pick(self, scores, node):
+        """ Pick the best edge entering a (top level) node, return
+            the original source node (-1 if there is none)
+        """
+        if node < self.nb_nodes:
+            column = scores[:, node]
+            src = int(np.argmax(column))
+            tgt = node
+            wgt = column[src]
+        else:
+            cols = self.orig[node]
+            sub = scores[:, cols] - self.offset[cols]
+            sub[cols] = -np.inf
+            src, idx = divmod(int(np.argmax(sub)), len(cols))
+            tgt = int(cols[idx])
+            wgt = sub[src, idx]
+        if not wgt > -np.inf:
+            return -1
+        self.pick_src[node] = src
+        self.pick_tgt[node] = tgt
+        self.pick_wgt[node] = wgt
+        return src
+
+    def _grow(self, scores, head, pending):
+        """ Grow a path of best incoming edges from the `head` node
+            until it reaches a node that hangs from the root,
+            contracting cycles as they appear ; the `pending` nodes
+            (including the head) all lead to the head
+
+            Return False if some node cannot be reached
+        """
+        status = self.status
+        for node in pending:
+            status[node] = _ON_PATH
+        while True:
+            src = self._pick(scores, head)
+            if src < 0:
+                return False
+            node = int(self.top[src])
+            if status[node] == _DONE:
+                break
+            elif status[node] == _TODO:
+                status[node] = _ON_PATH
+                pending.append(node)
+                head = node
+            else:
+                # cycle: the way back from the source to the head
+                cycle = [head]
+                while node != head:
+                    cycle.append(node)
+                    node = int(self.top[self.pick_src[node]])
+                head = self._contract(cycle)
+                pending.append(head)
+        for node in pending:
+            if self.parent[node] < 0:
+                status[node] = _DONE
+        return True
+
+    def _contract(self, cycle):
+        "merge some top level nodes into a new one, return it"
+        if self.free:
+            node = self.free.pop()
+        else:
+            node = len(self.parent)
+            for name in ['pick_src', 'pick_tgt', 'parent', 'status']:
+                getattr(self, name).append(-1)
+            self.pick_wgt.append(0.)
+        self.parent[node] = -1
+        self.status[node] = _ON_PATH
+        origs = []
+        for member in cycle:
+            self.parent[member] = node
+            cols = self._original(member)
+            self.offset[cols] += self.pick_wgt[member]
+            origs.append(cols)
+        self.members[node] = cycle
+        self.orig[node] = cols = np.concatenate(origs)
+        self.top[cols] = node
+        return node
+
+    def _dissolve(self, node):
+        "undo the contraction of a top level node"
+        for member in self.members.pop(node):
+            self.parent[member] = -1
+            cols = self._original(member)
+            self.offset[cols] -= self.pick_wgt[member]
+            self.top[cols] = member
+        del self.orig[node]
+        self.free.append(node)
+
+    def _expand(self):
+        """ Compute the arborescence: the edge entering a contracted
+            node replaces the pick of the member it points to
+        """
+        nb_nodes = self.nb_nodes
+        tree = np.empty(nb_nodes, dtype=np.intp)
+        tree.fill(-1)
+        tops = set(self.top[[x for x in range(nb_nodes)
+                             if self.status[x] != _DEAD]].tolist())
+        tops.discard(self.root)
+        stack = [(x, self.pick_src[x], self.pick_tgt[x]) for x in tops]
+        while stack:
+            node, src, tgt = stack.pop()
+            if node < nb_nodes:
+                tree[node] = src
+                continue
+            entered = tgt
+            while self.parent[entered] != node:
+                entered = self.parent[entered]
+            stack.extend((x, src, tgt) if x == entered else
+                         (x, self.pick_src[x], self.pick_tgt[x])
+                         for x in self.members[node])
+        # DFS numbering, so that the descendants of a node are those
+        # numbered from `tin` to `tout` (excluded)
+        children = [[] for _ in range(nb_nodes)]
+        for tgt, src in enumerate(tree.tolist()):
+            if src >= 0:
+                children[src].append(tgt)
+        order = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(children[node])
+        size = [1] * nb_nodes
+        for node in reversed(order):
+            if tree[node] >= 0:
+                size[tree[node]] += size[node]
+        self.tin = np.empty(nb_nodes, dtype=np.intp)
+        self.tin.fill(-1)
+        self.tin[order] = np.arange(len(order))
+        self.tout = self.tin + size
+        self.tree = tree
+
+    def next_swap(self, scores):
+        """ Find the second best arborescence, as in Camerini et al.
+            (1980): it is the best arborescence we can get by having a
+            node, at its own level, pick another incoming edge instead
+            of one that is in the arborescence, without creating a
+            cycle (ie. not from its descendants).
+
+            Return how much score this loses, and the edge of the
+            arborescence that is replaced (None if there is no other
+            arborescence)
+
+            :rtype: (float, (int, int)) or None
+        """
+        nb_nodes = self.nb_nodes
+        tree, tin, tout = self.tree, self.tin, self.tout
+        nodes = np.arange(nb_nodes)
+        # original nodes, all at once
+        pick_src = np.array(self.pick_src[:nb_nodes])
+        cand = (tree >= 0) & (tree == pick_src)
+        below = (tin[:, np.newaxis] >= tin) & (tin[:, np.newaxis] < tout)
+        alt = np.where(below, -np.inf, scores)
+        alt[pick_src[cand], nodes[cand]] = -np.inf
+        loss = np.empty(nb_nodes)
+        loss.fill(np.inf)
+        loss[cand] = (scores[pick_src[cand], nodes[cand]] -
+                      alt.max(axis=0)[cand])
+        best = int(np.argmin(loss))
+        best_loss = loss[best]
+        best_edge = (int(pick_src[best]), best)
+        # contracted nodes
+        for node, cols in self.orig.items():
+            src, tgt = self.pick_src[node], self.pick_tgt[node]
+            if tree[tgt] != src:
+                continue
+            # offsets at the level of the node
+            above = 0.
+            parent = node
+            while self.parent[parent] >= 0:
+                above += self.pick_wgt[parent]
+                parent = self.parent[parent]
+            sub = scores[:, cols] - (self.offset[cols] - above)
+            sub[(tin >= tin[tgt]) & (tin < tout[tgt])] = -np.inf
+            sub[src, cols == tgt] = -np.inf
+            node_loss = self.pick_wgt[node] - sub.max()
+            if node_loss < best_loss:
+                best_loss = node_loss
+                best_edge = (src, tgt)
+        if not best_loss < np.inf:
+            return None
+        return best_loss, best_edge
+
+
+def _constrained(scores, included, excluded):
+    """ Return a copy of the scores where the constraints are
+        enforced: excluded edges are `-inf`, and so are the
+        alternatives to the included ones
+    """
+    res = np.copy(scores)
+    if excluded:
+        srcs, tgts = zip(*excluded)
+        res[list(srcs), list(tgts)] = -np.inf
+    if included:
+        srcs, tgts = zip(*included)
+        srcs, tgts = list(srcs), list(tgts)
+        res[:, tgts] = -np.inf
+        res[srcs, tgts] = scores[srcs, tgts]
+    return res
+
+
+def mst_kbest(scores, root, k):
+    """ Returns the `k` best arborescences of a dense graph, rooted at
+        `root`, by decreasing score
+
+        This is the algorithm of Camerini et al. (1980). The space of
+        arborescences is partitioned into subproblems (those that
+        include some edges and exclude others), each with its best
+        arborescence, already returned, and the score of its second
+        best one, which a single Chu-Liu-Edmonds run tells us (see
+        `_Contractions.next_swap`). The subproblem with the best
+        second best arborescence is split in two, on an edge that
+        its best arborescence has but not the second best: without
+        that edge, the second best arborescence is the best one;
+        with it, the best arborescence stays the same.
+
+        The run for each new subproblem starts from that of its
+        parent, only reconsidering the contractions that involved the
+        edges taken away, so each arborescence costs less than a run
+        of `mst_edges` (see benchmarks/bench_kbest.py), and the total
+        cost is linear in `k`.
+
+        Nodes that cannot be reached from the root are left out of
+        the arborescences.
+
+        Parameters
+        ----------
+        scores : 2D array of float
+            `scores[src, tgt]` is the score of the edge from `src` to
+            `tgt` ; missing edges are `-inf`
+        root : int
+            The root node (incoming edges are ignored)
+        k : int
+            Maximum number of arborescences to return
+
+        Returns
+        -------
+        trees : [(float, [(int, int)])]
+            Score and edges of each arborescence, best first
+    """
+    nb_nodes = scores.shape[0]
+    if nb_nodes == 0 or k < 1:
+        return []
+    reach = _reachable(np.isfinite(scores), root)
+    scores = np.where(reach[:, np.newaxis] & reach[np.newaxis, :],
+                      scores, -np.inf)
+    scores[:, root] = -np.inf
+    scores[np.diag_indices(nb_nodes)] = -np.inf
+    nodes = np.flatnonzero(reach)
+    nodes = nodes[nodes != root]
+
+    def tree_score(tree):
+        "total score of an arborescence"
+        return scores[tree[nodes], nodes].sum()
+
+    # queue of (-score, counter, included, excluded, tree, contractions,
+    # edge) for each subproblem: the score of its second best
+    # arborescence, the edges it includes and excludes, its best
+    # arborescence, a run on its scores, and the edge to split it on
+    queue = []
+    counter = [0]
+
+    def push(included, excluded, tree, contractions, sub_scores):
+        "queue a subproblem, whose best arborescence is returned"
+        if np.array_equal(tree, contractions.tree):
+            swap = contractions.next_swap(sub_scores)
+            if swap is None:
+                return
+            loss, edge = swap
+            score = tree_score(tree) - loss
+        else:
+            # ties: the run found another best arborescence
+            score = tree_score(contractions.tree)
+            tgt = int(np.flatnonzero(tree != contractions.tree)[0])
+            edge = (int(tree[tgt]), tgt)
+        counter[0] += 1
+        heapq.heappush(queue, (-score, counter[0], included, excluded,
+                               tree, contractions, edge))
+
+    def edges(tree):
+        "edges of an arborescence"
+        return [(int(tree[x]), int(x)) for x in nodes]
+
+    first = _Contractions.solve(scores, root)
+    res = [(tree_score(first.tree), edges(first.tree))]
+    push((), (), first.tree, first, scores)
+    while queue and len(res) < k:
+        _, _, included, excluded, tree, contractions, edge = \
+            heapq.heappop(queue)
+        sub_scores = _constrained(scores, included, excluded)
+        src, tgt = edge
+        # without the edge: the second best arborescence is the best
+        excl_scores = np.copy(sub_scores)
+        excl_scores[src, tgt] = -np.inf
+        excl = contractions.resumed(excl_scores, tgt)
+        if excl is not None:
+            res.append((tree_score(excl.tree), edges(excl.tree)))
+            push(included, excluded + (edge,), excl.tree, excl,
+                 excl_scores)
+        # with the edge: the best arborescence stays the same
+        incl_scores = sub_scores
+        incl_scores[:, tgt] = -np.inf
+        incl_scores[src, tgt] = scores[src, tgt]
+        incl = contractions.resumed(incl_scores, tgt)
+        if incl is not None:
+            push(included + (edge,), excluded, tree, incl, incl_scores)
+    return res
+
+
+def _msdag(scores, tree):
+    """ Returns the edges of the Maximum Spanning Directed Acyclic Graph
+        of a dense graph, starting from its maximum spanning tree
 
         Algorithm is semi-greedy-MSDAG as described in Schluter_:
         .. _Schluter (2014): http://aclweb.org/anthology/W14-2412
+
+        We maintain the reachability relation of the DAG as it grows,
+        so that each candidate edge is accepted or rejected with a
+        single lookup ; the relation only needs updating when an edge
+        connects two nodes that were not already connected.
+
+        Parameters
+        ----------
+        scores : 2D array of float
+            Edge scores, missing edges are `-inf`
+        tree : [(int, int)]
+            Edges of the maximum spanning tree
+
+        Returns
+        -------
+        edges : [(int, int)]
     """
-    tree = graph.mst()
-    # Sort edges in orginal graph by decreasing score
-    edges = sorted(graph.iteredges(), key=lambda p: -graph.get_score(*p))
+    nb_nodes = scores.shape[0]
+    dag = np.zeros((nb_nodes, nb_nodes), dtype=bool)
+    # reach[a, b] iff b can be reached from a
+    reach = np.eye(nb_nodes, dtype=bool)
 
-    for src, tgt in edges:
-        # Already in graph ?
-        if tgt in tree.successors[src]:
-            continue
-        # Add the edge, revert if cycle is created
-        tree.successors[src].append(tgt)
-        if tree.find_cycle():
-            tree.successors[src].remove(tgt)
+    def add_edge(src, tgt):
+        "add an edge to the DAG, update reachability"
+        dag[src, tgt] = True
+        if not reach[src, tgt]:
+            # whatever reaches src now reaches whatever tgt reaches
+            reach[reach[:, src]] |= reach[tgt]
 
-    # Update score and label functions
-    new_map = lambda f: dict(((s, t), f(s, t)) for s, t in tree.iteredges())
-    nscores = new_map(graph.get_score)
-    nlabels = new_map(graph.get_label)
+    for src, tgt in tree:
+        add_edge(src, tgt)
 
-    return Digraph(tree.successors,
-                   lambda s, t: nscores[s, t],
-                   lambda s, t: nlabels[s, t])
+    # Sort edges in orginal graph by decreasing score
+    srcs, tgts = np.nonzero(np.isfinite(scores))
+    order = np.argsort(-scores[srcs, tgts], kind='mergesort')
+    for src, tgt in zip(srcs[order], tgts[order]):
+        # Already in graph, or would create a cycle ?
+        if dag[src, tgt] or reach[tgt, src]:
+            continue
+        add_edge(src, tgt)
+
+    return list(zip(*np.nonzero(dag)))
 
 
 class MstRootStrategy(ArgparserEnum):
@@ -75,67 +645,71 @@ class MstRootStrategy(ArgparserEnum):
 class MstDecoder(Decoder):
     """ Attach in such a way that the resulting subgraph is a
         maximum spanning tree of the original
+
     """
     def __init__(self, root_strategy, use_prob=True):
         self._use_prob = use_prob
         self._root_strategy = root_strategy
 
-    def _graph(self, instances):
-        """ Builds a directed graph for instances
-
-            instances are quadruplets of the form:
-                edu_source, edu_target, probability_of_attachment, relation
+    def _root(self, smat):
+        """ Return the position of the root node in the score matrix
 
-            :rtype Digraph
+            The Chu-Liu-Edmonds algorithm used for MST/MSDAG requires a
+            root node (with no incoming edges). We ensure there is one.
         """
-
         if self._root_strategy == MstRootStrategy.leftmost:
-            root_id = _leftmost_edu(set(e for s, t, _, _ in instances
-                                        for e in (s, t))).id
+            # the EDU in first position
+            return 0
         elif self._root_strategy == MstRootStrategy.fake_root:
-            root_id = FAKE_ROOT_ID
+            # the fake root always comes first in a score matrix
+            # (without one, this falls back to the leftmost EDU)
+            return 0
         else:
             raise DecoderException('Unknown root finding strategy: ' +
                                    str(self._root_strategy))
 
-        targets = defaultdict(list)
-        labels = dict()
-        scores = dict()
-
-        for source, target, prob, rel in instances:
-            src, tgt = source.id, target.id
-
-            # Ignore all edges directed to the root
-            if tgt == root_id:
-                continue
-
-            if self._use_prob:
-                scores[src, tgt] = cap_score(logit(prob))
-            else:
-                scores[src, tgt] = prob
-            labels[src, tgt] = rel
-            targets[src].append(tgt)
+    def _scores(self, smat):
+        """ Dense matrix of edge scores for a score matrix, with `-inf`
+            for missing edges and edges directed to the root
 
-        return Digraph(targets,
-                       lambda s, t: scores[s, t],
-                       lambda s, t: labels[s, t])
+            :rtype 2D array of float
+        """
+        if self._use_prob:
+            scores = cap_scores(logit(smat.attach))
+        else:
+            scores = np.copy(smat.attach)
+        scores[~smat.mask] = -np.inf
+        # Ignore all edges directed to the root
+        if len(smat):
+            scores[:, self._root(smat)] = -np.inf
+        return scores
 
     def decode(self, dpack, nonfixed_pairs=None):
         # TODO integrate nonfixed_pairs, maybe?
-        graph = self._graph(simple_candidates(dpack))
-        subgraph = graph.mst()
-        predictions = [(src, tgt, subgraph.get_label(src, tgt))
-                       for src, tgt in subgraph.iteredges()]
-        return convert_prediction(dpack, predictions)
+        smat = ScoreMatrix.from_dpack(dpack)
+        scores = self._scores(smat)
+        edges = mst_edges(scores, self._root(smat))
+        return convert_edges(dpack, smat, edges)
+
+    def decode_kbest(self, dpack, k, nonfixed_pairs=None):
+        """ Return the `k` best spanning trees (see `mst_kbest`), as
+            a list of datapacks, best first
+        """
+        smat = ScoreMatrix.from_dpack(dpack)
+        scores = self._scores(smat)
+        return [convert_edges(dpack, smat, edges)
+                for _, edges in mst_kbest(scores, self._root(smat), k)]
 
 
 class MsdagDecoder(MstDecoder):
     """ Attach according to MSDAG (subgraph of original)"""
 
+    # the k best trees are not the k best DAGs: we only know the best
+    decode_kbest = Decoder.decode_kbest
+
     def decode(self, dpack, nonfixed_pairs=None):
         # TODO integrate nonfixed_pairs, maybe?
-        graph = self._graph(simple_candidates(dpack))
-        subgraph = _msdag(graph)
-        predictions = [(src, tgt, subgraph.get_label(src, tgt))
-                       for src, tgt in subgraph.iteredges()]
-        return convert_prediction(dpack, predictions)
+        smat = ScoreMatrix.from_dpack(dpack)
+        scores = self._scores(smat)
+        tree = mst_edges(scores, self._root(smat))
+        return convert_edges(dpack, smat, _msdag(scores, tree))
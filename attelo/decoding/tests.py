@@ -3,17 +3,19 @@ attelo.decoding tests
 """
 
 from __future__ import print_function
+import itertools
 import unittest
 
 import numpy as np
 from scipy.sparse import csr_matrix
 
 from ..table import (DataPack, Graph)
-from ..edu import EDU
-from . import astar, greedy, mst
+from ..edu import EDU, FAKE_ROOT
+from . import astar, greedy, local, mst
 from .astar import (AstarArgs, Heuristic, RfcConstraint)
-from .eisner import EisnerDecoder
-from .util import (prediction_to_triples, simple_candidates)
+from .eisner import (EisnerDecoder, eisner_chart, eisner_edges,
+                     eisner_kbest)
+from .util import (prediction_to_triples, ScoreMatrix, MIN_SCORE)
 
 # pylint: disable=too-few-public-methods
 
@@ -38,6 +40,108 @@ def mk_fake_edu(start, end=None, edu_file="x", sentence='s1'):
     return EDU(edu_id, edu_id, start, end, edu_file, sentence)
 
 
+def eisner_chart_naive(score, unique_real_root=True):
+    """Fill the Eisner chart one cell at a time.
+
+    This is the straightforward (and slow) version of `eisner_chart`,
+    kept as a reference to test it against (`benchmarks/bench_eisner.py`
+    has its own copy).
+
+    Parameters
+    ----------
+    score : 2D array of float
+        Attachment scores, see `eisner_chart`.
+
+    unique_real_root : boolean, optional
+        If True, the fake root has a unique child.
+
+    Returns
+    -------
+    cscores : 4D array of float
+        Chart of scores, indexed by [start][end][dir][complete].
+
+    csplits : 4D array of int
+        Chart of backpointers (split points), same layout.
+    """
+    nb_edus = score.shape[0]
+
+    # Eisner algorithm
+    # arrays of substructures for dynamic programming
+    # [start][end][dir][complete]
+    # scores
+    cscores = np.zeros((nb_edus, nb_edus, 2, 2), dtype=np.float64)
+    # backpointers: index of split point
+    csplits = np.zeros((nb_edus, nb_edus, 2, 2), dtype=np.int32)
+
+    # iterate over all possible spans of increasing size
+    for span in range(1, nb_edus):
+        for start in range(nb_edus - span):
+            end = start + span
+
+            # left open
+            range_k = range(start, end)
+            # find argmax and max on range_k
+            cands = [(cscores[start][k][0][1] +
+                      cscores[k + 1][end][1][1] +
+                      (score[end][start] if start > 0 else MIN_SCORE))
+                     for k in range_k]
+            max_cand = np.nanmax(cands)
+            argmax_cand = (range_k[cands.index(max_cand)]
+                           if not np.isnan(max_cand)
+                           else range_k[0])
+            # update tables
+            cscores[start][end][1][0] = max_cand
+            csplits[start][end][1][0] = argmax_cand
+
+            # right open
+            # if start == 0, restricting range_k to [0]
+            # enforces that the tree has a unique real root
+            range_k = ([0] if unique_real_root and start == 0
+                       else range(start, end))
+            # find argmax and max on range_k
+            cands = [(cscores[start][k][0][1] +
+                      cscores[k + 1][end][1][1] +
+                      score[start][end])
+                     for k in range_k]
+            max_cand = np.nanmax(cands)
+            argmax_cand = (range_k[cands.index(max_cand)]
+                           if not np.isnan(max_cand)
+                           else range_k[0])
+            # update tables
+            cscores[start][end][0][0] = max_cand
+            csplits[start][end][0][0] = argmax_cand
+
+            # left closed
+            range_k = range(start, end)
+            # find argmax and max on range_k
+            cands = [(cscores[start][k][1][1] +
+                      cscores[k][end][1][0])
+                     for k in range_k]
+            max_cand = np.nanmax(cands)
+            argmax_cand = (range_k[cands.index(max_cand)]
+                           if not np.isnan(max_cand)
+                           else range_k[0])
+            # update tables
+            cscores[start][end][1][1] = max_cand
+            csplits[start][end][1][1] = argmax_cand
+
+            # right closed
+            range_k = range(start + 1, end + 1)
+            # find argmax and max on range_k
+            cands = [(cscores[start][k][0][0] +
+                      cscores[k][end][0][1])
+                     for k in range_k]
+            max_cand = np.nanmax(cands)
+            argmax_cand = (range_k[cands.index(max_cand)]
+                           if not np.isnan(max_cand)
+                           else range_k[0])
+            # update tables
+            cscores[start][end][0][1] = max_cand
+            csplits[start][end][0][1] = argmax_cand
+
+    return cscores, csplits
+
+
 class DecoderTest(unittest.TestCase):
     """
     We could split this into AstarTest, etc
@@ -86,17 +190,17 @@ class AstarTest(DecoderTest):
         '''
         Run an A* search with the given heuristic
         '''
-        cands = simple_candidates(self.dpack)
-        prob = {(a1, a2): (l, p) for a1, a2, p, l in cands}
-        pre_heurist = astar.preprocess_heuristics(cands)
-        config = {"probs": prob,
+        smat = ScoreMatrix.from_dpack(self.dpack)
+        pre_heurist = astar.preprocess_heuristics(smat)
+        config = {"smat": smat,
+                  "labels": self.dpack.labels,
                   "heuristics": pre_heurist,
                   "use_prob": True,
                   "RFC": astar.RfcConstraint.full}
         search = astar.DiscourseSearch(heuristic=heuristic,
                                        shared=config)
-        genall = search.launch(astar.DiscData(accessible=[self.edus[1]],
-                                              tolink=self.edus[2:]),
+        genall = search.launch(astar.DiscData(accessible=[1],
+                                              tolink=[2, 3]),
                                norepeat=True,
                                verbose=True)
         endstate = genall.next()
@@ -107,13 +211,49 @@ class AstarTest(DecoderTest):
 
     def test_search(self):
         'n-best A* search'
-        astar_args = astar.AstarArgs(heuristics=DEFAULT_ASTAR_ARGS.heuristics,
-                                     # FIXME full broken
-                                     rfc=astar.RfcConstraint.simple,
-                                     beam=DEFAULT_ASTAR_ARGS.beam,
-                                     use_prob=DEFAULT_ASTAR_ARGS.use_prob)
-        decoder = astar.AstarDecoder(astar_args)
-        return decoder.decode(self.dpack)
+        for rfc in astar.RfcConstraint:
+            astar_args = astar.AstarArgs(heuristics=DEFAULT_ASTAR_ARGS.heuristics,
+                                         rfc=rfc,
+                                         beam=DEFAULT_ASTAR_ARGS.beam,
+                                         use_prob=DEFAULT_ASTAR_ARGS.use_prob)
+            decoder = astar.AstarDecoder(astar_args)
+            decoder.decode(self.dpack)
+
+    def test_disc_data(self):
+        'linking edus leaves the parent data untouched'
+        root = astar.DiscData(accessible=[0], tolink=[1, 2, 3])
+        full = astar.RfcConstraint.full
+        data1 = root.link(0, 1, 'elaboration', rfc=full)
+        data2 = data1.link(1, 2, 'elaboration', rfc=full)
+        self.assertEqual([0, 1, 2], data2.accessible())
+        # coordination replaces its attachment point
+        data3 = data2.link(1, 3, 'narration', rfc=full)
+        self.assertEqual([0, 3], data3.accessible())
+        self.assertTrue(data3.final())
+        # subordination drops what is above its attachment point
+        data3 = data2.link(0, 3, 'elaboration', rfc=full)
+        self.assertEqual([0, 3], data3.accessible())
+        data3 = data2.link(0, 3, 'elaboration',
+                           rfc=astar.RfcConstraint.none)
+        self.assertEqual([0, 1, 2, 3], data3.accessible())
+        # ancestors are unaffected
+        self.assertEqual([0], root.accessible())
+        self.assertEqual([1, 2, 3], root.tobedone())
+        self.assertEqual([0, 1, 2], data2.accessible())
+        self.assertEqual([3], data2.tobedone())
+        self.assertEqual((1, 2, 'elaboration'), data2.last_link())
+        self.assertIs(data1, data2.parent)
+
+    def test_disc_data_signature(self):
+        'different paths to the same right frontier are merged'
+        root = astar.DiscData(accessible=[0], tolink=[1, 2, 3])
+        full = astar.RfcConstraint.full
+        data1 = root.link(0, 1, 'elaboration', rfc=full)
+        data_a = data1.link(0, 2, 'elaboration', rfc=full)
+        data_b = data1.link(1, 2, 'narration', rfc=full)
+        self.assertNotEqual(data_a.last_link(), data_b.last_link())
+        self.assertEqual(data_a.signature(), data_b.signature())
+        self.assertNotEqual(data1.signature(), data_a.signature())
 
     # FAILS: it's something to do with the initial state not having
     # any to do links..., would need to check with PM about this
@@ -121,6 +261,39 @@ class AstarTest(DecoderTest):
     #     self._test_heuristic(astar.DiscourseState.h_average)
 
 
+class LocalTest(DecoderTest):
+    """ Tests for the local decoders """
+
+    def test_top_rows(self):
+        'top rows are the head of a stable sort'
+        rng = np.random.RandomState(42)
+        for size in [0, 1, 5, 20]:
+            scores = rng.randint(0, 4, size=size).astype(float)
+            scores[rng.uniform(size=size) < 0.2] = np.nan
+            for nb_rows in range(size + 2):
+                expected = np.argsort(-scores, kind='mergesort')[:nb_rows]
+                self.assertEqual(sorted(expected.tolist()),
+                                 local.top_rows(scores, nb_rows).tolist())
+
+    def test_best_incoming_rows(self):
+        'best incoming rows are the first best row for each target'
+        rng = np.random.RandomState(42)
+        scores = rng.randint(0, 4, size=50).astype(float)
+        tgt = rng.randint(0, 10, size=50)
+        expected = {}
+        for row, (score, target) in enumerate(zip(scores, tgt)):
+            if target not in expected or score > scores[expected[target]]:
+                expected[target] = row
+        self.assertEqual(sorted(expected.values()),
+                         sorted(local.best_incoming_rows(scores, tgt)))
+
+    def test_decoders(self):
+        'check that the local decoders work'
+        for decoder in [local.AsManyDecoder(),
+                        local.BestIncomingDecoder()]:
+            decoder.decode(self.dpack)
+
+
 class LocallyGreedyTest(DecoderTest):
     """ Tests for locally greedy decoder"""
 
@@ -129,6 +302,49 @@ class LocallyGreedyTest(DecoderTest):
         decoder = greedy.LocallyGreedy()
         decoder.decode(self.dpack)
 
+    def test_neighbours(self):
+        'neighbour index agrees with the pairwise definitions'
+        rng = np.random.RandomState(42)
+        edus = [FAKE_ROOT]
+        for i in range(30):
+            start = rng.randint(0, 40)
+            edus.append(EDU('e%d' % i, 'x', start, start + rng.randint(0, 6),
+                            'a', 'a'))
+        nmat = greedy.neighbour_matrix(edus)
+        for i, one in enumerate(edus):
+            for j, two in enumerate(edus):
+                expected = i != j and (
+                    greedy.are_strictly_adjacent(one, two, edus) or
+                    greedy.is_embedded(one, two) or
+                    greedy.is_embedded(two, one))
+                self.assertEqual(expected, nmat[i, j])
+
+
+def _brute_force_trees(scores, root):
+    """all the arborescences of a small graph, by enumerating all parent
+    assignments: [(score, edges)], by decreasing score"""
+    nodes = [x for x in range(scores.shape[0]) if x != root]
+    res = []
+    for parents in itertools.product(range(scores.shape[0]),
+                                     repeat=len(nodes)):
+        parent = dict(zip(nodes, parents))
+        if not all(np.isfinite(scores[s, t]) for t, s in parent.items()):
+            continue
+        # every node must lead back to the root
+        acyclic = True
+        for node in nodes:
+            seen = set()
+            while node != root and acyclic:
+                acyclic = node not in seen
+                seen.add(node)
+                node = parent[node]
+        if acyclic:
+            total = sum(scores[s, t] for t, s in parent.items())
+            res.append((total, sorted((s, t) for t, s in parent.items())))
+    # stable sort: ties stay in enumeration order
+    res.sort(key=lambda x: -x[0])
+    return res
+
 
 class MstTest(DecoderTest):
     """ Tests for MST and MSDAG decoders """
@@ -145,6 +361,77 @@ class MstTest(DecoderTest):
         # Is it a tree ? (One edge less than number of vertices)
         self.assertEqual(len(edges), len(self.edus) - 1)
 
+    @staticmethod
+    def _brute_force_mst(scores, root):
+        'best arborescence by enumerating all parent assignments'
+        trees = _brute_force_trees(scores, root)
+        return trees[0][1] if trees else None
+
+    def test_mst_edges(self):
+        'the MST engine finds the best arborescence'
+        rng = np.random.RandomState(42)
+        for nb_nodes in [1, 2, 3, 4, 5]:
+            for _ in range(20):
+                scores = rng.normal(size=(nb_nodes, nb_nodes))
+                scores[rng.uniform(size=scores.shape) < 0.2] = -np.inf
+                expected = self._brute_force_mst(scores, 0)
+                if expected is None:
+                    # some nodes are unreachable
+                    continue
+                self.assertEqual(expected, sorted(mst.mst_edges(scores, 0)))
+
+    def test_mst_kbest(self):
+        'the k-best MST engine finds the best arborescences, in order'
+        rng = np.random.RandomState(42)
+        for nb_nodes in [1, 2, 3, 4, 5, 6]:
+            for integers in [False, True]:
+                for _ in range(10):
+                    if integers:
+                        # lots of ties
+                        scores = rng.randint(3, size=(nb_nodes, nb_nodes))
+                        scores = scores.astype(float)
+                    else:
+                        scores = rng.normal(size=(nb_nodes, nb_nodes))
+                    scores[rng.uniform(size=scores.shape) < 0.2] = -np.inf
+                    scores[np.diag_indices(nb_nodes)] = -np.inf
+                    scores[:, 0] = -np.inf
+                    expected = _brute_force_trees(scores, 0)
+                    if not expected:
+                        continue
+                    kbest = mst.mst_kbest(scores, 0, 30)
+                    self.assertTrue(np.allclose([x[0] for x in expected[:30]],
+                                                [x[0] for x in kbest]))
+                    for total, edges in kbest:
+                        self.assertAlmostEqual(total,
+                                               sum(scores[s, t]
+                                                   for s, t in edges))
+                    trees = set(tuple(sorted(edges)) for _, edges in kbest)
+                    self.assertEqual(len(kbest), len(trees))
+        decoder = mst.MstDecoder(mst.MstRootStrategy.fake_root)
+        dpacks = decoder.decode_kbest(self.dpack, 3)
+        self.assertEqual(3, len(dpacks))
+        self.assertEqual(decoder.decode(self.dpack).graph.prediction.tolist(),
+                         dpacks[0].graph.prediction.tolist())
+
+    def test_msdag_edges(self):
+        'MSDAG keeps the tree, adds edges while avoiding cycles'
+        rng = np.random.RandomState(42)
+        nb_nodes = 10
+        scores = rng.normal(size=(nb_nodes, nb_nodes))
+        scores[np.diag_indices(nb_nodes)] = -np.inf
+        scores[:, 0] = -np.inf
+        tree = mst.mst_edges(scores, 0)
+        edges = mst._msdag(scores, tree)
+        self.assertTrue(set(tree) <= set(edges))
+        # a complete graph has a complete DAG
+        self.assertEqual(len(edges), nb_nodes * (nb_nodes - 1) // 2)
+        # every edge goes forward in some topological order
+        depth = dict((x, 0) for x in range(nb_nodes))
+        for _ in range(nb_nodes):
+            for src, tgt in edges:
+                depth[tgt] = max(depth[tgt], depth[src] + 1)
+        self.assertTrue(all(depth[s] < depth[t] for s, t in edges))
+
     def test_msdag(self):
         'check MSDAG decoder'
         decoder = mst.MsdagDecoder(mst.MstRootStrategy.fake_root)
@@ -160,3 +447,55 @@ class EisnerTest(DecoderTest):
         'check that the Eisner decoder works'
         decoder = EisnerDecoder()
         decoder.decode(self.dpack)
+
+    def test_eisner_chart(self):
+        'vectorized chart gives the same trees as the reference one'
+        rng = np.random.RandomState(42)
+        for nb_edus in [1, 2, 5, 12]:
+            for unique_real_root in [True, False]:
+                # real-valued scores, then scores with many ties
+                for score in [np.log(rng.uniform(size=(nb_edus, nb_edus))),
+                              rng.randint(0, 3, size=(nb_edus, nb_edus))]:
+                    _, splits_ref = eisner_chart_naive(
+                        score, unique_real_root=unique_real_root)
+                    _, splits_vec = eisner_chart(
+                        score, unique_real_root=unique_real_root)
+                    self.assertEqual(splits_ref.tolist(),
+                                     splits_vec.tolist())
+                    self.assertEqual(sorted(eisner_edges(splits_ref)),
+                                     sorted(eisner_edges(splits_vec)))
+
+    def test_eisner_kbest(self):
+        'k-best Eisner enumerates the best projective trees, in order'
+        def projective(edges):
+            'no crossing edges'
+            spans = [sorted(edge) for edge in edges]
+            return not any(lo1 < lo2 < hi1 < hi2
+                           for lo1, hi1 in spans for lo2, hi2 in spans)
+
+        rng = np.random.RandomState(42)
+        for nb_edus in [1, 2, 4, 6]:
+            score = np.log(rng.uniform(size=(nb_edus, nb_edus)))
+            score[np.diag_indices(nb_edus)] = -np.inf
+            score[:, 0] = -np.inf
+            for unique_real_root in [True, False]:
+                expected = [tree for tree in _brute_force_trees(score, 0)
+                            if projective(tree[1]) and
+                            (not unique_real_root or
+                             [s for s, _ in tree[1]].count(0) == 1)]
+                if nb_edus == 1:
+                    expected = [(0., [])]
+                kbest = eisner_kbest(score, 10,
+                                     unique_real_root=unique_real_root)
+                self.assertTrue(np.allclose([x[0] for x in expected[:10]],
+                                            [x[0] for x in kbest]))
+                # the first one is the tree eisner_chart finds
+                _, splits = eisner_chart(score,
+                                         unique_real_root=unique_real_root)
+                self.assertEqual(sorted(eisner_edges(splits)),
+                                 sorted(kbest[0][1]))
+        decoder = EisnerDecoder()
+        dpacks = decoder.decode_kbest(self.dpack, 2)
+        self.assertEqual(2, len(dpacks))
+        self.assertEqual(decoder.decode(self.dpack).graph.prediction.tolist(),
+                         dpacks[0].graph.prediction.tolist())
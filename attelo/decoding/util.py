@@ -2,6 +2,8 @@
 Utility classes functions shared by decoders
 """
 
+from collections import namedtuple
+
 import numpy as np
 
 from attelo.table import (Graph, UNRELATED)
@@ -19,10 +21,10 @@ def cap_score(score):
 
     The current default values for `MIN_SCORE` and `MAX_SCORE` follow the
     requirements from the decoders:
-    * The MST decoder uses the depparse package whose MST implementation
-    has a hardcoded minimum score of `-1e100` ; Feeding it lower weights
-    crashes the algorithm. Combined scores can't reach the limit unless
-    we have more than 1e10 nodes.
+    * The MST decoder reserves `-inf` for missing edges, so actual edges
+    must have finite scores. The `-1e100` limit of the depparse package,
+    which it used to rely on, is not reached by combined scores unless we
+    have more than 1e10 nodes.
     * The Eisner decoder internally uses float64 scores.
 
     Parameters
@@ -38,6 +40,28 @@ def cap_score(score):
     return min(MAX_SCORE, max(MIN_SCORE, score))
 
 
+def cap_scores(scores):
+    """Cap an array of real-valued scores between `MIN_SCORE` and
+    `MAX_SCORE`.
+
+    This is the array version of `cap_score` ; in particular, NaNs are
+    mapped to `MIN_SCORE`.
+
+    Parameters
+    ----------
+    scores : array of float
+        Original scores.
+
+    Returns
+    -------
+    bounded_scores : array of float
+        Scores bounded to [MIN_SCORE, MAX_SCORE].
+    """
+    bounded_scores = np.clip(scores, MIN_SCORE, MAX_SCORE)
+    bounded_scores[np.isnan(bounded_scores)] = MIN_SCORE
+    return bounded_scores
+
+
 class DecoderException(Exception):
     """
     Exceptions that arise during the decoding process
@@ -92,22 +116,193 @@ def convert_prediction(dpack, triples):
         A copy of the original DataPack with predictions
         set
     """
-    link_map = {(id1, id2): lab for id1, id2, lab in triples}
-
-    def get_lbl(pair):
-        'from edu pair to label number'
-        edu1, edu2 = pair
-        key = edu1.id, edu2.id
-        lbl = link_map.get(key, UNRELATED)
-        return dpack.label_number(lbl)
-    prediction = np.fromiter((get_lbl(pair) for pair in dpack.pairings),
-                             dtype=np.dtype(np.int16))
+    prediction = np.empty(len(dpack), dtype=np.dtype(np.int16))
+    prediction[:] = dpack.label_number(UNRELATED)
+    # pairings and links are both keyed on the positions of their
+    # EDUs in the datapack EDU table
+    index = dpack.edu_table.index()
+    nb_edus = len(index)
+    link_map = {index[id1] * nb_edus + index[id2]: dpack.label_number(lab)
+                for id1, id2, lab in triples
+                if id1 in index and id2 in index}
+    if link_map and len(dpack):
+        link_keys = np.array(sorted(link_map), dtype=np.int64)
+        link_lbls = np.array([link_map[k] for k in link_keys.tolist()])
+        pair_keys = (dpack.src_idx.astype(np.int64) * nb_edus +
+                     dpack.tgt_idx)
+        pos = np.minimum(np.searchsorted(link_keys, pair_keys),
+                         len(link_keys) - 1)
+        found = link_keys[pos] == pair_keys
+        prediction[found] = link_lbls[pos[found]]
     graph = Graph(prediction=prediction,
                   attach=dpack.graph.attach,
                   label=dpack.graph.label)
     return dpack.set_graph(graph)
 
 
+def pairing_positions(dpack):
+    """Positions of the source and target EDUs of each pairing of a
+    datapack, the EDUs being in document order (the fake root, if any,
+    comes first, then the EDUs sorted by span)
+
+    Returns
+    -------
+    edus: [EDU]
+        EDUs of the datapack, in position order
+
+    src: 1D array of int
+        position of the source EDU of each pairing
+
+    tgt: 1D array of int
+        position of the target EDU of each pairing
+
+    See also
+    --------
+    `DataPack.edu_positions`, which this comes from (and which is
+    kept with the datapack)
+    """
+    positions = dpack.edu_positions()
+    return positions.edus, positions.src, positions.tgt
+
+
+class ScoreMatrix(namedtuple('ScoreMatrix',
+                             'edus src tgt rows attach label mask')):
+    """Dense view of the attachment scores and best labels of a
+    weighted (single document) datapack.
+
+    EDUs are indexed by their position in the document: the fake root,
+    if any, comes first, then the EDUs sorted by span.
+
+    Parameters
+    ----------
+    edus : [EDU]
+        EDUs of the datapack, in position order
+
+    src : 1D array of int
+        position of the source EDU of each pairing
+
+    tgt : 1D array of int
+        position of the target EDU of each pairing
+
+    rows : 2D array of int
+        `rows[s, t]` is the index of the pairing between the EDUs at
+        positions `s` and `t` in the datapack, or -1 if there is none
+
+    attach : 2D array of float
+        attachment score of each pairing (0 if missing)
+
+    label : 2D array of int
+        best label of each pairing (0 if missing)
+
+    mask : 2D array of bool
+        True for pairs of positions that correspond to a pairing
+    """
+    @classmethod
+    def from_dpack(cls, dpack):
+        """Build the score matrix for a weighted datapack
+
+        :rtype: :py:class:`ScoreMatrix`
+        """
+        if dpack.graph is None:
+            raise ValueError("Tried to extract weights from an "
+                             "unweighted datapack")
+        edus, src, tgt = pairing_positions(dpack)
+        num_pairs = len(dpack.pairings)
+        nb_edus = len(edus)
+        rows = np.empty((nb_edus, nb_edus), dtype=np.intp)
+        rows[:] = -1
+        rows[src, tgt] = np.arange(num_pairs)
+        attach = np.zeros((nb_edus, nb_edus), dtype=np.float64)
+        attach[src, tgt] = dpack.graph.attach
+        label = np.zeros((nb_edus, nb_edus), dtype=np.int32)
+        label[src, tgt] = dpack.graph.best_label()
+        return cls(edus=edus,
+                   src=src,
+                   tgt=tgt,
+                   rows=rows,
+                   attach=attach,
+                   label=label,
+                   mask=rows >= 0)
+
+    def __len__(self):
+        return len(self.edus)
+
+    def transformed(self, use_prob=True):
+        """Attachment scores as seen by decoders that add scores up:
+        log-probabilities (capped, see `cap_scores`) if `use_prob`,
+        the raw scores otherwise.
+
+        Missing pairings get `MIN_SCORE`.
+
+        :rtype: 2D array of float
+        """
+        if use_prob:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                scores = cap_scores(np.log(self.attach))
+        else:
+            scores = np.copy(self.attach)
+        scores[~self.mask] = MIN_SCORE
+        return scores
+
+
+def convert_edges(dpack, smat, edges):
+    """Populate a datapack prediction array from a list of edges,
+    each edge getting its best label
+
+    Parameters
+    ----------
+    dpack: DataPack
+        Weighted datapack
+
+    smat: ScoreMatrix
+        Score matrix for the datapack
+
+    edges: [(int, int)]
+        List of (source, target) EDU positions in the score matrix ;
+        edges that do not correspond to a pairing are ignored
+
+    Returns
+    -------
+    dpack: DataPack
+        A copy of the original DataPack with predictions
+        set
+    """
+    if len(edges):
+        srcs, tgts = np.asarray(edges, dtype=np.intp).T
+        rows = smat.rows[srcs, tgts]
+        rows = rows[rows >= 0]
+    else:
+        rows = []
+    return convert_rows(dpack, rows)
+
+
+def convert_rows(dpack, rows):
+    """Populate a datapack prediction array from the indices of the
+    pairings that are attached, each getting its best label
+
+    Parameters
+    ----------
+    dpack: DataPack
+        Weighted datapack
+
+    rows: 1D array of int
+        Indices of the attached pairings
+
+    Returns
+    -------
+    dpack: DataPack
+        A copy of the original DataPack with predictions
+        set
+    """
+    prediction = np.empty(len(dpack), dtype=np.dtype(np.int16))
+    prediction[:] = dpack.label_number(UNRELATED)
+    rows = np.asarray(rows, dtype=np.intp)
+    if len(rows):
+        prediction[rows] = dpack.graph.selected(rows).best_label()
+    graph = dpack.graph.tweak(prediction=prediction)
+    return dpack.set_graph(graph)
+
+
 def simple_candidates(dpack):
     '''
     Translate the links into a list of (EDU, EDU, float, string)
@@ -119,7 +314,7 @@ def simple_candidates(dpack):
         raise ValueError("Tried to extract weights from an "
                          "unweighted datapack")
     wts = dpack.graph
-    best_lbls = np.ravel(np.argmax(wts.label, axis=1))
+    best_lbls = wts.best_label()
     return [(pair[0], pair[1], score, dpack.get_label(lbl))
             for pair, score, lbl
             in zip(dpack.pairings, wts.attach, best_lbls)]
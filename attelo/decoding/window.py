@@ -28,5 +28,5 @@ class WindowPruner(Decoder):
         super(WindowPruner, self).__init__()
         self._window = window
 
-    def decode(self, dpack):
+    def decode(self, dpack, nonfixed_pairs=None):
         return select_window(dpack, self._window)
@@ -235,6 +235,9 @@ def _load_harness_multipack(hconf, test_data=False):
                            paths[3],
                            corpus_path=(paths[4] if len(paths) == 5
                                         else None),  # WIP
+                           cache_dir=fp.join(hconf.scratch_dir,
+                                             'mpack-cache'),
+                           n_jobs=hconf.runcfg.n_jobs,
                            verbose=True)
     return mpack
 
@@ -7,10 +7,10 @@ from os import path as fp
 import os
 import sys
 
-from joblib import (delayed)
+from joblib import (Parallel, delayed)
 
-from ..io import (write_predictions_output)
-from attelo.decoding.util import (prediction_to_triples)
+from ..io import (write_prediction_array,
+                  write_prediction_binary)
 from attelo.fold import (select_training,
                          select_testing)
 from attelo.harness.util import (makedirs)
@@ -36,15 +36,19 @@ def _tmp_output_filename(path, suffix):
                    '_' + fp.basename(path) + '.' + suffix)
 
 
-def concatenate_outputs(mpack, output_path):
+def binary_output_path(output_path):
     """
-    (For use after :py:func:`delayed_main_for_harness`)
+    Path to the binary version of an output file (see
+    :py:func:`attelo.io.write_prediction_binary`): the label numbers
+    of the predictions, for the documents in sorted order
+    """
+    return output_path + '.bin'
 
-    Concatenate temporary per-group outputs into a single
-    combined output
+
+def _concatenate_files(tmpfiles, output_path):
+    """
+    Concatenate some files into one, and delete them
     """
-    tmpfiles = [_tmp_output_filename(output_path, d)
-                for d in sorted(mpack.keys())]
     with open(output_path, 'wb') as file_out:
         for tfile in tmpfiles:
             with open(tfile, 'rb') as file_in:
@@ -53,6 +57,30 @@ def concatenate_outputs(mpack, output_path):
         os.remove(tmpfile)
 
 
+def concatenate_outputs(mpack, output_path):
+    """
+    (For use after :py:func:`delayed_main_for_harness`)
+
+    Concatenate temporary per-group outputs into a single
+    combined output (and likewise for their binary versions)
+
+    Parameters
+    ----------
+    mpack : Multipack or [string]
+        The multipack that was parsed, or just its groupings
+    output_path : string
+        Output path
+    """
+    groupings = sorted(mpack)
+    tmpfiles = [_tmp_output_filename(output_path, d)
+                for d in groupings]
+    # the binary output goes last: it is only trusted if it is not
+    # older than the text one (see `PredictionStore.load`)
+    _concatenate_files(tmpfiles, output_path)
+    _concatenate_files([binary_output_path(f) for f in tmpfiles],
+                       binary_output_path(output_path))
+
+
 def _parse_group(dpack, parser, output_path):
     '''
     parse a single group and write its output
@@ -63,8 +91,22 @@ def _parse_group(dpack, parser, output_path):
     '''
     dpack = parser.transform(dpack)
     # we trust the parser to select what it thinks is its best prediction
-    prediction = prediction_to_triples(dpack)
-    write_predictions_output(dpack, prediction, output_path)
+    prediction = dpack.graph.prediction
+    write_prediction_array(dpack, prediction, output_path)
+    write_prediction_binary(prediction, binary_output_path(output_path))
+
+
+def _iter_jobs(mpack_items, parser, output_path):
+    """Delayed decoding jobs for each (grouping, datapack) pair
+    """
+    for onedoc, dpack in mpack_items:
+        tmpfile = _tmp_output_filename(output_path, onedoc)
+        # * clean temp files
+        for path in [tmpfile, binary_output_path(tmpfile)]:
+            if fp.exists(path):
+                os.remove(path)
+        # * generate delayed decoding job
+        yield delayed(_parse_group)(dpack, parser, tmpfile)
 
 
 def jobs(mpack, parser, output_path):
@@ -72,28 +114,58 @@ def jobs(mpack, parser, output_path):
 
     Parameters
     ----------
-    mpack : DataPack
-        TODO
-    parser : TODO
-        TODO
+    mpack : Multipack or iterator of (string, DataPack)
+        The documents to parse: either a multipack, or a stream of
+        (grouping, datapack) pairs such as
+        :py:func:`attelo.io.iter_multipack` produces, in which case
+        the jobs are generated lazily, one document at a time
+    parser : Parser
+        A fitted parser
     output_path : string
         Output path
 
     Returns
     -------
-    res : list of delayed calls produced by joblib.delayed
+    res : list (iterator for a stream) of delayed calls produced by
+        joblib.delayed
     """
-    # * clean temp files
-    tmpfiles = [_tmp_output_filename(output_path, d)
-                for d in mpack.keys()]
-    for tmpfile in tmpfiles:
-        if fp.exists(tmpfile):
-            os.remove(tmpfile)
-    # * generate delayed decoding jobs
-    res = [delayed(_parse_group)(dpack, parser,
-                                 _tmp_output_filename(output_path, onedoc))
-           for onedoc, dpack in mpack.items()]
-    return res
+    if isinstance(mpack, dict):
+        return list(_iter_jobs(mpack.items(), parser, output_path))
+    return _iter_jobs(mpack, parser, output_path)
+
+
+def decode_stream(mpack_items, parser, output_path, n_jobs=1):
+    """Decode a stream of documents with a fitted parser and write
+    the combined predictions to the output path.
+
+    Only a bounded number of documents (a few per worker) are held
+    in memory at any time, so this works with
+    :py:func:`attelo.io.iter_multipack` on corpora that do not fit
+    in memory.
+
+    Parameters
+    ----------
+    mpack_items : iterator of (string, DataPack)
+        The documents to parse
+    parser : Parser
+        A fitted parser
+    output_path : string
+        Output path
+    n_jobs : int
+        Number of parallel jobs
+    """
+    groupings = []
+
+    def _tracked():
+        "remember the groupings as they go by"
+        for onedoc, dpack in mpack_items:
+            groupings.append(onedoc)
+            yield onedoc, dpack
+
+    makedirs(fp.dirname(output_path) or '.')
+    Parallel(n_jobs=n_jobs, verbose=True)(jobs(_tracked(), parser,
+                                               output_path))
+    concatenate_outputs(groupings, output_path)
 
 
 def learn(hconf, econf, dconf, fold):
@@ -17,8 +17,11 @@ import shutil
 import sys
 
 import joblib
+import numpy as np
 
-from attelo.io import load_predictions
+from attelo.io import (PREDICTION_DTYPE,
+                       load_prediction_binary,
+                       load_predictions)
 from attelo.fold import (select_testing)
 from attelo.harness.util import (makedirs, md5sum_dir, md5sum_file)
 from attelo.parser.intra import (IntraInterPair)
@@ -41,11 +44,13 @@ from attelo.score import (empty_confusion_matrix,
 from attelo.table import (DataPack,
                           idxes_fakeroot,
                           idxes_inter,
-                          idxes_intra)
+                          idxes_intra,
+                          subpack_rows)
 from attelo.util import (Team)
 
 from .util import makedirs
 from .graph import (mk_graphs, mk_test_graphs)
+from .parse import binary_output_path
 
 
 class ReportPack(namedtuple('ReportPack',
@@ -199,7 +204,12 @@ class Slice(namedtuple('Slice',
                           folds
     :type configuration: (string, string...)
 
-    :param predictions: list of edges as you'd get in attelo decode
+    :param predictions: list of edges as you'd get in attelo decode,
+                        or for each document, the label number
+                        predicted for each of its pairings (see
+                        :py:class:`PredictionStore`)
+    :type predictions: [(string, string, string)] or
+                       dict(string, 1D array of int)
 
     :param enable_details: True if we want to enable potentially slower
                          more expensive detailed reporting
@@ -209,6 +219,107 @@ class Slice(namedtuple('Slice',
     pass
 
 
+class PredictionStore(object):
+    """
+    Predictions of several configurations on the documents of a
+    multipack, read once from their decoding output files and kept
+    as a matrix of label numbers: one row per configuration, one
+    column per pairing of the multipack (documents in sorted order),
+    -1 where there is no prediction.
+
+    Reports can then compare predictions and targets as arrays,
+    rather than match (id, id, label) triples for every slice.
+
+    Parameters
+    ----------
+    mpack: Multipack
+
+    configurations: [string]
+        Identifiers for the configurations
+    """
+    def __init__(self, mpack, configurations):
+        self.mpack = mpack
+        self.groupings = sorted(mpack)
+        self.configurations = list(configurations)
+        starts = np.cumsum([0] + [len(mpack[g]) for g in self.groupings])
+        self._spans = {g: (starts[i], starts[i + 1])
+                       for i, g in enumerate(self.groupings)}
+        self._config_rows = {c: i for i, c in
+                             enumerate(self.configurations)}
+        self.labels = np.empty((len(self.configurations), starts[-1]),
+                               dtype=PREDICTION_DTYPE)
+        self.labels.fill(-1)
+        self._pairing_columns = None
+
+    def _columns(self, groupings):
+        """
+        Columns for the pairings of these documents, taken in sorted
+        order (which is how the harness writes its outputs)
+
+        :rtype: 1D array of int
+        """
+        return np.concatenate([np.arange(*self._spans[g])
+                               for g in sorted(groupings)] +
+                              [np.zeros(0, dtype=np.intp)])
+
+    def load(self, configuration, path, groupings):
+        """
+        Read the predictions of a configuration on some documents
+        (eg. the test documents of a fold) from its decoding output.
+        We use the binary version of the output if there is one that
+        was written after the text version (so it is not left over
+        from an earlier run) and covers these documents, and the text
+        version otherwise.
+
+        Parameters
+        ----------
+        configuration: string
+
+        path: string
+            Decoding output file
+
+        groupings: [string]
+            Documents that were decoded
+        """
+        row = self.labels[self._config_rows[configuration]]
+        columns = self._columns(groupings)
+        bin_path = binary_output_path(path)
+        if fp.exists(bin_path) and\
+                fp.getmtime(bin_path) >= fp.getmtime(path):
+            prediction = load_prediction_binary(bin_path)
+            if len(prediction) == len(columns):
+                row[columns] = prediction
+                return
+        if self._pairing_columns is None:
+            self._pairing_columns = {}
+            for grouping in self.groupings:
+                start, _ = self._spans[grouping]
+                for i, (edu1, edu2) in\
+                        enumerate(self.mpack[grouping].pairings):
+                    self._pairing_columns[(edu1.id, edu2.id)] = start + i
+        label_numbers = {}
+        dpack0 = self.mpack[self.groupings[0]]
+        for id1, id2, label in load_predictions(path):
+            column = self._pairing_columns.get((id1, id2))
+            if column is None:
+                continue
+            if label not in label_numbers:
+                label_numbers[label] = dpack0.label_number(label)
+            row[column] = label_numbers[label]
+
+    def predictions(self, configuration):
+        """
+        The predictions of a configuration, as an array for each
+        document, aligned with the pairings of its datapack (these
+        are views on the store, so later loads show through)
+
+        :rtype: dict(string, 1D array of int)
+        """
+        row = self.labels[self._config_rows[configuration]]
+        return {g: row[start:stop] for g, (start, stop)
+                in self._spans.items()}
+
+
 # pylint: disable=too-many-locals
 # it's a bit hard to write this sort score accumulation code
 # local help
@@ -231,6 +342,9 @@ def full_report(mpack, fold_dict, slices, metrics,
         Predictions for each configuration, for each fold.
         Folds should be contiguous for maximum efficiency.
         It may be worthwhile to generate this lazily.
+        Predictions given per document as label numbers (see
+        :py:class:`PredictionStore`) are scored as arrays, which is
+        much faster than scoring triples.
     metrics: iterable of {'edges', 'edges_by_label', 'edus', 'cspans'}
         Set of selected metrics.
         For the RST corpus, 'cspans' should not be selected for evaluation
@@ -263,29 +377,36 @@ def full_report(mpack, fold_dict, slices, metrics,
     fold = None
     is_first_slice = True
 
-    # avoid slicing the predictions if we can help it (slow)
     adjust_pack = adjust_pack or (lambda x: x)
-    adjust_predictions = select_in_pack if adjust_pack else (lambda _, x: x)
 
     num_edges = {}
     for slc in slices:
         if is_first_slice and slc.fold is None:
-            dpacks = [adjust_pack(x) for x in mpack.values()]  # WIP
-            fpack = DataPack.vstack(dpacks)
-            is_first_slice = False
-            num_edges[None] = len(fpack)
+            f_mpack = mpack
         elif is_first_slice or slc.fold != fold:
             f_mpack = select_testing(mpack, fold_dict, slc.fold)
-            dpacks = [adjust_pack(x) for x in f_mpack.values()]  # WIP
+        else:
+            f_mpack = None
+        if f_mpack is not None:
+            groupings = sorted(f_mpack)
+            dpacks = [adjust_pack(f_mpack[g]) for g in groupings]  # WIP
+            # where the pairings of the adjusted packs come from
+            doc_rows = [subpack_rows(f_mpack[g], [d])[0]
+                        for g, d in zip(groupings, dpacks)]
             fpack = DataPack.vstack(dpacks)
             fold = slc.fold
             num_edges[fold] = len(fpack)
             is_first_slice = False
         key = slc.configuration
         # accumulate scores
-        predictions = adjust_predictions(fpack, slc.predictions)
-        dpredictions = [adjust_predictions(dpack, slc.predictions)
-                        for dpack in dpacks]
+        if isinstance(slc.predictions, dict):
+            dpredictions = [slc.predictions[g][rows] for g, rows
+                            in zip(groupings, doc_rows)]
+            predictions = np.concatenate(dpredictions)
+        else:
+            predictions = select_in_pack(fpack, slc.predictions)
+            dpredictions = [select_in_pack(dpack, slc.predictions)
+                            for dpack in dpacks]
         # apply selected metrics
         # * on (dependency) edges
         if 'edges' in metrics:
@@ -370,18 +491,29 @@ def _report_key(econf):
             econf.settings.key)
 
 
-def _fold_report_slices(hconf, fold):
+def _prediction_store(hconf, dconf):
+    """
+    Empty store for the predictions of all evaluations on the data
+    """
+    return PredictionStore(dconf.pack,
+                           [econf.key for econf in hconf.evaluations])
+
+
+def _fold_report_slices(hconf, dconf, store, fold):
     """
-    Report slices for a given fold
+    Report slices for a given fold, reading the predictions of each
+    evaluation into the store
     """
     print('Scoring fold {}...'.format(fold),
           file=sys.stderr)
+    groupings = list(select_testing(dconf.pack, dconf.folds, fold))
     dkeys = [econf.key for econf in hconf.detailed_evaluations]
     for econf in hconf.evaluations:
-        p_path = hconf.decode_output_path(econf, fold)
+        store.load(econf.key, hconf.decode_output_path(econf, fold),
+                   groupings)
         yield Slice(fold=fold,
                     configuration=_report_key(econf),
-                    predictions=load_predictions(p_path),
+                    predictions=store.predictions(econf.key),
                     enable_details=econf.key in dkeys)
 
 
@@ -535,13 +667,16 @@ def _mk_report(hconf, dconf, slices, fold, test_data=False):
 
 def mk_fold_report(hconf, dconf, fold):
     "Generate reports for the given fold"
-    slices = _fold_report_slices(hconf, fold)
+    store = _prediction_store(hconf, dconf)
+    slices = _fold_report_slices(hconf, dconf, store, fold)
     _mk_report(hconf, dconf, slices, fold)
 
 
 def mk_global_report(hconf, dconf):
     "Generate reports for all folds"
-    slices = itr.chain.from_iterable(_fold_report_slices(hconf, f)
+    store = _prediction_store(hconf, dconf)
+    slices = itr.chain.from_iterable(_fold_report_slices(hconf, dconf,
+                                                         store, f)
                                      for f in frozenset(dconf.folds.values()))
     _mk_report(hconf, dconf, slices, None)
     _copy_version_files(hconf, False)
@@ -565,10 +700,12 @@ def mk_test_report(hconf, dconf):
     if econf is None:
         return
 
-    p_path = hconf.decode_output_path(econf, None)
+    store = PredictionStore(dconf.pack, [econf.key])
+    store.load(econf.key, hconf.decode_output_path(econf, None),
+               list(dconf.pack))
     slices = [Slice(fold=None,
                     configuration=_report_key(econf),
-                    predictions=load_predictions(p_path),
+                    predictions=store.predictions(econf.key),
                     enable_details=True)]
     _mk_report(hconf, dconf, slices, None,
                test_data=True)
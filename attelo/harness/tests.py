@@ -2,9 +2,21 @@
 attelo.harness tests
 """
 
+from os import path as fp
+import os
+import shutil
+import tempfile
 import unittest
 
+import numpy as np
+import scipy.sparse
+
+from attelo.edu import EDU, FAKE_ROOT
+from attelo.io import write_prediction_array, write_prediction_binary
+from attelo.table import DataPack
 from .example import TinyHarness
+from .parse import binary_output_path
+from .report import PredictionStore
 
 
 # pylint: disable=too-few-public-methods
@@ -18,3 +30,70 @@ class HarnessTest(unittest.TestCase):
         """Check that the harness does not crash on example data
         """
         TinyHarness().run()
+
+
+class PredictionStoreTest(unittest.TestCase):
+    """
+    Reading decoding outputs into a prediction store
+    """
+    labels = ['__UNK__', 'x', 'UNRELATED']
+
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp()
+        self.mpack = {}
+        for doc in ['d1', 'd2']:
+            edus = [EDU('{}_e{}'.format(doc, i), '', i, i + 1, doc, 's1')
+                    for i in range(2)]
+            pairings = [(FAKE_ROOT, edus[0]), (FAKE_ROOT, edus[1]),
+                        (edus[0], edus[1])]
+            self.mpack[doc] = DataPack.load(
+                edus=[FAKE_ROOT] + edus,
+                pairings=pairings,
+                data=scipy.sparse.csr_matrix((3, 1)),
+                target=np.array([1, 2, 1]),
+                ctarget={},
+                labels=self.labels,
+                vocab=None)
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpdir)
+
+    def _write_output(self, path, prediction):
+        "write the text output for document d2, then its binary version"
+        write_prediction_array(self.mpack['d2'], prediction, path)
+        write_prediction_binary(prediction, binary_output_path(path))
+
+    def test_load(self):
+        'binary output, text fallback, and no predictions elsewhere'
+        path = fp.join(self._tmpdir, 'output')
+        expected = np.array([1, 2, 1], dtype=np.int16)
+        self._write_output(path, expected)
+        bin_path = binary_output_path(path)
+        # the binary output is used: a wrong one shows through
+        write_prediction_binary(np.array([2, 2, 2]), bin_path)
+        store = PredictionStore(self.mpack, ['c1'])
+        store.load('c1', path, ['d2'])
+        predictions = store.predictions('c1')
+        self.assertEqual([2, 2, 2], predictions['d2'].tolist())
+        # documents that were not loaded have no predictions
+        self.assertEqual([-1, -1, -1], predictions['d1'].tolist())
+        # binary output older than the text one: left over from an
+        # earlier run
+        mtime = fp.getmtime(path)
+        os.utime(bin_path, (mtime - 10, mtime - 10))
+        store.load('c1', path, ['d2'])
+        self.assertEqual(expected.tolist(), predictions['d2'].tolist())
+        # binary output for other documents
+        self._write_output(path, expected)
+        write_prediction_binary(np.array([2, 2, 2, 2, 2, 2]), bin_path)
+        store = PredictionStore(self.mpack, ['c1'])
+        store.load('c1', path, ['d2'])
+        self.assertEqual(expected.tolist(),
+                         store.predictions('c1')['d2'].tolist())
+        # no binary output at all
+        os.remove(bin_path)
+        store = PredictionStore(self.mpack, ['c1', 'c2'])
+        store.load('c2', path, ['d2'])
+        self.assertEqual(expected.tolist(),
+                         store.predictions('c2')['d2'].tolist())
+        self.assertEqual([-1] * 6, store.labels[0].tolist())
@@ -3,23 +3,36 @@ Saving and loading data or models
 """
 
 from __future__ import print_function
-from itertools import chain
+from itertools import chain, groupby
+from os import path as fp
 import codecs
 import copy
 import csv
+import hashlib
 import json
+import os
+import re
+import shutil
 import sys
+import tempfile
 import time
 import traceback
 
+from joblib import (Parallel, delayed, effective_n_jobs)
+import numpy as np
+import scipy.sparse
+import six
+from six.moves import zip_longest
 from sklearn.datasets import load_svmlight_file
 
 import educe  # WIP
 
 from .edu import (EDU, FAKE_ROOT_ID, FAKE_ROOT)
-from .table import (DataPack, DataPackException,
+from .harness.util import md5sum_file
+from .table import (DataPack, DataPackException, EduTable, LabelVocab,
+                    Pairings,
                     UNKNOWN, UNRELATED,
-                    get_label_string, groupings)
+                    get_label_string, grouping_ranges)
 from .util import truncate
 
 # pylint: disable=too-few-public-methods
@@ -109,13 +122,9 @@ class Torpor(object):
 # ---------------------------------------------------------------------
 
 
-def load_edus(edu_file):
+def _iter_edus(edu_file):
     """
-    Read EDUs (see :doc:`../input`)
-
-    :rtype: [EDU]
-
-    .. _format: https://github.com/kowey/attelo/doc/inputs.rst
+    Generator version of :py:func:`load_edus`
     """
     def read_edu(row):
         'interpret a single row'
@@ -140,18 +149,26 @@ def load_edus(edu_file):
 
     with open(edu_file, 'rb') as instream:
         reader = csv.reader(instream, dialect=csv.excel_tab)
-        return [read_edu(r) for r in reader if r]
+        for row in reader:
+            if row:
+                yield read_edu(row)
 
 
-def load_pairings(edu_file):
+def load_edus(edu_file):
     """
-    Read and return EDU pairings (see :doc:`../input`).
-    We assume the order is parent, child
+    Read EDUs (see :doc:`../input`)
 
-    :rtype: [(string, string)]
+    :rtype: [EDU]
 
     .. _format: https://github.com/kowey/attelo/doc/inputs.rst
     """
+    return list(_iter_edus(edu_file))
+
+
+def _iter_pairings(edu_file):
+    """
+    Generator version of :py:func:`load_pairings`
+    """
     def read_pair(row):
         'interpret a single row'
         if len(row) < 2 or len(row) > 3:
@@ -164,7 +181,21 @@ def load_pairings(edu_file):
 
     with open(edu_file, 'rb') as instream:
         reader = csv.reader(instream, dialect=csv.excel_tab)
-        return [read_pair(r) for r in reader if r]
+        for row in reader:
+            if row:
+                yield read_pair(row)
+
+
+def load_pairings(edu_file):
+    """
+    Read and return EDU pairings (see :doc:`../input`).
+    We assume the order is parent, child
+
+    :rtype: [(string, string)]
+
+    .. _format: https://github.com/kowey/attelo/doc/inputs.rst
+    """
+    return list(_iter_pairings(edu_file))
 
 
 def load_labels(feature_file):
@@ -190,7 +221,11 @@ def _process_edu_links(edus, pairings):
     :py:method:load_pairings: to a sequence of edus and pairings
     respectively
 
-    :rtype: ([EDU], [(EDU,EDU)])
+    The pairings are returned in columnar form (see
+    :py:class:`attelo.table.Pairings`), which is coded straight
+    from the EDU identifiers without building any tuples.
+
+    :rtype: ([EDU], Pairings)
     """
     edumap = {e.id: e for e in edus}
     enames = frozenset(chain.from_iterable(pairings))
@@ -208,12 +243,267 @@ def _process_edu_links(edus, pairings):
         raise DataPackException(oops.format(truncate(', '.join(naughty),
                                                      1000)))
 
-    pairings2 = [(edumap[e1], edumap[e2]) for e1, e2 in pairings]
-    return edus2, pairings2
+    table = EduTable.from_edus(edus2)
+    index = table.index()
+    src_idx = np.fromiter((index[e1] for e1, _ in pairings),
+                          dtype=np.int32, count=len(pairings))
+    tgt_idx = np.fromiter((index[e2] for _, e2 in pairings),
+                          dtype=np.int32, count=len(pairings))
+    return edus2, Pairings(table, src_idx, tgt_idx)
+
+
+# upper bound on the number of features when loading svmlight chunks
+# without knowing it (large enough, while keeping int32 indices)
+_MAX_FEATURES = np.iinfo(np.int32).max - 1
+
+
+def _svmlight_chunk_bounds(feature_file, chunk_size):
+    """
+    Cut a file into byte ranges of roughly `chunk_size` bytes, each
+    starting at the beginning of a line
+
+    :rtype: [(int, int)]
+    """
+    file_size = os.path.getsize(feature_file)
+    starts = [0]
+    with open(feature_file, 'rb') as stream:
+        while starts[-1] + chunk_size < file_size:
+            stream.seek(starts[-1] + chunk_size)
+            stream.readline()
+            if stream.tell() >= file_size:
+                break
+            starts.append(stream.tell())
+    return list(zip(starts, starts[1:] + [file_size]))
+
+
+def _load_svmlight_chunk(feature_file, n_features, start, end):
+    """
+    Read the rows of an svmlight file within a byte range (which
+    should start and end at line boundaries), keeping the feature
+    indices as they are in the file
+
+    :rtype: (csr_matrix, 1D array of float)
+    """
+    with open(feature_file, 'rb') as stream:
+        stream.seek(start)
+        chunk = stream.read(end - start)
+    # pylint: disable=unbalanced-tuple-unpacking
+    return load_svmlight_file(six.BytesIO(chunk),
+                              n_features=n_features,
+                              zero_based=True)
+    # pylint: enable=unbalanced-tuple-unpacking
+
+
+def load_svmlight_chunked(feature_file, n_features=None, n_jobs=1,
+                          chunk_size=None):
+    """
+    Read an svmlight file like `load_svmlight_file` does (with the
+    default `zero_based='auto'`), but in parallel: the file is cut into
+    byte ranges which are parsed in separate processes, and the results
+    put together in a single CSR matrix.
+
+    The result is identical to what `load_svmlight_file` would return.
+
+    Parameters
+    ----------
+    feature_file: string
+
+    n_features: int, optional
+        number of columns of the matrix (inferred from the file
+        if unset)
+
+    n_jobs: int
+        number of processes (as for joblib; with 1, this just calls
+        `load_svmlight_file`)
+
+    chunk_size: int, optional
+        size of the byte ranges (by default, we cut the file into
+        four ranges per process)
+
+    Returns
+    -------
+    data: csr_matrix
+
+    targets: 1D array of float
+    """
+    if n_jobs == 1:
+        # pylint: disable=unbalanced-tuple-unpacking
+        return load_svmlight_file(feature_file, n_features=n_features)
+        # pylint: enable=unbalanced-tuple-unpacking
+    if chunk_size is None:
+        nb_chunks = 4 * effective_n_jobs(n_jobs)
+        chunk_size = -(-os.path.getsize(feature_file) // nb_chunks)
+    bounds = _svmlight_chunk_bounds(feature_file, max(1, chunk_size))
+    # one-based indices can go up to n_features itself
+    chunk_features = (_MAX_FEATURES if n_features is None
+                      else n_features + 1)
+    chunks = Parallel(n_jobs=n_jobs)(
+        delayed(_load_svmlight_chunk)(feature_file, chunk_features,
+                                      start, end)
+        for start, end in bounds)
+    # put the chunks together
+    nb_rows = sum(x.shape[0] for x, _ in chunks)
+    nnz = sum(x.nnz for x, _ in chunks)
+    data = np.empty(nnz, dtype=np.float64)
+    indices = np.empty(nnz, dtype=np.intc)
+    indptr = np.empty(nb_rows + 1, dtype=np.intc)
+    targets = np.empty(nb_rows, dtype=np.float64)
+    indptr[0] = 0
+    row = 0
+    pos = 0
+    for mat, tgt in chunks:
+        data[pos:pos + mat.nnz] = mat.data
+        indices[pos:pos + mat.nnz] = mat.indices
+        indptr[row + 1:row + 1 + mat.shape[0]] = mat.indptr[1:] + pos
+        targets[row:row + mat.shape[0]] = tgt
+        row += mat.shape[0]
+        pos += mat.nnz
+    # the heuristic `load_svmlight_file` applies to the whole file
+    if nnz and indices.min() > 0:
+        indices -= 1
+    max_features = (indices.max() if nnz else 0) + 1
+    if n_features is None:
+        n_features = max_features
+    elif n_features < max_features:
+        raise ValueError("n_features was set to {},"
+                         " but input file contains {} features"
+                         .format(n_features, max_features))
+    matrix = scipy.sparse.csr_matrix((data, indices, indptr),
+                                     (nb_rows, n_features))
+    matrix.sort_indices()
+    return matrix, targets
+
+
+# bump whenever the layout of the multipack cache changes
+MULTIPACK_CACHE_VERSION = '1'
+
+# arrays of the multipack cache that are memory-mapped when loading
+_MMAP_ARRAYS = ['data', 'indices', 'indptr']
+
+
+def _multipack_cache_key(paths):
+    """
+    Name of the cache entry for a multipack read from the given files:
+    the md5 of their own md5 sums
+
+    :rtype: string
+    """
+    hasher = hashlib.md5(MULTIPACK_CACHE_VERSION.encode('ascii'))
+    for path in paths:
+        hasher.update(md5sum_file(path).encode('ascii'))
+    return hasher.hexdigest()
+
+
+def _native_str(text):
+    """
+    Identifiers read back from JSON are unicode, whereas the csv
+    module gives us (byte) strings in Python 2
+    """
+    if six.PY2 and text is not None:
+        return text.encode('utf-8')
+    return text
+
+
+def _save_multipack_cache(cache_path, edus, pairings, data, targets,
+                          labels, vocab):
+    """
+    Save the contents of a multipack file set to a cache directory (see
+    `load_multipack`).
+
+    The directory is written under a temporary name and moved into
+    place once complete, so that concurrent readers only ever see a
+    complete cache entry.
+    """
+    parent = fp.dirname(cache_path)
+    if not fp.exists(parent):
+        os.makedirs(parent)
+    tmp_path = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+    table = pairings.table
+    arrays = {'data': data.data,
+              'indices': data.indices,
+              'indptr': data.indptr,
+              'target': targets,
+              'src_idx': pairings.src_idx,
+              'tgt_idx': pairings.tgt_idx,
+              'grouping': table.grouping,
+              'subgrouping': table.subgrouping,
+              'start': table.start,
+              'end': table.end}
+    for name, array in arrays.items():
+        np.save(fp.join(tmp_path, name + '.npy'), array)
+    meta = {'shape': data.shape,
+            'labels': list(labels),
+            'vocab': vocab,
+            'ids': [e.id for e in edus],
+            'texts': [e.text for e in edus],
+            'grouping_names': table.grouping_names,
+            'subgrouping_names': table.subgrouping_names}
+    with codecs.open(fp.join(tmp_path, 'meta.json'), 'w', 'utf-8') as fout:
+        json.dump(meta, fout)
+    try:
+        os.rename(tmp_path, cache_path)
+    except OSError:
+        # somebody else got there first
+        shutil.rmtree(tmp_path)
+
+
+def _load_multipack_cache(cache_path):
+    """
+    Read back the contents of a multipack file set from a cache
+    directory written by `_save_multipack_cache`. The feature matrix
+    is memory-mapped (read-only), so that processes loading the same
+    cache entry share its pages.
+
+    :rtype: ([EDU], Pairings, csr_matrix, array, LabelVocab, [string])
+    """
+    def _load(name):
+        'load an array'
+        mmap_mode = 'r' if name in _MMAP_ARRAYS else None
+        return np.load(fp.join(cache_path, name + '.npy'),
+                       mmap_mode=mmap_mode)
+
+    with codecs.open(fp.join(cache_path, 'meta.json'), 'r', 'utf-8') as fin:
+        meta = json.load(fin)
+    grouping_names = [_native_str(x) for x in meta['grouping_names']]
+    subgrouping_names = [_native_str(x) for x in meta['subgrouping_names']]
+    grouping = _load('grouping')
+    subgrouping = _load('subgrouping')
+    start = _load('start')
+    end = _load('end')
+    edus = []
+    for i, (edu_id, text) in enumerate(zip(meta['ids'], meta['texts'])):
+        if edu_id == FAKE_ROOT_ID:
+            edus.append(FAKE_ROOT)
+            continue
+        edus.append(EDU(_native_str(edu_id),
+                        text,
+                        int(start[i]),
+                        int(end[i]),
+                        grouping_names[grouping[i]],
+                        subgrouping_names[subgrouping[i]]))
+    table = EduTable(edus=edus,
+                     is_root=np.array([e is FAKE_ROOT for e in edus],
+                                      dtype=bool),
+                     grouping=grouping,
+                     subgrouping=subgrouping,
+                     start=start,
+                     end=end,
+                     grouping_names=grouping_names,
+                     subgrouping_names=subgrouping_names)
+    pairings = Pairings(table, _load('src_idx'), _load('tgt_idx'))
+    data = scipy.sparse.csr_matrix((_load('data'),
+                                    _load('indices'),
+                                    _load('indptr')),
+                                   shape=tuple(meta['shape']),
+                                   copy=False)
+    labels = LabelVocab(meta['labels'])
+    return edus, pairings, data, _load('target'), labels, meta['vocab']
 
 
 def load_multipack(edu_file, pairings_file, feature_file, vocab_file,
                    corpus_path=None,  # WIP
+                   cache_dir=None,
+                   n_jobs=1,
                    verbose=False):
     """Read EDUs and features for edu pairs.
 
@@ -229,23 +519,54 @@ def load_multipack(edu_file, pairings_file, feature_file, vocab_file,
         structures ; at the moment, only works with the RST corpus to
         access gold RST constituency trees.
 
+    cache_dir : string, optional
+        Directory for a binary cache of the input files. The first load
+        of a given set of files saves the tables and feature matrix
+        they contain in a subdirectory named after the md5 sums of the
+        files (which is only as fast as a plain load); subsequent loads
+        read them from there, skipping the parsing of the tab separated
+        and svmlight files altogether and memory-mapping the feature
+        matrix.
+
+    n_jobs : int
+        Number of processes for reading the features file (see
+        :py:func:`load_svmlight_chunked`)
+
     Returns
     -------
     mpack: Multipack
         Multipack (= dict) from grouping to DataPack.
     """
-    vocab = load_vocab(vocab_file)
+    cache_path = None
+    if cache_dir is not None:
+        with Torpor("Hashing input files", quiet=not verbose):
+            key = _multipack_cache_key([edu_file, pairings_file,
+                                        feature_file, vocab_file])
+        cache_path = fp.join(cache_dir, key)
+
+    if cache_path is not None and fp.isdir(cache_path):
+        with Torpor("Reading cached edus, pairings and features",
+                    quiet=not verbose):
+            (edus, pairings, data, targets,
+             labels, vocab) = _load_multipack_cache(cache_path)
+    else:
+        vocab = load_vocab(vocab_file)
 
-    with Torpor("Reading edus and pairings", quiet=not verbose):
-        edus, pairings = _process_edu_links(load_edus(edu_file),
-                                            load_pairings(pairings_file))
+        with Torpor("Reading edus and pairings", quiet=not verbose):
+            edus, pairings = _process_edu_links(load_edus(edu_file),
+                                                load_pairings(pairings_file))
 
-    with Torpor("Reading features", quiet=not verbose):
-        labels = [UNKNOWN] + load_labels(feature_file)
-        # pylint: disable=unbalanced-tuple-unpacking
-        data, targets = load_svmlight_file(feature_file,
-                                           n_features=len(vocab))
-        # pylint: enable=unbalanced-tuple-unpacking
+        with Torpor("Reading features", quiet=not verbose):
+            labels = LabelVocab([UNKNOWN] + load_labels(feature_file))
+            data, targets = load_svmlight_chunked(feature_file,
+                                                  n_features=len(vocab),
+                                                  n_jobs=n_jobs)
+
+        if cache_path is not None:
+            with Torpor("Caching edus, pairings and features",
+                        quiet=not verbose):
+                _save_multipack_cache(cache_path, edus, pairings, data,
+                                      targets, labels, vocab)
 
     # WIP augment DataPack with the gold structure for each grouping
     if corpus_path is None:
@@ -266,10 +587,141 @@ def load_multipack(edu_file, pairings_file, feature_file, vocab_file,
                               labels, vocab)
 
     mpack = {grp_name: dpack.selected(idxs)
-             for grp_name, idxs in groupings(pairings).items()}
+             for grp_name, idxs in grouping_ranges(pairings).items()}
     return mpack
 
 
+def _svmlight_zero_based(feature_file):
+    """
+    True if the feature indices of an svmlight file start at zero, which
+    is how `load_svmlight_file` decides on its own (if any feature has
+    index zero anywhere in the file). This reads through the whole
+    file, one line at a time.
+
+    :rtype: bool
+    """
+    zero_index = re.compile(br'\s0+:')
+    with open(feature_file, 'rb') as stream:
+        for line in stream:
+            if zero_index.search(line.split(b'#', 1)[0]):
+                return True
+    return False
+
+
+def _iter_svmlight_rows(feature_file):
+    """
+    Lines of an svmlight file that correspond to a row of the feature
+    matrix (ie. skipping comments and blank lines)
+    """
+    with open(feature_file, 'rb') as stream:
+        for line in stream:
+            if line.split(b'#', 1)[0].strip():
+                yield line
+
+
+def _iter_edu_groups(edu_file):
+    """
+    Read EDUs one grouping at a time, raising :py:class:`IoException`
+    if the EDUs of a grouping are not contiguous in the file
+
+    :rtype: iterator of (string, [EDU])
+    """
+    seen = set()
+    for grouping, edus in groupby(_iter_edus(edu_file),
+                                  key=lambda e: e.grouping):
+        if grouping in seen:
+            oops = ('The EDUs for grouping {grp} are not contiguous in '
+                    'the EDU file {efile}')
+            raise IoException(oops.format(grp=grouping, efile=edu_file))
+        seen.add(grouping)
+        yield grouping, list(edus)
+
+
+def iter_multipack(edu_file, pairings_file, feature_file, vocab_file,
+                   verbose=False):
+    """Read EDUs and features for edu pairs, one grouping at a time.
+
+    This is a streaming alternative to :py:func:`load_multipack`,
+    for corpora that are too large to be held in memory in one go.
+    It walks through the EDU, pairings and features files together,
+    and only ever holds the rows of one grouping at a time. This
+    requires that the EDUs and the pairings of each grouping be
+    contiguous, and that groupings come in the same order in the EDU
+    and the pairings files (as they do in the files we produce);
+    we raise :py:class:`IoException` if it is not the case.
+
+    Gold structures (see `corpus_path` in :py:func:`load_multipack`)
+    are not supported.
+
+    Parameters
+    ----------
+    edu_file, pairings_file, feature_file, vocab_file : string
+        Paths to the input files, as for :py:func:`load_multipack`
+
+    Returns
+    -------
+    mpack_items: iterator of (string, DataPack)
+        The groupings in the order of the files, each with the same
+        datapack that :py:func:`load_multipack` would give for it.
+    """
+    vocab = load_vocab(vocab_file)
+    labels = LabelVocab([UNKNOWN] + load_labels(feature_file))
+    with Torpor("Scanning features", quiet=not verbose):
+        zero_based = _svmlight_zero_based(feature_file)
+
+    def mk_datapack(edus, pairs, lines):
+        "datapack for the pairings (and feature rows) of one grouping"
+        mentioned = frozenset(chain.from_iterable(pairs))
+        edus, pairings = _process_edu_links([e for e in edus
+                                             if e.id in mentioned],
+                                            pairs)
+        # pylint: disable=unbalanced-tuple-unpacking
+        data, targets = load_svmlight_file(six.BytesIO(b''.join(lines)),
+                                           n_features=len(vocab),
+                                           zero_based=zero_based)
+        # pylint: enable=unbalanced-tuple-unpacking
+        return DataPack.load(edus, pairings, data, targets, {},
+                             labels, vocab)
+
+    edu_groups = _iter_edu_groups(edu_file)
+    grouping = None
+    edus = []
+    edu_ids = frozenset()
+    pairs = []
+    lines = []
+    for pair, line in zip_longest(_iter_pairings(pairings_file),
+                                  _iter_svmlight_rows(feature_file)):
+        if pair is None or line is None:
+            oops = ('The pairings file {pfile} and the features file '
+                    '{ffile} do not have the same number of rows')
+            raise IoException(oops.format(pfile=pairings_file,
+                                          ffile=feature_file))
+        edu_id = pair[1] if pair[0] == FAKE_ROOT_ID else pair[0]
+        if edu_id not in edu_ids:
+            # we are done with the current grouping
+            if pairs:
+                yield grouping, mk_datapack(edus, pairs, lines)
+                pairs = []
+                lines = []
+            for grouping, edus in edu_groups:
+                edu_ids = frozenset(e.id for e in edus)
+                if edu_id in edu_ids:
+                    break
+            else:
+                oops = ('The pairings file {pfile} mentions EDU {edu} '
+                        'after we were done with its grouping in the EDU '
+                        'file {efile} (or it does not exist): the '
+                        'pairings of each grouping must be contiguous, '
+                        'and in the same order as the EDUs')
+                raise IoException(oops.format(pfile=pairings_file,
+                                              edu=edu_id,
+                                              efile=edu_file))
+        pairs.append(pair)
+        lines.append(line)
+    if pairs:
+        yield grouping, mk_datapack(edus, pairs, lines)
+
+
 def load_vocab(filename):
     """Read feature vocabulary"""
     features = []
@@ -283,6 +735,40 @@ def load_vocab(filename):
 # ---------------------------------------------------------------------
 
 
+PREDICTION_DTYPE = np.int16
+"""type of the label numbers in binary prediction files"""
+
+# what csv.writer (excel_tab dialect) ends its rows with
+_CSV_LINE_END = b'\r\n'
+
+
+def _csv_field(text):
+    """
+    Encode a field the way csv.writer (excel_tab dialect) would write it
+
+    :rtype: bytes
+    """
+    field = text.encode('utf-8')
+    if any(c in field for c in (b'\t', b'"', b'\r', b'\n')):
+        field = b'"' + field.replace(b'"', b'""') + b'"'
+    return field
+
+
+def _write_prediction_rows(dpack, row_label, filename):
+    """
+    Write a prediction file for all the pairings of a datapack in a
+    single buffered write, `row_label` being a list of the (encoded)
+    label for each pairing
+    """
+    ids = [_csv_field(e.id) for e in dpack.edu_table.edus]
+    lines = [b'\t'.join((ids[src], ids[tgt], lbl))
+             for src, tgt, lbl in zip(dpack.src_idx.tolist(),
+                                      dpack.tgt_idx.tolist(),
+                                      row_label)]
+    with open(filename, 'wb') as fout:
+        fout.write(b''.join(line + _CSV_LINE_END for line in lines))
+
+
 def write_predictions_output(dpack, predicted, filename):
     """
     Write predictions to an output file whose format
@@ -291,21 +777,63 @@ def write_predictions_output(dpack, predicted, filename):
     links = {}
     for edu1, edu2, label in predicted:
         links[(edu1, edu2)] = label
+    fields = {}
+    row_label = []
+    for edu1, edu2 in dpack.pairings:
+        label = links.get((edu1.id, edu2.id), UNRELATED)
+        if label not in fields:
+            fields[label] = _csv_field(label)
+        row_label.append(fields[label])
+    _write_prediction_rows(dpack, row_label, filename)
 
-    def mk_row(edu1, edu2):
-        'return a list of columns'
-        edu1_id = edu1.id
-        edu2_id = edu2.id
-        row = [edu1_id,
-               edu2_id,
-               links.get((edu1_id, edu2_id), UNRELATED)]
-        return [x.encode('utf-8') for x in row]
 
-    with open(filename, 'wb') as fout:
-        writer = csv.writer(fout, dialect=csv.excel_tab)
-        # by convention the zeroth edu is the root node
-        for edu1, edu2 in dpack.pairings:
-            writer.writerow(mk_row(edu1, edu2))
+def write_prediction_array(dpack, prediction, filename):
+    """
+    Write predictions given as an array of label numbers (one for each
+    pairing of the datapack, like `dpack.graph.prediction`) to an output
+    file in the same format as :py:func:`write_predictions_output`
+
+    This works from the integer arrays of the datapack, without going
+    through lists of triples.
+    """
+    labels = [_csv_field(x) for x in dpack.labels]
+    row_label = [labels[x] for x in
+                 np.asarray(prediction, dtype=np.intp).tolist()]
+    _write_prediction_rows(dpack, row_label, filename)
+
+
+def write_prediction_binary(prediction, filename):
+    """
+    Write predictions given as an array of label numbers to a binary
+    file: the raw `PREDICTION_DTYPE` label numbers, in the order of the
+    pairings they were predicted for. This can be read back with
+    `np.fromfile(filename, dtype=PREDICTION_DTYPE)` (or
+    :py:func:`load_prediction_binary`), and interpreted with the labels
+    and pairings of that datapack.
+
+    Binary prediction files for consecutive datapacks can be simply
+    concatenated.
+    """
+    np.asarray(prediction, dtype=PREDICTION_DTYPE).tofile(filename)
+
+
+def load_prediction_binary(filename, dpack=None):
+    """
+    Read back predictions written by :py:func:`write_prediction_binary`
+
+    If the datapack the predictions are for is given, check that they
+    have the right length.
+
+    :rtype: 1D array of `PREDICTION_DTYPE`
+    """
+    prediction = np.fromfile(filename, dtype=PREDICTION_DTYPE)
+    if dpack is not None and len(prediction) != len(dpack):
+        oops = ('The predictions file {pfile} has {num} predictions but '
+                'the datapack has {expected} pairings')
+        raise IoException(oops.format(pfile=filename,
+                                      num=len(prediction),
+                                      expected=len(dpack)))
+    return prediction
 
 
 def load_predictions(edu_file):
@@ -326,26 +854,45 @@ def load_predictions(edu_file):
                                           num=len(row),
                                           expected=expected_len,
                                           row=row))
-        return tuple(x.decode('utf-8') for x in row)
+        return tuple(decoded(x) for x in row)
+
+    # the same ids and labels come back over and over
+    cache = {}
+
+    def decoded(field):
+        'decode a field'
+        res = cache.get(field)
+        if res is None:
+            res = cache[field] = field.decode('utf-8')
+        return res
 
     with open(edu_file, 'rb') as instream:
-        reader = csv.reader(instream, dialect=csv.excel_tab)
-        return [mk_pair(r) for r in reader if r]
+        contents = instream.read()
+    if b'"' in contents:
+        # quoted fields: leave it to the csv module
+        reader = csv.reader(six.BytesIO(contents), dialect=csv.excel_tab)
+        rows = (r for r in reader if r)
+    else:
+        rows = (line.split(b'\t') for line in contents.splitlines()
+                if line)
+    return [mk_pair(r) for r in rows]
 
 
-def load_gold_predictions(pairings_file, feature_file, verbose=False):
+def load_gold_predictions(pairings_file, feature_file, n_jobs=1,
+                          verbose=False):
     """
     Load a pairings and feature file as though it were a set of
     predictions
 
+    The features file is read with `n_jobs` processes (see
+    :py:func:`load_svmlight_chunked`)
+
     :rtype: [(string, string, string)]
     """
     pairings = load_pairings(pairings_file)
     with Torpor("Reading features", quiet=not verbose):
         labels = load_labels(feature_file)
-        # pylint: disable=unbalanced-tuple-unpacking
-        _, targets = load_svmlight_file(feature_file)
-        # pylint: enable=unbalanced-tuple-unpacking
+        _, targets = load_svmlight_chunked(feature_file, n_jobs=n_jobs)
     return [(x1, x2, get_label_string(labels, t))
             for ((x1, x2), t) in zip(pairings, targets)]
 
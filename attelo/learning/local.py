@@ -195,7 +195,7 @@ class SklearnLabelClassifier(LabelClassifier, SklearnClassifier):
 
         # WIP overwrite only the labelling scores of non-fixed pairs
         if nonfixed_pairs is not None:
-            lbl_scores = np.copy(dpack.graph.label)
+            lbl_scores = np.copy(dpack.graph.dense_label())
             lbl_scores[nonfixed_pairs] = lbl_scores_pred
         else:
             lbl_scores = lbl_scores_pred
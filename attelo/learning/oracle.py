@@ -102,6 +102,7 @@ class LabelOracle(LabelClassifier):
         lbl_unk = dpack.label_number(UNKNOWN)
 
         if nonfixed_pairs is not None:
+            old_weights = dpack.graph.dense_label()
             for i, lbl in enumerate(dpack.target):
                 if i in nonfixed_pairs:
                     if lbl == lbl_unrelated:
@@ -109,7 +110,7 @@ class LabelOracle(LabelClassifier):
                     else:
                         weights[i, lbl] = 1.0
                 else:
-                    weights[i, :] = dpack.graph.label[i]
+                    weights[i, :] = old_weights[i]
         else:
             for i, lbl in enumerate(dpack.target):
                 if lbl == lbl_unrelated:
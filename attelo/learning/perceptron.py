@@ -21,6 +21,7 @@ from numpy.linalg import norm
 from numpy import dot, zeros, sign
 from scipy.special import expit  # aka the logistic function
 import numpy as np
+import scipy.sparse
 
 from attelo.decoding.util import prediction_to_triples
 from attelo.metrics.tree import tree_loss
@@ -69,6 +70,10 @@ class Perceptron(object):
         self.weights = None
         self.avg_weights = None
         self.can_predict_proba = use_prob
+        # lazy averaging: number of training steps so far, and the
+        # step up to which each averaged weight is up to date
+        self._nb_steps = 0
+        self._avg_stamps = None
 
     def fit(self, X, Y):  # X contains all EDU pairs for corpus
         """ learn perceptron weights """
@@ -93,6 +98,36 @@ class Perceptron(object):
             print("FEAT. SPACE SIZE:", dim)
         self.weights = zeros(dim, dtype='d')
         self.avg_weights = zeros(dim, dtype='d')
+        self._nb_steps = 0
+        self._avg_stamps = zeros(dim, dtype=np.int64)
+
+    def _update_weights(self, indices, values):
+        """Add `values` to the weights at the given (distinct) `indices`,
+        leaving the other weights alone.
+
+        The averaged weights are the sum of the weights after each
+        training step, but we only bring them up to date for the
+        weights that change (see :py:meth:`_end_step` and
+        :py:meth:`_finish_average`), so the cost of an update is
+        proportional to the number of indices
+        """
+        if self.avg:
+            stale = self._nb_steps - self._avg_stamps[indices]
+            self.avg_weights[indices] += stale * self.weights[indices]
+            self._avg_stamps[indices] = self._nb_steps
+        self.weights[indices] += values
+
+    def _end_step(self):
+        """Count one training step (ie. one more copy of the current
+        weights in the averaged weights)"""
+        self._nb_steps += 1
+
+    def _finish_average(self):
+        """Bring all the averaged weights up to date"""
+        if self.avg:
+            stale = self._nb_steps - self._avg_stamps
+            self.avg_weights += stale * self.weights
+            self._avg_stamps[:] = self._nb_steps
 
     def learn(self, X, Y):
         verbose = self.verbose
@@ -100,6 +135,11 @@ class Perceptron(object):
             print("-"*100, file=sys.stderr)
             print("Training...", file=sys.stderr)
             start_time = time.time()
+        # sparse updates need each row to have distinct indices
+        X = X.tocsr()
+        if not X.has_canonical_format:
+            X = X.copy()
+            X.sum_duplicates()
 
         for n in xrange(self.nber_it):
             if verbose > 1:
@@ -127,21 +167,22 @@ class Perceptron(object):
                                                round(loss, 6)),
                       file=sys.stderr)
                 print("\ttime = %-4s" % round(t1 - t0, 3), file=sys.stderr)
+        self._finish_average()
         if verbose > 1:
             elapsed_time = t1 - start_time
             print("done in %s sec." % round(elapsed_time, 3), file=sys.stderr)
 
     def update(self, Y_j_hat, Y_j, X_j, score):
-        """ simple perceptron update rule"""
+        """ simple perceptron update rule
+
+        `X_j` is a single (sparse) row; only the weights of its
+        non-zero features are touched
+        """
         upd = self.eta0
-        X_j = X_j.toarray()
         error = (Y_j_hat != Y_j)
-        W = self.weights
         if error:
-            W = W + upd * Y_j * X_j
-            self.weights = W
-        if self.avg:
-            self.avg_weights = self.avg_weights + W
+            self._update_weights(X_j.indices, upd * Y_j * X_j.data)
+        self._end_step()
         return int(error)
 
     def _classify(self, X, W):
@@ -207,8 +248,6 @@ class PassiveAggressive(Perceptron):
         lr = "pa1" if self.loss == "hinge" else "pa2"
         # end should be in fit()
 
-        X_j = X_j.toarray()
-        W = self.weights
         C = self.C
         # rename to match sklearn naming
         p = score
@@ -221,28 +260,26 @@ class PassiveAggressive(Perceptron):
             loss_py = 0.0
         # end loss.loss(p, y)
 
+        # X_j is a sparse row: its norm is that of its non-zeros
         if lr == "pa1":
-            x_norm = norm(X_j)
+            x_norm = norm(X_j.data)
             if x_norm == 0:
                 upd = 0
             else:
                 upd = x_norm**2
                 upd = min(C, loss_py / upd)
         else:  # "pa2"
-            x_norm = norm(X_j)
+            x_norm = norm(X_j.data)
             upd = x_norm**2
             upd = loss_py / (upd + 0.5 / C)
 
         # sign the update
         upd *= Y_j
 
-        # update weights
-        W = W + upd * X_j
-        self.weights = W
-
-        # update the average weights
-        if self.avg:
-            self.avg_weights = self.avg_weights + W
+        # update weights (and the average weights, lazily)
+        if upd != 0:
+            self._update_weights(X_j.indices, upd * X_j.data)
+        self._end_step()
 
         return loss_py
 
@@ -359,6 +396,8 @@ class StructuredPerceptron(Perceptron):
             print("FEAT. SPACE SIZE:", dim)
         self.weights = zeros(dim, dtype='d')
         self.avg_weights = zeros(dim, dtype='d')
+        self._nb_steps = 0
+        self._avg_stamps = zeros(dim, dtype=np.int64)
 
     def fit(self, datapacks, _targets, nonfixed_pairs=None):
         """Learn structured perceptron weights.
@@ -459,6 +498,7 @@ class StructuredPerceptron(Perceptron):
                                                round(avg_loss, 6)),
                       file=sys.stderr)
                 print("\ttime = %-4s" % round(t1-t0, 3), file=sys.stderr)
+        self._finish_average()
         if verbose > 1:
             elapsed_time = t1-start_time
             print("done in %s sec." % round(elapsed_time, 3), file=sys.stderr)
@@ -473,62 +513,64 @@ class StructuredPerceptron(Perceptron):
             defined.
         """
         upd = self.eta0
-        # rt = [(t[0].span(),t[1].span()) for t in ref_tree]
-        # pt = [(t[0].span(),t[1].span()) for t in pred_tree]
-        # print("REF TREE:", rt)
-        # print("PRED TREE:", pt)
-        # print("INTER:", set(pt) & set(rt))
         W = self.weights
-        # print("IN W:", W)
-        # error = not( set(pred_tree) == set(ref_tree) )
-
-        # compute Phi(x,y) and Phi(x,y_hat)
-        ref_fv = zeros(len(W), dtype='d')
-        pred_fv = zeros(len(W), dtype='d')
-        if nonfixed_pairs is None:
-            for ref_arc in ref_tree:
-                id1, id2, _ = ref_arc
-                i = fv_map[id1, id2]
-                ref_fv = ref_fv + X[i].toarray()
-            for pred_arc in pred_tree:
-                id1, id2, _ = pred_arc
-                i = fv_map[id1, id2]
-                pred_fv = pred_fv + X[i].toarray()
-        else:
-            for ref_arc in ref_tree:
-                id1, id2, _ = ref_arc
-                i = fv_map[id1, id2]
-                if i in nonfixed_pairs:
-                    ref_fv = ref_fv + X[i].toarray()
-            for pred_arc in pred_tree:
-                id1, id2, _ = pred_arc
-                i = fv_map[id1, id2]
-                if i in nonfixed_pairs:
-                    pred_fv = pred_fv + X[i].toarray()
 
         # Phi(x,y) - Phi(x,y_hat)
-        delta_fv = ref_fv - pred_fv
+        delta_idx, delta_val = self._delta_fv(pred_tree, ref_tree, X, fv_map,
+                                              nonfixed_pairs=nonfixed_pairs)
 
         # structured loss
-        loss_py = float(dot(W, (pred_fv - ref_fv).T))
+        loss_py = -float(dot(W[delta_idx], delta_val))
         # add cost sensitive term
         tloss = self.cost_function(ref_tree, pred_tree, edus)
         # loss_py is not used for the update here, just
         # for the return value to display avg loss
         loss_py += sqrt(tloss)
 
-        # update weights
+        # update weights (and the average weights, lazily)
         if tloss != 0:
-            W = W + upd * delta_fv
-        self.weights = W
-        # print("OUT W:", W)
-
-        # update the average weights
-        if self.avg:
-            self.avg_weights = self.avg_weights + W
+            self._update_weights(delta_idx, upd * delta_val)
+        self._end_step()
 
         return loss_py
 
+    @staticmethod
+    def _delta_fv(pred_tree, ref_tree, X, fv_map, nonfixed_pairs=None):
+        """Phi(x,y) - Phi(x,y_hat): the sum of the feature vectors of
+        the reference arcs, minus that of the predicted arcs (only
+        counting the nonfixed pairs if these are given)
+
+        Returns
+        -------
+        indices: 1D array of int
+            Features that may have a non-zero difference (distinct)
+
+        values: 1D array of float
+            Difference for each of these features
+        """
+        ref_rows = np.fromiter((fv_map[id1, id2] for id1, id2, _ in ref_tree),
+                               dtype=np.intp, count=len(ref_tree))
+        pred_rows = np.fromiter((fv_map[id1, id2]
+                                 for id1, id2, _ in pred_tree),
+                                dtype=np.intp, count=len(pred_tree))
+        if nonfixed_pairs is not None:
+            is_nonfixed = np.zeros(X.shape[0], dtype=bool)
+            is_nonfixed[nonfixed_pairs] = True
+            ref_rows = ref_rows[is_nonfixed[ref_rows]]
+            pred_rows = pred_rows[is_nonfixed[pred_rows]]
+        rows = np.concatenate([ref_rows, pred_rows])
+        coefs = np.concatenate([np.ones(len(ref_rows)),
+                                -np.ones(len(pred_rows))])
+        # a single sparse row: (+1 for each ref arc, -1 for each predicted
+        # one) . X ; only the rows of the arcs are looked at
+        arcs = scipy.sparse.csr_matrix((coefs,
+                                        (np.zeros(len(rows), dtype=np.intp),
+                                         rows)),
+                                       shape=(1, X.shape[0]))
+        delta = (arcs * X).tocsr()
+        delta.sum_duplicates()
+        return delta.indices, delta.data
+
     def _classify(self, dpack, X, W, nonfixed_pairs=None):
         """ return predicted tree """
         num_items = len(dpack)
@@ -541,7 +583,7 @@ class StructuredPerceptron(Perceptron):
             prediction = np.empty(num_items)
         else:
             scores = np.copy(dpack.graph.attach)
-            label = np.copy(dpack.graph.label)
+            label = np.copy(dpack.graph.dense_label())
             prediction = np.copy(dpack.graph.prediction)
 
         # compute attachment scores of all EDU pairs
@@ -630,36 +672,14 @@ class StructuredPassiveAggressive(StructuredPerceptron):
 
         W = self.weights
         C = self.C
-        # compute Phi(x,y) and Phi(x,y_hat)
-        ref_fv = zeros(len(W), dtype='d')
-        pred_fv = zeros(len(W), dtype='d')
-        if nonfixed_pairs is None:
-            for ref_arc in ref_tree:
-                id1, id2, _ = ref_arc
-                i = fv_map[id1, id2]
-                ref_fv = ref_fv + X[i].toarray()
-            for pred_arc in pred_tree:
-                id1, id2, _ = pred_arc
-                i = fv_map[id1, id2]
-                pred_fv = pred_fv + X[i].toarray()
-        else:
-            for ref_arc in ref_tree:
-                id1, id2, _ = ref_arc
-                i = fv_map[id1, id2]
-                if i in nonfixed_pairs:
-                    ref_fv = ref_fv + X[i].toarray()
-            for pred_arc in pred_tree:
-                id1, id2, _ = pred_arc
-                i = fv_map[id1, id2]
-                if i in nonfixed_pairs:
-                    pred_fv = pred_fv + X[i].toarray()
 
         # Phi(x,y) - Phi(x,y_hat)
-        delta_fv = ref_fv - pred_fv
-        delta_fv_norm = norm(delta_fv)
+        delta_idx, delta_val = self._delta_fv(pred_tree, ref_tree, X, fv_map,
+                                              nonfixed_pairs=nonfixed_pairs)
+        delta_fv_norm = norm(delta_val)
 
         # structured loss
-        loss_py = float(dot(W, (pred_fv - ref_fv).T))
+        loss_py = -float(dot(W[delta_idx], delta_val))
         # add cost sensitive term
         tloss = self.cost_function(ref_tree, pred_tree, edus)
         loss_py += sqrt(tloss)
@@ -674,13 +694,10 @@ class StructuredPassiveAggressive(StructuredPerceptron):
             upd = delta_fv_norm**2
             upd = loss_py / (upd + 0.5 / C)
 
-        # update weights
-        W = W + upd * delta_fv
-        self.weights = W
-
-        # update the average weights
-        if self.avg:
-            self.avg_weights = self.avg_weights + W
+        # update weights (and the average weights, lazily)
+        if upd != 0:
+            self._update_weights(delta_idx, upd * delta_val)
+        self._end_step()
 
         return loss_py
 
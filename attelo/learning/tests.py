@@ -0,0 +1,64 @@
+"""
+attelo.learning tests
+"""
+
+from __future__ import print_function
+
+import numpy as np
+import scipy.sparse
+import unittest
+
+from .perceptron import (PassiveAggressive,
+                         Perceptron,
+                         StructuredPerceptron)
+
+
+class PerceptronTest(unittest.TestCase):
+    """
+    Perceptron-like learners
+    """
+    def test_lazy_average(self):
+        'sparse updates give the same (averaged) weights as dense ones'
+        rng = np.random.RandomState(0)
+        data = scipy.sparse.random(50, 30, density=0.1, format='csr',
+                                   random_state=rng)
+        target = np.where(rng.uniform(size=50) < 0.5, -1, 1)
+        for learner in [Perceptron(n_iter=3, average=True),
+                        PassiveAggressive(n_iter=3, average=True)]:
+            learner.init_model(data)
+            # replay the training, keeping the dense weights after
+            # each step
+            weights = np.zeros(data.shape[1])
+            avg_weights = np.zeros(data.shape[1])
+            for _ in range(learner.nber_it):
+                for i in range(data.shape[0]):
+                    y_hat, score = learner._classify(data[i],
+                                                     learner.weights)
+                    learner.update(y_hat, target[i], data[i], score)
+                    weights = learner.weights.copy()
+                    avg_weights += weights
+            learner._finish_average()
+            self.assertTrue(np.allclose(weights, learner.weights))
+            self.assertTrue(np.allclose(avg_weights, learner.avg_weights))
+            # and fit does the same thing
+            fitted = learner.fit(data, target)
+            self.assertTrue(np.allclose(avg_weights, fitted.avg_weights))
+
+    def test_delta_fv(self):
+        'sparse difference between reference and predicted features'
+        data = scipy.sparse.csr_matrix([[1, 0, 2, 0],
+                                        [0, 3, 2, 0],
+                                        [0, 0, 0, 4],
+                                        [5, 0, 0, 0]], dtype=float)
+        fv_map = {('a', 'b'): 0, ('b', 'c'): 1, ('a', 'c'): 2, ('c', 'b'): 3}
+        ref_tree = [('a', 'b', 'x'), ('b', 'c', 'x')]
+        pred_tree = [('a', 'b', 'x'), ('a', 'c', 'x'), ('c', 'b', 'x')]
+        for nonfixed, expected in [(None, [-5, 3, 2, -4]),
+                                   ([0, 2], [0, 0, 0, -4]),
+                                   ([1, 3], [-5, 3, 2, 0])]:
+            indices, values = StructuredPerceptron._delta_fv(
+                pred_tree, ref_tree, data, fv_map, nonfixed_pairs=nonfixed)
+            delta = np.zeros(data.shape[1])
+            delta[indices] = values
+            self.assertEqual(len(set(indices)), len(indices))
+            self.assertEqual(expected, delta.tolist())
@@ -75,6 +75,14 @@ class State(with_metaclass(ABCMeta, object)):
     def __hash__(self):
         return hash(self.data())
 
+    def signature(self):
+        """
+        canonical (hashable) description of the state: two states with
+        the same signature have the same future, so a search only needs
+        to explore the cheapest of them
+        """
+        return self.data()
+
     @abstractmethod
     def is_solution(self):
         "return `True` if the state is a valid solution"
@@ -165,13 +173,13 @@ class Search(with_metaclass(ABCMeta, object)):
         """
         Return `True` if the given search state has already been seen
         """
-        return hash(state) in self._seen
+        return state.signature() in self._seen
 
     def add_seen(self, state):
         """
         Mark a state as seen
         """
-        self._seen[hash(state)] = state
+        self._seen[state.signature()] = state
 
     def launch(self, init_state,
                verbose=False,
@@ -222,10 +230,109 @@ class Search(with_metaclass(ABCMeta, object)):
         raise StopIteration
 
 
+class BoundedQueue(object):
+    """
+    Priority queue of search states that holds at most `capacity` states,
+    keeping the best ones (in the order of :py:meth:`State.__lt__`)
+
+    We keep the states in two heaps, one for the best state (to be
+    explored next) and one for the worst (to be evicted when the queue
+    overflows). States removed from one heap are only marked as dead
+    in the other, and swept away when they reach its top, so insertion
+    and removal take O(log k) time. A state that is no better than the
+    worst of a full queue is rejected without touching the heaps.
+
+    Ties are broken by order of insertion (first in is explored first,
+    last in is evicted first), so the search is deterministic.
+
+    :param capacity: maximum number of states in the queue
+    :type capacity: int
+    """
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("beam size must be positive: %d" % capacity)
+        self._capacity = capacity
+        self._best = []  # min-heap of [key, count, state, alive]
+        self._worst = []  # min-heap of (reversed key, entry)
+        self._size = 0
+        self._counter = 0
+
+    @staticmethod
+    def _key(state):
+        "sort key equivalent to :py:meth:`State.__lt__`"
+        return (state.total_cost(), -state.cost())
+
+    def __len__(self):
+        return self._size
+
+    def __repr__(self):
+        return repr(sorted(entry[2] for entry in self._best if entry[3]))
+
+    def _sweep(self, heap, get_entry):
+        "remove the dead entries at the top of a heap"
+        while heap and not get_entry(heap[0])[3]:
+            heapq.heappop(heap)
+
+    def worst(self):
+        """
+        Return the worst state in the queue (`None` if empty)
+        """
+        self._sweep(self._worst, lambda x: x[1])
+        return self._worst[0][1][2] if self._worst else None
+
+    def push(self, state):
+        """
+        Add a state to the queue, evicting the worst state if it is
+        full.
+
+        :rtype: bool
+        :returns: `False` if the state was rejected
+        """
+        key = self._key(state)
+        if self._size >= self._capacity:
+            self._sweep(self._worst, lambda x: x[1])
+            worst = self._worst[0][1]
+            # states that come after the worst one are rejected
+            # straight away (including ties, the newcomer loses)
+            if key >= worst[0]:
+                return False
+            heapq.heappop(self._worst)
+            worst[3] = False
+            self._size -= 1
+        entry = [key, self._counter, state, True]
+        rkey = (-key[0], -key[1], -self._counter)
+        self._counter += 1
+        heapq.heappush(self._best, entry)
+        heapq.heappush(self._worst, (rkey, entry))
+        self._size += 1
+        # dead entries never outnumber the live ones
+        if len(self._best) > 2 * self._size + 1:
+            self._best = [x for x in self._best if x[3]]
+            heapq.heapify(self._best)
+        if len(self._worst) > 2 * self._size + 1:
+            self._worst = [x for x in self._worst if x[1][3]]
+            heapq.heapify(self._worst)
+        return True
+
+    def pop(self):
+        """
+        Return and remove the best state in the queue
+        """
+        self._sweep(self._best, lambda x: x)
+        entry = heapq.heappop(self._best)
+        entry[3] = False
+        self._size -= 1
+        return entry[2]
+
+
 class BeamSearch(Search):
     """
     search with heuristics but limited size waiting queue
     (restrict to p-best solutions at each iteration)
+
+    The queue is a :py:class:`BoundedQueue`, so successors are inserted
+    in O(log p) and the ones that could not enter the beam are
+    dropped as soon as they are built.
     """
     def __init__(self,
                  heuristic=lambda x: 0.,
@@ -234,16 +341,30 @@ class BeamSearch(Search):
         super(BeamSearch, self).__init__(heuristic=heuristic,
                                          shared=shared,
                                          queue_size=queue_size)
+        self.reset_queue()
 
     def new_state(self, data):
         raise NotImplementedError
 
+    def reset_queue(self):
+        if self._queue_size is None:
+            super(BeamSearch, self).reset_queue()
+        else:
+            self._todo = BoundedQueue(self._queue_size)
+
     def add_queue(self, items, ancestor_cost):
+        if self._queue_size is None:
+            return super(BeamSearch, self).add_queue(items, ancestor_cost)
         # each item must be a successor and a cost
         for one, cost in items:
             succ = self.new_state(one)
             succ.update_cost(ancestor_cost + cost)
-            heapq.heappush(self._todo, succ)
-        if self._queue_size is not None:
-            new = heapq.nsmallest(self._queue_size, self._todo)
-            self._todo = new
+            self._todo.push(succ)
+
+    def pop_best(self):
+        if self._queue_size is None:
+            return super(BeamSearch, self).pop_best()
+        return self._todo.pop()
+
+    def has_empty_queue(self):
+        return len(self._todo) == 0
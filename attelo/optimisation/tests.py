@@ -7,7 +7,7 @@ from math import log
 import sys
 import unittest
 
-from .astar import BeamSearch, Search, State
+from .astar import BeamSearch, BoundedQueue, Search, State
 
 # pylint: disable=too-few-public-methods, protected-access
 
@@ -102,3 +102,27 @@ class AstarTest(unittest.TestCase):
                  ("Beam/h0/100", TestBeamSearch(h_zero, queue_size=100))]
         for name, search in tests:
             self._test_search(name, search)
+
+
+class BoundedQueueTest(unittest.TestCase):
+    'Tests for the beam search queue'
+
+    def test_bounded_queue(self):
+        'the queue keeps the best states, pops them in order'
+        h_zero = lambda x: 0
+        costs = [5, 3, 8, 1, 9, 3, 7, 2, 6, 4]
+        queue = BoundedQueue(4)
+        for i, cost in enumerate(costs):
+            state = TestState((i, ""), h_zero)
+            state.update_cost(cost)
+            queue.push(state)
+            self.assertEqual(min(i + 1, 4), len(queue))
+        self.assertEqual(3, queue.worst().cost())
+        # cannot enter the beam
+        state = TestState((10, ""), h_zero)
+        state.update_cost(4)
+        self.assertFalse(queue.push(state))
+        popped = []
+        while len(queue):
+            popped.append(queue.pop().data()[0])
+        self.assertEqual([3, 7, 1, 5], popped)
@@ -29,13 +29,45 @@ class AttachTimesBestLabel(Parser):
     def transform(self, dpack, nonfixed_pairs=None):
         dpack = self.multiply(dpack)
         weights_a = dpack.graph.attach
-        weights_l = dpack.graph.label
-        weights_best_label = np.ravel(np.amax(weights_l, axis=1))
+        weights_best_label = dpack.graph.best_label_weight()
         weights_a = np.multiply(weights_a, weights_best_label)
         graph = dpack.graph.tweak(attach=weights_a)
         return dpack.set_graph(graph)
 
 
+class CompactWeights(Parser):
+    """
+    Intermediary parser that stores the attachment and label weights
+    of the graph more compactly (see `attelo.table.Graph.compacted`):
+    in single precision, and optionally keeping only the `top_k` best
+    labels of each edge.
+
+    Decoders only look at the attachment weights and the best label
+    of each edge, so this can go anywhere after the last step that
+    assigns label weights.
+    """
+    def __init__(self, dtype=np.float32, top_k=None):
+        """
+        Parameters
+        ----------
+        dtype: numpy dtype
+            type of the attachment and label weights
+        top_k: int, optional
+            number of label weights to keep for each edge
+            (all of them if unset)
+        """
+        self._dtype = dtype
+        self._top_k = top_k
+
+    def fit(self, dpacks, targets, nonfixed_pairs=None, cache=None):
+        return
+
+    def transform(self, dpack, nonfixed_pairs=None):
+        dpack = self.multiply(dpack)
+        graph = dpack.graph.compacted(dtype=self._dtype, top_k=self._top_k)
+        return dpack.set_graph(graph)
+
+
 class JointPipeline(Pipeline):
     """
     Parser that performs attach, direction, and labelling tasks.
@@ -58,13 +90,16 @@ class JointPipeline(Pipeline):
     def __init__(self,
                  learner_attach,
                  learner_label,
-                 decoder):
+                 decoder,
+                 compact=None):
         """
         Parameters
         ----------
         attach_learner: AttachClassifier
         label_learner: LabelClassifier
         decoder: Decoder
+        compact: CompactWeights, optional
+            if set, compact the weights before decoding
         """
         if not learner_attach.can_predict_proba:
             raise ValueError('Attachment model does not know how to predict '
@@ -73,9 +108,11 @@ class JointPipeline(Pipeline):
             raise ValueError('Relation labelling model does not '
                              'know how to predict probabilities')
         steps = [('attach weights', AttachClassifierWrapper(learner_attach)),
-                 ('label weights', LabelClassifierWrapper(learner_label)),
-                 ('attach x best label', AttachTimesBestLabel()),
-                 ('decoder', decoder)]
+                 ('label weights', LabelClassifierWrapper(learner_label))]
+        if compact is not None:
+            steps.append(('compact weights', compact))
+        steps.extend([('attach x best label', AttachTimesBestLabel()),
+                      ('decoder', decoder)])
         super(JointPipeline, self).__init__(steps=steps)
 
 
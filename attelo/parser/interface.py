@@ -3,6 +3,7 @@ Basic interface that all parsers should respect
 """
 
 import numpy as np
+import scipy.sparse
 
 from abc import ABCMeta, abstractmethod
 from six import with_metaclass
@@ -55,6 +56,9 @@ class Parser(with_metaclass(ABCMeta, object)):
 
             if label is None:
                 label = gra.label
+            elif scipy.sparse.issparse(gra.label):
+                # compacted graph: only the top labels are kept
+                label = scipy.sparse.csr_matrix(gra.label.multiply(label))
             else:
                 label = np.multiply(label, gra.label)
         graph = Graph(prediction=prediction,
@@ -17,7 +17,7 @@ from attelo.table import (DataPack,
                           UNRELATED,
                           idxes_inter,
                           idxes_intra,
-                          locate_in_subpacks,
+                          subpack_rows,
                           grouped_intra_pairings)
 from .interface import (Parser)
 
@@ -62,26 +62,21 @@ def for_intra(dpack, target):
     target : array(int)
 
     """
-    # map EDUs to subgroup ids ; intra = pairs of EDUs with same subgroup id
-    grp = {e.id: e.subgrouping for e in dpack.edus}
+    # intra = pairs of EDUs with same subgroup
+    table = dpack.edu_table
+    src, tgt = dpack.src_idx, dpack.tgt_idx
+    same_sent = table.subgrouping[src] == table.subgrouping[tgt]
+    from_root = table.is_root[src]
     # find all edus that have intra incoming edges (to rule out)
     unrelated = dpack.label_number(UNRELATED)
-    intra_tgts = defaultdict(set)
-    for i, (edu1, edu2) in enumerate(dpack.pairings):
-        if (grp[edu1.id] == grp[edu2.id]
-            and target[i] != unrelated):
-            # edu2 has an incoming relation => not an (intra) root
-            intra_tgts[grp[edu2.id]].add(edu2.id)
+    attached = target != unrelated
+    has_intra_parent = np.zeros(len(table), dtype=bool)
+    has_intra_parent[tgt[same_sent & attached]] = True
     # pick out the (fakeroot, edu) pairs where edu does not have
     # incoming intra edges
-    all_heads = [i for i, (edu1, edu2) in enumerate(dpack.pairings)
-                 if (edu1.id == FAKE_ROOT_ID
-                     and edu2.id not in intra_tgts[grp[edu2.id]])]
+    all_heads = np.flatnonzero(from_root & ~has_intra_parent[tgt])
     # NEW pick out the original inter-sentential links, for removal
-    inter_links = [i for i, (edu1, edu2) in enumerate(dpack.pairings)
-                   if (edu1.id != FAKE_ROOT_ID
-                       and grp[edu1.id] != grp[edu2.id]
-                       and target[i] != unrelated)]
+    inter_links = np.flatnonzero(~from_root & ~same_sent & attached)
 
     # update datapack and target accordingly
     new_target = np.copy(dpack.target)
@@ -93,14 +88,18 @@ def for_intra(dpack, target):
     # FIXME replace each ctgt with the list of intra-sentential
     # RST (sub)trees
     # end WIP ctarget
-    dpack = DataPack(edus=dpack.edus,
-                     pairings=dpack.pairings,
-                     data=dpack.data,
-                     target=new_target,
-                     ctarget=new_ctarget,
-                     labels=dpack.labels,
-                     vocab=dpack.vocab,
-                     graph=dpack.graph)
+    # pylint: disable=protected-access
+    dpack = dpack._share_pairing_memos(
+        DataPack(edus=dpack.edus,
+                 pairings=dpack.pairings,
+                 data=dpack.data,
+                 target=new_target,
+                 ctarget=new_ctarget,
+                 labels=dpack.labels,
+                 vocab=dpack.vocab,
+                 graph=dpack.graph,
+                 stacking=dpack.stacking))
+    # pylint: enable=protected-access
     target = np.copy(target)
     target[all_heads] = dpack.label_number('ROOT')
     target[inter_links] = unrelated  # NEW
@@ -389,26 +388,21 @@ class IntraInterParser(with_metaclass(ABCMeta, Parser)):
         return dpack_pred
 
     @staticmethod
-    def _mk_get_lbl(dpack, subpacks):
+    def _subpack_labels(dpack, subpacks):
         """
-        Return a function that retrieves the label for an
-        item within one of the subpacks, or None if it's
-        not present
+        Return the label predicted for each pairing of the datapack
+        in the subpack it is in (-1 if it is in none of them)
 
         Return
         ------
-        get_lbl: int -> int or None
+        labels: 1D array of int
         """
-        sub_idxes = locate_in_subpacks(dpack, subpacks)
-
-        def get_lbl(i):
-            'retrieve lbl if present'
-            if sub_idxes[i] is None:
-                return None
-            else:
-                spack, j = sub_idxes[i]
-                return spack.graph.prediction[j]
-        return get_lbl
+        labels = np.empty(len(dpack), dtype=np.int16)
+        labels[:] = -1
+        for spack, rows in zip(subpacks, subpack_rows(dpack, subpacks)):
+            found = rows >= 0
+            labels[rows[found]] = spack.graph.prediction[found]
+        return labels
 
     @abstractmethod
     def _recombine(self, dpack, spacks):
@@ -445,20 +439,19 @@ class IntraInterParser(with_metaclass(ABCMeta, Parser)):
         # NB this code was moved here from SoftParser._recombine()
         # it probably leaves room for improvement, notably speedups
         unrelated_lbl = dpack.label_number(UNRELATED)
-        sent_lbl = self._mk_get_lbl(dpack, spacks)
+        sent_lbls = self._subpack_labels(dpack, spacks)
 
         # tweak intra-sentential attachment and labelling scores
+        # (but don't confuse the inter parser with sentence roots)
+        from_root = dpack.edu_table.is_root[dpack.src_idx]
+        fixed = np.flatnonzero(~from_root &
+                               (sent_lbls >= 0) &
+                               (sent_lbls != unrelated_lbl))
         weights_a = np.copy(dpack.graph.attach)
-        weights_l = np.copy(dpack.graph.label)
-        for i, (edu1, edu2) in enumerate(dpack.pairings):
-            if edu1.id == FAKE_ROOT_ID:
-                # don't confuse the inter parser with sentence roots
-                continue
-            lbl = sent_lbl(i)
-            if lbl is not None and lbl != unrelated_lbl:
-                weights_a[i] = 1.0
-                weights_l[i] = np.zeros(len(dpack.labels))
-                weights_l[i, lbl] = 1.0
+        weights_l = np.copy(dpack.graph.dense_label())
+        weights_a[fixed] = 1.0
+        weights_l[fixed] = 0.0
+        weights_l[fixed, sent_lbls[fixed]] = 1.0
 
         # FIXME "legacy" code that used to be in learning.oracle
         # it looks simpler thus better than what precedes, but is it
@@ -490,11 +483,11 @@ class IntraInterParser(with_metaclass(ABCMeta, Parser)):
         """
         unrelated_lbl = dpack.label_number(UNRELATED)
         # intra-sentential predictions
-        sent_lbl = self._mk_get_lbl(dpack, spacks)
+        sent_lbls = self._subpack_labels(dpack, spacks)
 
         idxes_intra_pred = [i for i, (edu1, edu2) in enumerate(dpack.pairings)
                             if (edu1.subgrouping == edu2.subgrouping and
-                                sent_lbl(i) != unrelated_lbl)]
+                                sent_lbls[i] != unrelated_lbl)]
         idxes_intra_true = [i for i, (edu1, edu2) in enumerate(dpack.pairings)
                             if (edu1.subgrouping == edu2.subgrouping and
                                 dpack.target[i] != unrelated_lbl)]
@@ -521,28 +514,13 @@ class SentOnlyParser(IntraInterParser):
     def _recombine(self, dpack, spacks):
         "join sentences by parsing their heads"
         unrelated_lbl = dpack.label_number(UNRELATED)
-        sent_lbl = self._mk_get_lbl(dpack, spacks)
-
-        def merged_lbl(i, pair):
-            """Doc label where relevant else sentence label.
-
-            Returns
-            -------
-            lbl: string
-                Predicted (intra-sentential) label ; UNRELATED for
-                missing values (None) and when EDU1 is the fake root.
-            """
-            edu1, _ = pair
-            lbl = sent_lbl(i)
-            # UNRELATED for missing values and edges from the fake root
-            if lbl is None or edu1.id == FAKE_ROOT_ID:
-                lbl = unrelated_lbl
-            return lbl
-
-        # merge results
-        prediction = np.fromiter((merged_lbl(i, pair)
-                                  for i, pair in enumerate(dpack.pairings)),
-                                 dtype=np.dtype(np.int16))
+        sent_lbls = self._subpack_labels(dpack, spacks)
+        # merge results: predicted (intra-sentential) label ; UNRELATED
+        # for missing values and edges from the fake root
+        from_root = dpack.edu_table.is_root[dpack.src_idx]
+        prediction = np.where((sent_lbls < 0) | from_root,
+                              unrelated_lbl,
+                              sent_lbls).astype(np.int16)
         graph = dpack.graph.tweak(prediction=prediction)
         dpack = dpack.set_graph(graph)
         return dpack
@@ -579,20 +557,15 @@ class HeadToHeadParser(IntraInterParser):
         """
         # identify sentence heads
         unrelated_lbl = dpack.label_number(UNRELATED)
-        sent_lbl = self._mk_get_lbl(dpack, spacks)
-        head_ids = [edu2.id for i, (edu1, edu2) in enumerate(dpack.pairings)
-                    if (edu1.id == FAKE_ROOT_ID and
-                        sent_lbl(i) != unrelated_lbl)]
-
+        sent_lbls = self._subpack_labels(dpack, spacks)
+        table = dpack.edu_table
+        src, tgt = dpack.src_idx, dpack.tgt_idx
+        from_root = table.is_root[src]
         # pick out edges where both elements are
         # a sentence head (or the fake root)
-        def is_head_or_root(edu):
-            'true if an edu is the fake root or a sentence head'
-            return edu.id == FAKE_ROOT_ID or edu.id in head_ids
-
-        idxes = [i for i, (e1, e2) in enumerate(dpack.pairings)
-                 if (is_head_or_root(e1) and
-                     is_head_or_root(e2))]
+        is_head_or_root = np.copy(table.is_root)
+        is_head_or_root[tgt[from_root & (sent_lbls != unrelated_lbl)]] = True
+        idxes = np.flatnonzero(is_head_or_root[src] & is_head_or_root[tgt])
 
         if self._verbose:
             # check for lost inter edges
@@ -611,7 +584,7 @@ class HeadToHeadParser(IntraInterParser):
         "join sentences by parsing their heads"
         unrelated_lbl = dpack.label_number(UNRELATED)
         # intra-sentential predictions
-        sent_lbl = self._mk_get_lbl(dpack, spacks)
+        sent_lbls = self._subpack_labels(dpack, spacks)
 
         if self._verbose:
             # check for lost and hallucinated intra- edges
@@ -623,41 +596,26 @@ class HeadToHeadParser(IntraInterParser):
         if has_inter:
             dpack_inter = self._parsers.inter.transform(dpack_inter)
 
-        doc_lbl = self._mk_get_lbl(dpack, [dpack_inter])
-
-        def merged_lbl(i):
-            """Doc label where relevant else sentence label.
-
-            Returns
-            -------
-            lbl:  string
-                Predicted document-level label, else sentence-level
-                label ; UNRELATED for missing values.
-            """
-            lbl = doc_lbl(i) if has_inter else None
-            # missing document-level prediction: use sentence-level
-            # prediction
-            if lbl is None:
-                lbl = sent_lbl(i)
-            # fallback: it may have fallen through the cracks
-            # (ie. may be neither in a sentence be a head)
-            if lbl is None:
-                lbl = unrelated_lbl
-            return lbl
-
-        # merge results
-        prediction = np.fromiter((merged_lbl(i)
-                                  for i in range(len(dpack))),
-                                 dtype=np.dtype(np.int16))
+        # merge results: predicted document-level label, else
+        # sentence-level label ; UNRELATED for missing values (pairs
+        # that are neither in a sentence nor between heads)
+        if has_inter:
+            doc_lbls = self._subpack_labels(dpack, [dpack_inter])
+        else:
+            doc_lbls = np.empty(len(dpack), dtype=np.int16)
+            doc_lbls[:] = -1
+        prediction = np.where(doc_lbls >= 0, doc_lbls, sent_lbls)
+        prediction = np.where(prediction >= 0, prediction,
+                              unrelated_lbl).astype(np.int16)
         graph = dpack.graph.tweak(prediction=prediction)
         dpack = dpack.set_graph(graph)
 
         if self._verbose:
             # check for hallucinated and lost inter edges
-            inter_edges_pred = [(edu1.id, edu2.id, sent_lbl(i))
+            inter_edges_pred = [(edu1.id, edu2.id, sent_lbls[i])
                                 for i, (edu1, edu2) in enumerate(dpack.pairings)
                                 if (edu1.subgrouping != edu2.subgrouping and
-                                    merged_lbl(i) != unrelated_lbl)]
+                                    prediction[i] != unrelated_lbl)]
             inter_edges_true = [(edu1.id, edu2.id, dpack.target[i])
                                 for i, (edu1, edu2) in enumerate(dpack.pairings)
                                 if (edu1.subgrouping != edu2.subgrouping and
@@ -719,10 +677,10 @@ class FrontierToHeadParser(IntraInterParser):
         """
         # identify sentence heads
         unrelated_lbl = dpack.label_number(UNRELATED)
-        sent_lbl = self._mk_get_lbl(dpack, spacks)
+        sent_lbls = self._subpack_labels(dpack, spacks)
         head_ids = [edu2.id for i, (edu1, edu2) in enumerate(dpack.pairings)
                     if (edu1.id == FAKE_ROOT_ID and
-                        sent_lbl(i) != unrelated_lbl)]
+                        sent_lbls[i] != unrelated_lbl)]
 
         # compute left and right frontiers
         # * first, gather left- and right-most predicted dependents
@@ -730,7 +688,7 @@ class FrontierToHeadParser(IntraInterParser):
         rmost_dep = dict()
         for i, (edu1, edu2) in enumerate(dpack.pairings):
             if ((edu1.subgrouping == edu2.subgrouping and
-                 sent_lbl(i) != unrelated_lbl)):
+                 sent_lbls[i] != unrelated_lbl)):
                 if edu_id2num(edu1.id) < edu_id2num(edu2.id):  # right attach
                     if ((edu1.id not in rmost_dep or
                          (edu1.id in rmost_dep and
@@ -775,10 +733,10 @@ class FrontierToHeadParser(IntraInterParser):
             return (edu1.subgrouping == edu2.subgrouping and
                     ((edu1.id in intra_rfrontier and
                       edu2.id in intra_rfrontier and
-                      sent_lbl(i) != unrelated_lbl) or
+                      sent_lbls[i] != unrelated_lbl) or
                      (edu1.id in intra_lfrontier and
                       edu2.id in intra_lfrontier and
-                      sent_lbl(i) != unrelated_lbl)))
+                      sent_lbls[i] != unrelated_lbl)))
 
         idxes = [i for i, (edu1, edu2) in enumerate(dpack.pairings)
                  if (frontier_to_head_edge(edu1, edu2) or
@@ -820,7 +778,7 @@ class FrontierToHeadParser(IntraInterParser):
         """
         unrelated_lbl = dpack.label_number(UNRELATED)
         # intra-sentential predictions
-        sent_lbl = self._mk_get_lbl(dpack, spacks)
+        sent_lbls = self._subpack_labels(dpack, spacks)
 
         if self._verbose:
             # check for lost and hallucinated intra- edges
@@ -842,32 +800,17 @@ class FrontierToHeadParser(IntraInterParser):
             dpack_inter = self._parsers.inter.transform(
                 dpack_inter, nonfixed_pairs=inter_indices)
 
-        doc_lbl = self._mk_get_lbl(dpack, [dpack_inter])
-
-        def merged_lbl(i):
-            """Doc label where relevant else sentence label.
-
-            Returns
-            -------
-            lbl:  string
-                Predicted document-level label, else sentence-level
-                label ; UNRELATED for missing values.
-            """
-            lbl = doc_lbl(i) if has_inter else None
-            # missing document-level prediction: use sentence-level
-            # prediction
-            if lbl is None:
-                lbl = sent_lbl(i)
-            # fallback: it may have fallen through the cracks
-            # (ie. may be neither in a sentence be a head)
-            if lbl is None:
-                lbl = unrelated_lbl
-            return lbl
-
-        # merge results
-        prediction = np.fromiter((merged_lbl(i)
-                                  for i in range(len(dpack))),
-                                 dtype=np.dtype(np.int16))
+        # merge results: predicted document-level label, else
+        # sentence-level label ; UNRELATED for missing values (pairs
+        # that are neither in a sentence nor between heads)
+        if has_inter:
+            doc_lbls = self._subpack_labels(dpack, [dpack_inter])
+        else:
+            doc_lbls = np.empty(len(dpack), dtype=np.int16)
+            doc_lbls[:] = -1
+        prediction = np.where(doc_lbls >= 0, doc_lbls, sent_lbls)
+        prediction = np.where(prediction >= 0, prediction,
+                              unrelated_lbl).astype(np.int16)
         graph = dpack.graph.tweak(prediction=prediction)
         dpack = dpack.set_graph(graph)
 
@@ -878,11 +821,11 @@ class FrontierToHeadParser(IntraInterParser):
             print('<<< end check intra 2 <<<')
             # check for lost and hallucinated inter- edges
             # TODO turn into _check_inter_edges
-            inter_edges_pred = [(edu1.id, edu2.id, merged_lbl(i))
+            inter_edges_pred = [(edu1.id, edu2.id, prediction[i])
                                 for i, (edu1, edu2)
                                 in enumerate(dpack.pairings)
                                 if (edu1.subgrouping != edu2.subgrouping and
-                                    merged_lbl(i) != unrelated_lbl)]
+                                    prediction[i] != unrelated_lbl)]
             inter_edges_true = [(edu1.id, edu2.id, dpack.target[i])
                                 for i, (edu1, edu2)
                                 in enumerate(dpack.pairings)
@@ -99,7 +99,7 @@ class SimpleLabeller(LabelClassifierWrapper):
     def transform(self, dpack, nonfixed_pairs=None):
         dpack = super(SimpleLabeller, self).transform(
             dpack, nonfixed_pairs=nonfixed_pairs)
-        new_best_lbls = np.argmax(dpack.graph.label, axis=1)
+        new_best_lbls = dpack.graph.best_label()
         unk_lbl = dpack.label_number(UNKNOWN)
         prediction_ = (new if old == unk_lbl else old
                        for old, new in
@@ -29,7 +29,8 @@ from attelo.learning.perceptron import (StructuredPerceptron)
 from attelo.table import (DataPack)
 from attelo.util import (Team)
 
-from .full import (JointPipeline,
+from .full import (CompactWeights,
+                   JointPipeline,
                    PostlabelPipeline)
 from .pipeline import (Pipeline)
 from .intra import (HeadToHeadParser,
@@ -92,6 +93,24 @@ class ParserTest(DecoderTest):
                                    decoder=d)
             self._test_parser(parser)
 
+    def test_compact_joint_parser(self):
+        'compacting the weights should not change the predictions'
+        target = np.array([1, 2, 3, 1, 4, 3])
+        for l, d in itr.product(LEARNERS, DECODERS):
+            parser = JointPipeline(learner_attach=l.attach,
+                                   learner_label=l.label,
+                                   decoder=d)
+            parser.fit([self.dpack], [target])
+            expected = parser.transform(self.dpack).graph.prediction
+            for top_k in [None, 1, 2]:
+                parser = JointPipeline(learner_attach=l.attach,
+                                       learner_label=l.label,
+                                       decoder=d,
+                                       compact=CompactWeights(top_k=top_k))
+                parser.fit([self.dpack], [target])
+                got = parser.transform(self.dpack).graph.prediction
+                self.assertEqual(expected.tolist(), got.tolist())
+
     def test_postlabel_parser(self):
         learners = LEARNERS + [
             Team(attach=StructuredPerceptron(MST_DECODER,
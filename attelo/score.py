@@ -102,6 +102,69 @@ def select_in_pack(dpack, predictions):
             if (id1, id2) in pairing_ids]
 
 
+def _is_aligned(predictions):
+    """True if the predictions are given as an array of label numbers,
+    one for each pairing of the datapack (-1 for pairings we have no
+    prediction for), rather than as a list of triples
+    """
+    return isinstance(predictions, np.ndarray)
+
+
+def _attached_mask(dpack, prediction):
+    """For each pairing of the datapack, True if it is predicted as
+    attached, given an array of label numbers aligned with it
+    """
+    unrelated = dpack.label_number(UNRELATED)
+    return (prediction != unrelated) & (prediction >= 0)
+
+
+def _undirected_keys(dpack, mask):
+    """The (unordered) pairs of EDUs in the selected pairings of a
+    datapack, as a set of integers
+    """
+    src = dpack.src_idx[mask].astype(np.int64)
+    tgt = dpack.tgt_idx[mask].astype(np.int64)
+    nb_edus = len(dpack.edu_table)
+    return np.unique(np.minimum(src, tgt) * nb_edus +
+                     np.maximum(src, tgt))
+
+
+def _count_edges(dpack, gold_mask, pred_mask, prediction):
+    """Undirected and directed edge counts, given which pairings of the
+    datapack are gold edges, and which are predicted (with which label)
+
+    :rtype: (Count, Count)
+    """
+    u_gold = _undirected_keys(dpack, gold_mask)
+    u_predicted = _undirected_keys(dpack, pred_mask)
+    undirected = Count(tpos_attach=len(np.intersect1d(u_gold, u_predicted,
+                                                      assume_unique=True)),
+                       tpos_label=0,
+                       tpos_fpos=len(u_predicted),
+                       tpos_fneg=len(u_gold))
+    found = gold_mask & pred_mask
+    directed = Count(tpos_attach=int(np.count_nonzero(found)),
+                     tpos_label=int(np.count_nonzero(
+                         prediction[found] == dpack.target[found])),
+                     tpos_fpos=int(np.count_nonzero(pred_mask)),
+                     tpos_fneg=int(np.count_nonzero(gold_mask)))
+    return undirected, directed
+
+
+def _prediction_triples(dpack, prediction):
+    """The attached edges in an array of label numbers aligned with the
+    pairings of the datapack, as (edu1_id, edu2_id, label) triples
+
+    :rtype: [(string, string, string)]
+    """
+    edus = dpack.edu_table.edus
+    rows = np.flatnonzero(_attached_mask(dpack, prediction))
+    return [(edus[src].id, edus[tgt].id, dpack.get_label(lbl))
+            for src, tgt, lbl in zip(dpack.src_idx[rows].tolist(),
+                                     dpack.tgt_idx[rows].tolist(),
+                                     prediction[rows].tolist())]
+
+
 def score_edges(dpack, predictions):
     """Count correctly predicted directed and undirected edges and labels.
 
@@ -113,8 +176,9 @@ def score_edges(dpack, predictions):
     dpack : DataPack
         Datapack containing ground truth edges.
 
-    predictions: list of (string, string, string)
-        Predicted edges: (edu1_id, edu2_id, label)
+    predictions: list of (string, string, string) or array of int
+        Predicted edges: (edu1_id, edu2_id, label), or the label number
+        predicted for each pairing of the datapack (-1 if none)
 
     Returns
     -------
@@ -124,6 +188,13 @@ def score_edges(dpack, predictions):
     directed : attelo.report.Count
         Count for directed edges.
     """
+    if _is_aligned(predictions):
+        unrelated = dpack.label_number(UNRELATED)
+        return _count_edges(dpack,
+                            dpack.target != unrelated,
+                            _attached_mask(dpack, predictions),
+                            predictions)
+
     att_pack, _ = attached_only(dpack, dpack.target)
     dict_predicted = {(arg1, arg2): rel for arg1, arg2, rel in predictions
                       if rel != UNRELATED}
@@ -165,7 +236,8 @@ def score_cspans(dpacks, dpredictions, coarse_rels=True, binary_trees=True,
         A DataPack per document
 
     dpredictions : list of ?
-        Prediction for each document
+        Prediction for each document (list of triples or array of
+        label numbers, as in :py:func:`score_edges`)
 
     coarse_rels : boolean, optional
         If True, convert relation labels to their coarse-grained version.
@@ -191,6 +263,9 @@ def score_cspans(dpacks, dpredictions, coarse_rels=True, binary_trees=True,
     cnt_snr : Count
         Count S+N+R
     """
+    dpredictions = [_prediction_triples(dpack, predictions)
+                    if _is_aligned(predictions) else predictions
+                    for dpack, predictions in zip(dpacks, dpredictions)]
     # trim down DataPacks
     att_packs = [attached_only(dpack, dpack.target)[0]
                  for dpack in dpacks]
@@ -272,8 +347,23 @@ def score_edus(dpack, predictions):
     This score may quite low if we are predicted a multiheaded
     graph
 
+    The predictions are either triples or an array of label numbers
+    aligned with the pairings (see :py:func:`score_edges`)
+
     :rtype: :py:class:`EduCount`
     """
+    if _is_aligned(predictions):
+        # an edu is wrong if any pairing leading to it is
+        unrelated = dpack.label_number(UNRELATED)
+        gold_mask = dpack.target != unrelated
+        pred_mask = _attached_mask(dpack, predictions)
+        bad_attach = gold_mask != pred_mask
+        bad_label = bad_attach | (gold_mask & (predictions != dpack.target))
+        total = len(dpack.edus)
+        return EduCount(
+            correct_attach=total - len(np.unique(dpack.tgt_idx[bad_attach])),
+            correct_label=total - len(np.unique(dpack.tgt_idx[bad_label])),
+            total=total)
 
     e_predictions = defaultdict(list)
     for parent, edu, rel in predictions:
@@ -312,7 +402,21 @@ def score_edges_by_label(dpack, predictions):
     If you are scoring mutiple folds you could loop over the
     folds, combining pre-existing scores for each label within
     the fold with its counterpart in the other folds
+
+    The predictions are either triples or an array of label numbers
+    aligned with the pairings (see :py:func:`score_edges`)
     """
+    if _is_aligned(predictions):
+        for label in dpack.labels:
+            if label == UNRELATED:
+                continue
+            label_num = dpack.label_number(label)
+            yield label, _count_edges(dpack,
+                                      dpack.target == label_num,
+                                      predictions == label_num,
+                                      predictions)
+        return
+
     predictions = [(e1, e2, r) for (e1, e2, r) in predictions
                    if r != UNRELATED]
 
@@ -331,7 +435,18 @@ def score_edges_by_label(dpack, predictions):
 
 def build_confusion_matrix(dpack, predictions):
     """return a confusion matrix show predictions vs desired labels
+
+    The predictions are either triples or an array of label numbers
+    aligned with the pairings (see :py:func:`score_edges`)
     """
+    if _is_aligned(predictions):
+        nb_labels = len(dpack.labels)
+        target = dpack.target.astype(np.int64)
+        known = ((predictions >= 0) & (predictions < nb_labels) &
+                 (target >= 0) & (target < nb_labels))
+        cells = target[known] * nb_labels + predictions[known]
+        return np.bincount(cells, minlength=nb_labels ** 2).reshape(
+            (nb_labels, nb_labels))
     # first, we need to align target_true and target_pred
     # FIXME avoid this costly operation: make sure that dpack.pairings
     # and dpack.target keep the same ordering as in the .pairings file ;
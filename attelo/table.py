@@ -3,7 +3,7 @@ Manipulating data tables (taking slices, etc)
 """
 
 from __future__ import print_function
-from collections import defaultdict, namedtuple
+from collections import namedtuple
 import itertools
 
 import numpy as np
@@ -30,6 +30,56 @@ class DataPackException(Exception):
         super(DataPackException, self).__init__(msg)
 
 
+class LabelVocab(tuple):
+    '''
+    Immutable sequence of relation labels, which can be shared by all
+    the datapacks of a multipack. It behaves like the list of labels
+    it is built from, except that looking up the number of a label
+    (`index`) or testing for membership takes constant time.
+
+    Parameters
+    ----------
+    labels: [string]
+        the labels (by convention, label zero is the unknown label)
+    '''
+    def _numbers(self):
+        "Mapping from label to number (first occurrence)"
+        # pylint: disable=attribute-defined-outside-init
+        if '_number' not in self.__dict__:
+            self._number = {}
+            for i, label in enumerate(self):
+                self._number.setdefault(label, i)
+        # pylint: enable=attribute-defined-outside-init
+        return self._number
+
+    def index(self, label):
+        '''
+        Return the number of the given label (raising ValueError if
+        it is not in the vocabulary, like `list.index`)
+
+        :rtype: int
+        '''
+        try:
+            return self._numbers()[label]
+        except KeyError:
+            raise ValueError('{!r} is not in the label '
+                             'vocabulary'.format(label))
+
+    def __contains__(self, label):
+        return label in self._numbers()
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, tuple)):
+            return NotImplemented
+        return tuple(self) == tuple(other)
+
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        return res if res is NotImplemented else not res
+
+    __hash__ = tuple.__hash__
+
+
 class Graph(namedtuple('Graph',
                        'prediction attach label')):
     '''
@@ -55,6 +105,12 @@ class Graph(namedtuple('Graph',
     -----
     Predictions are always labels; however, datapack targets may also
     be -1/0/1 when adapted to binary attachment task
+
+    The label weights may also be a sparse (CSR) matrix that only
+    keeps the best few labels of each edge (see `compacted`); code
+    that needs to read them should go through `dense_label`,
+    `best_label` or `best_label_weight` rather than use numpy
+    functions on `label` directly.
     '''
     def selected(self, indices):
         '''
@@ -76,9 +132,80 @@ class Graph(namedtuple('Graph',
         gzero = graphs[0]
         if gzero is None:
             return None
+        labels = [x.label for x in graphs]
+        if any(scipy.sparse.issparse(x) for x in labels):
+            label = scipy.sparse.vstack(labels, format='csr')
+        else:
+            label = np.concatenate(labels)
         return cls(prediction=np.concatenate([x.prediction for x in graphs]),
                    attach=np.concatenate([x.attach for x in graphs]),
-                   label=np.concatenate([x.label for x in graphs]))
+                   label=label)
+
+    def dense_label(self):
+        '''
+        Label weights as a dense (edge by label) array ; this is the
+        `label` array itself unless the graph was compacted to its
+        top labels (in which case the other labels get 0)
+
+        :rtype: 2D array(float)
+        '''
+        if scipy.sparse.issparse(self.label):
+            return self.label.toarray()
+        return np.asarray(self.label)
+
+    def best_label(self):
+        '''
+        Best label for each edge (the first one in case of ties,
+        like `np.argmax`)
+
+        :rtype: 1D array(int)
+        '''
+        if not scipy.sparse.issparse(self.label):
+            return np.ravel(np.argmax(self.label, axis=1))
+        offsets = _sparse_row_argmax(self.label)
+        found = offsets >= 0
+        res = np.zeros(len(offsets), dtype=self.label.indices.dtype)
+        res[found] = self.label.indices[offsets[found]]
+        return res
+
+    def best_label_weight(self):
+        '''
+        Weight of the best label for each edge
+
+        :rtype: 1D array(float)
+        '''
+        if not scipy.sparse.issparse(self.label):
+            return np.ravel(np.amax(self.label, axis=1))
+        offsets = _sparse_row_argmax(self.label)
+        found = offsets >= 0
+        res = np.zeros(len(offsets), dtype=self.label.data.dtype)
+        res[found] = self.label.data[offsets[found]]
+        return res
+
+    def compacted(self, dtype=np.float32, top_k=None):
+        '''
+        Return a variant of the graph that takes up less memory: the
+        attachment and label weights are stored as `dtype`, and if
+        `top_k` is set, only the `top_k` best labels of each edge are
+        kept, in a sparse (CSR) matrix
+
+        Single precision is enough to store the weights themselves;
+        the decoders work on float64 copies of the attachment weights
+        (see `attelo.decoding.util.ScoreMatrix`) so taking logarithms
+        and capping them to `MIN_SCORE`/`MAX_SCORE` (which is out of
+        float32 range) is still done in double precision.
+
+        :rtype: Graph
+        '''
+        attach = np.asarray(self.attach, dtype=dtype)
+        if top_k is None:
+            if scipy.sparse.issparse(self.label):
+                label = self.label.astype(dtype)
+            else:
+                label = np.asarray(self.label, dtype=dtype)
+        else:
+            label = _top_k_rows(self.dense_label(), top_k).astype(dtype)
+        return self.tweak(attach=attach, label=label)
 
     def tweak(self, prediction=None, attach=None, label=None):
         """Return a variant of the current graph with some values changed.
@@ -119,6 +246,499 @@ class Graph(namedtuple('Graph',
                               label=label)
 
 
+def _sparse_row_argmax(matrix):
+    """Offsets (in `data` and `indices`) of the largest stored value in
+    each row of a CSR matrix, ties going to the lowest column
+    (-1 for rows with no stored values)
+
+    :rtype: 1D array of int
+    """
+    lengths = np.diff(matrix.indptr)
+    rows = np.repeat(np.arange(matrix.shape[0]), lengths)
+    order = np.lexsort((matrix.indices, -matrix.data, rows))
+    res = np.empty(matrix.shape[0], dtype=np.intp)
+    res[:] = -1
+    nonempty = lengths > 0
+    res[nonempty] = order[matrix.indptr[:-1][nonempty]]
+    return res
+
+
+def _top_k_rows(weights, top_k):
+    """Keep the `top_k` best entries of each row of a dense 2D array
+    (ties going to the lowest columns, like `np.argmax`), in a CSR
+    matrix with `top_k` entries per row, zero or not
+
+    :rtype: scipy.sparse.csr_matrix
+    """
+    nb_rows, nb_cols = weights.shape
+    top_k = max(1, min(top_k, nb_cols))
+    cols = np.argsort(-weights, axis=1, kind='mergesort')[:, :top_k]
+    cols.sort(axis=1)
+    data = weights[np.arange(nb_rows)[:, np.newaxis], cols]
+    indptr = np.arange(0, nb_rows * top_k + 1, top_k)
+    return scipy.sparse.csr_matrix((np.ravel(data), np.ravel(cols), indptr),
+                                   shape=weights.shape)
+
+
+def _codes(values):
+    """Integer codes for a sequence of (hashable) values, in order of
+    first appearance
+
+    :rtype: (1D array of int32, [value])
+    """
+    index = {}
+    codes = np.fromiter((index.setdefault(x, len(index)) for x in values),
+                        dtype=np.int32, count=len(values))
+    names = [None] * len(index)
+    for name, code in index.items():
+        names[code] = name
+    return codes, names
+
+
+def _as_slice(indices):
+    """Return the given row indices as a slice if they form a
+    contiguous increasing range (so that selecting them can be done
+    with views instead of copies); otherwise return them unchanged
+    """
+    if isinstance(indices, slice):
+        return indices
+    arr = np.asarray(indices)
+    if arr.ndim != 1 or arr.dtype.kind not in 'iu' or not len(arr):
+        return indices
+    start = int(arr[0])
+    stop = int(arr[-1]) + 1
+    if start >= 0 and stop - start == len(arr) and\
+       (np.diff(arr) == 1).all():
+        return slice(start, stop)
+    return indices
+
+
+def _selection_rows(indices, nb_rows):
+    """The rows (out of `nb_rows`) that the given indices (slice,
+    array of indices or boolean mask) designate
+
+    :rtype: 1D array of int
+    """
+    if isinstance(indices, slice):
+        return np.arange(*indices.indices(nb_rows))
+    rows = np.asarray(indices)
+    if rows.dtype == bool:
+        return np.flatnonzero(rows)
+    return np.where(rows < 0, rows + nb_rows, rows).astype(np.intp)
+
+
+def _selected_rows(matrix, indices):
+    """Rows of a (sparse) matrix at the given indices. A contiguous
+    range of rows of a CSR matrix is returned as a view on its arrays
+    """
+    if not (isinstance(indices, slice) and
+            indices.step in (None, 1) and
+            scipy.sparse.isspmatrix_csr(matrix)):
+        return matrix[indices]
+    start, stop, _ = indices.indices(matrix.shape[0])
+    stop = max(start, stop)
+    indptr = matrix.indptr
+    lo, hi = indptr[start], indptr[stop]
+    return scipy.sparse.csr_matrix((matrix.data[lo:hi],
+                                    matrix.indices[lo:hi],
+                                    indptr[start:stop + 1] - lo),
+                                   shape=(stop - start, matrix.shape[1]),
+                                   copy=False)
+
+
+def _vstack_rows(matrices):
+    """Stack (sparse) matrices vertically. CSR matrices are stacked
+    with a single concatenation of each of their arrays
+    """
+    if not all(scipy.sparse.isspmatrix_csr(m) for m in matrices) or\
+       len(set(m.shape[1] for m in matrices)) != 1:
+        return scipy.sparse.vstack(matrices)
+    nnz_offsets = np.cumsum([0] + [m.indptr[-1] - m.indptr[0]
+                                   for m in matrices])
+    indptr = np.concatenate([[0]] +
+                            [m.indptr[1:] - m.indptr[0] + offset
+                             for m, offset in zip(matrices, nnz_offsets)])
+    data = np.concatenate([m.data[m.indptr[0]:m.indptr[-1]]
+                           for m in matrices])
+    indices = np.concatenate([m.indices[m.indptr[0]:m.indptr[-1]]
+                              for m in matrices])
+    return scipy.sparse.csr_matrix((data, indices, indptr),
+                                   shape=(len(indptr) - 1,
+                                          matrices[0].shape[1]),
+                                   copy=False)
+
+
+class EduTable(namedtuple('EduTable',
+                          ['edus',
+                           'is_root',
+                           'grouping',
+                           'subgrouping',
+                           'start',
+                           'end',
+                           'grouping_names',
+                           'subgrouping_names'])):
+    '''
+    Columnar view of a list of EDUs: each EDU is designated by its
+    index in the list (which thus serves as an integer code for its
+    id), and its fields are stored in arrays
+
+    Parameters
+    ----------
+    edus: [EDU]
+        the EDUs themselves
+    is_root: 1D array of bool
+        True for the fake root
+    grouping: 1D array of int32
+        grouping of each EDU, as an index in `grouping_names`
+    subgrouping: 1D array of int32
+        subgrouping of each EDU, as an index in `subgrouping_names`
+    start: 1D array of int
+        start of the span of each EDU
+    end: 1D array of int
+        end of the span of each EDU
+    grouping_names: [string or None]
+        distinct groupings
+    subgrouping_names: [string or None]
+        distinct subgroupings
+    '''
+    @classmethod
+    def from_edus(cls, edus):
+        '''
+        Build the table for a list of EDUs
+
+        :type edus: [EDU]
+        :rtype: :py:class:`EduTable`
+        '''
+        edus = list(edus)
+        grouping, grouping_names = _codes([e.grouping for e in edus])
+        subgrouping, subgrouping_names = _codes([e.subgrouping
+                                                 for e in edus])
+        return cls(edus=edus,
+                   is_root=np.array([e.id == FAKE_ROOT_ID for e in edus],
+                                    dtype=bool),
+                   grouping=grouping,
+                   subgrouping=subgrouping,
+                   start=np.array([e.start for e in edus]),
+                   end=np.array([e.end for e in edus]),
+                   grouping_names=grouping_names,
+                   subgrouping_names=subgrouping_names)
+
+    def __len__(self):
+        return len(self.edus)
+
+    def selected(self, rows):
+        '''
+        Table made of the given rows only (in that order). The
+        grouping and subgrouping codes are left as they are.
+
+        :type rows: 1D array of int
+        :rtype: :py:class:`EduTable`
+        '''
+        edus = self.edus
+        return EduTable(edus=[edus[i] for i in rows.tolist()],
+                        is_root=self.is_root[rows],
+                        grouping=self.grouping[rows],
+                        subgrouping=self.subgrouping[rows],
+                        start=self.start[rows],
+                        end=self.end[rows],
+                        grouping_names=self.grouping_names,
+                        subgrouping_names=self.subgrouping_names)
+
+    @classmethod
+    def vstack(cls, tables):
+        '''
+        Combine several tables into one. An EDU found in several of
+        the tables (eg. the fake root) is only kept once, at its first
+        position. The grouping and subgrouping codes are renumbered
+        against the combined names.
+
+        Returns the combined table, and for each of the input tables,
+        an array giving the new position of each of its rows.
+
+        :type tables: [EduTable]
+        :rtype: (:py:class:`EduTable`, [1D array of int32])
+        '''
+        tables = list(tables)
+        all_edus = concat_l(t.edus for t in tables)
+        ids = [e.id for e in all_edus]
+        nb_rows = len(ids)
+        # first row for each id (dict keeps the last value it is given)
+        first = dict(zip(reversed(ids), range(nb_rows - 1, -1, -1)))
+        first_row = np.array([first[x] for x in ids], dtype=np.intp)
+        is_kept = first_row == np.arange(nb_rows)
+        keep = np.flatnonzero(is_kept)
+        new_row = (np.cumsum(is_kept) - 1).astype(np.int32)
+        offsets = np.cumsum([0] + [len(t) for t in tables]).tolist()
+        remap = new_row[first_row]
+        remaps = [remap[start:stop]
+                  for start, stop in zip(offsets[:-1], offsets[1:])]
+
+        def merged_codes(field, names_field):
+            'recode a code column against the union of the names'
+            names0 = getattr(tables[0], names_field)
+            if all(getattr(t, names_field) is names0 for t in tables):
+                # eg. documents from the same multipack
+                return (np.concatenate([getattr(t, field)
+                                        for t in tables])[keep],
+                        names0)
+            names = {}
+            recodes = {}  # tables often share their names list
+            columns = []
+            for table in tables:
+                table_names = getattr(table, names_field)
+                recode = recodes.get(id(table_names))
+                if recode is None:
+                    recode = np.array([names.setdefault(x, len(names))
+                                       for x in table_names],
+                                      dtype=np.int32)
+                    recodes[id(table_names)] = recode
+                columns.append(recode[getattr(table, field)])
+            all_names = [None] * len(names)
+            for name, code in names.items():
+                all_names[code] = name
+            return np.concatenate(columns)[keep], all_names
+
+        grouping, grouping_names = merged_codes('grouping',
+                                                'grouping_names')
+        subgrouping, subgrouping_names = merged_codes('subgrouping',
+                                                      'subgrouping_names')
+        table = cls(edus=[all_edus[i] for i in keep.tolist()],
+                    is_root=np.concatenate([t.is_root for t in tables])[keep],
+                    grouping=grouping,
+                    subgrouping=subgrouping,
+                    start=np.concatenate([t.start for t in tables])[keep],
+                    end=np.concatenate([t.end for t in tables])[keep],
+                    grouping_names=grouping_names,
+                    subgrouping_names=subgrouping_names)
+        return table, remaps
+
+    def index(self):
+        '''
+        Mapping from EDU id to position in the table
+
+        :rtype: dict(string, int)
+        '''
+        # pylint: disable=attribute-defined-outside-init
+        if '_index' not in self.__dict__:
+            self._index = {e.id: i for i, e in enumerate(self.edus)}
+        # pylint: enable=attribute-defined-outside-init
+        return self._index
+
+
+class _SelectionRoot(object):
+    '''
+    Identity token for a set of pairings that others are selected from
+    (see :py:meth:`Pairings.rows_in`)
+    '''
+    pass
+
+
+class Pairings(object):
+    '''
+    Columnar list of EDU pairings: the EDUs are held in an
+    :py:class:`EduTable` and the pairings are two arrays of
+    indices into it.
+
+    This behaves like the list of `(EDU, EDU)` tuples it stands for
+    (so can be used as the `pairings` of a :py:class:`DataPack`), but
+    the tuples are only built if somebody asks for them.
+
+    Parameters
+    ----------
+    table: EduTable
+        EDUs involved in the pairings (and possibly others)
+    src_idx: 1D array of int32
+        index in the table of the first EDU of each pairing
+    tgt_idx: 1D array of int32
+        index in the table of the second EDU of each pairing
+    '''
+    def __init__(self, table, src_idx, tgt_idx):
+        self.table = table
+        self.src_idx = np.asarray(src_idx, dtype=np.int32)
+        self.tgt_idx = np.asarray(tgt_idx, dtype=np.int32)
+        self._tuples = None
+        # pairings these were selected from (possibly through several
+        # rounds of selection), and the row of each pairing in them;
+        # only a token for the former, so we never keep (or pickle)
+        # a whole corpus for one of its documents
+        self._root = _SelectionRoot()
+        self._root_rows = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_tuples'] = None
+        return state
+
+    @classmethod
+    def from_list(cls, pairings, edus=None):
+        '''
+        Columnar version of a list of EDU pairs
+
+        :param edus: EDUs to put in the table (EDUs from the pairings
+                     are added as needed)
+        :type edus: [EDU] or None
+        :type pairings: [(EDU, EDU)]
+        '''
+        if isinstance(pairings, Pairings):
+            return pairings
+        pairings = list(pairings)
+        all_edus = list(edus or [])
+        index = {e.id: i for i, e in enumerate(all_edus)}
+        for pair in pairings:
+            for edu in pair:
+                if edu.id not in index:
+                    index[edu.id] = len(all_edus)
+                    all_edus.append(edu)
+        src_idx = np.fromiter((index[e1.id] for e1, _ in pairings),
+                              dtype=np.int32, count=len(pairings))
+        tgt_idx = np.fromiter((index[e2.id] for _, e2 in pairings),
+                              dtype=np.int32, count=len(pairings))
+        res = cls(EduTable.from_edus(all_edus), src_idx, tgt_idx)
+        res._tuples = pairings
+        return res
+
+    def tuples(self):
+        '''
+        The pairings, as a list of `(EDU, EDU)` tuples
+
+        :rtype: [(EDU, EDU)]
+        '''
+        if self._tuples is None:
+            edus = self.table.edus
+            self._tuples = [(edus[i], edus[j]) for i, j in
+                            zip(self.src_idx.tolist(),
+                                self.tgt_idx.tolist())]
+        return self._tuples
+
+    def selected(self, indices):
+        '''
+        Return the pairings at the given indices (array or slice),
+        sharing the EDU table
+
+        :rtype: :py:class:`Pairings`
+        '''
+        res = Pairings(self.table,
+                       self.src_idx[indices],
+                       self.tgt_idx[indices])
+        if self._tuples is not None and isinstance(indices, slice):
+            res._tuples = self._tuples[indices]
+        rows = _selection_rows(indices, len(self))
+        res._root = self._root
+        res._root_rows = rows if self._root_rows is None\
+            else self._root_rows[rows]
+        return res
+
+    def rows_in(self, pairings):
+        '''
+        Return the row that each of these pairings had in the given
+        pairings (-1 for those it does not have), if both were selected
+        from the same pairings (possibly through several rounds of
+        selection, see :py:meth:`DataPack.selected`) or if these were
+        selected from the given ones; otherwise return None
+
+        :type pairings: :py:class:`Pairings`
+        :rtype: 1D array of int or None
+        '''
+        if not isinstance(pairings, Pairings) or\
+           pairings._root is not self._root:
+            return None
+        if pairings._root_rows is None:
+            # the root itself (or a copy of it)
+            return np.arange(len(self)) if self._root_rows is None\
+                else self._root_rows
+        if self._root_rows is None:
+            return None
+        # look for our rows in the root among theirs
+        order = np.argsort(pairings._root_rows, kind='mergesort')
+        their_rows = pairings._root_rows[order]
+        if not len(their_rows):
+            return np.repeat(-1, len(self))
+        pos = np.minimum(np.searchsorted(their_rows, self._root_rows),
+                         len(their_rows) - 1)
+        return np.where(their_rows[pos] == self._root_rows, order[pos], -1)
+
+    def compacted(self):
+        '''
+        Return an equivalent set of pairings whose table only has the
+        EDUs that are actually used, along with the (sorted) rows of the
+        original table these EDUs were taken from
+
+        :rtype: (:py:class:`Pairings`, 1D array of int)
+        '''
+        nb_pairs = len(self)
+        rows, inverse = np.unique(np.concatenate([self.src_idx,
+                                                  self.tgt_idx]),
+                                  return_inverse=True)
+        res = Pairings(self.table.selected(rows),
+                       inverse[:nb_pairs],
+                       inverse[nb_pairs:])
+        res._tuples = self._tuples
+        res._root = self._root
+        res._root_rows = self._root_rows
+        return res, rows
+
+    @classmethod
+    def vstack(cls, pairings):
+        '''
+        Concatenate several columnar pairings (see
+        :py:meth:`EduTable.vstack` for how their tables are combined)
+
+        :type pairings: [Pairings]
+        :rtype: :py:class:`Pairings`
+        '''
+        pairings = list(pairings)
+        table, remaps = EduTable.vstack(p.table for p in pairings)
+        return cls(table,
+                   np.concatenate([remap[p.src_idx] for p, remap in
+                                   zip(pairings, remaps)]),
+                   np.concatenate([remap[p.tgt_idx] for p, remap in
+                                   zip(pairings, remaps)]))
+
+    def __len__(self):
+        return len(self.src_idx)
+
+    def __iter__(self):
+        return iter(self.tuples())
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.tuples()[idx]
+        edus = self.table.edus
+        return (edus[self.src_idx[idx]], edus[self.tgt_idx[idx]])
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.tuples())
+
+
+class EduPositions(namedtuple('EduPositions',
+                              ['edus', 'index', 'src', 'tgt'])):
+    '''
+    Position of the EDUs of a datapack in document order: the fake
+    root, if any, comes first, then the EDUs sorted by span
+    (see :py:meth:`DataPack.edu_positions`)
+
+    Parameters
+    ----------
+    edus: [EDU]
+        EDUs of the datapack, in position order
+    index: dict(string, int)
+        position of each EDU, by id
+    src: 1D array of int
+        position of the source EDU of each pairing
+    tgt: 1D array of int
+        position of the target EDU of each pairing
+    '''
+    pass
+
+
 class DataPack(namedtuple('DataPack',
                           ['edus',
                            'pairings',
@@ -127,7 +747,8 @@ class DataPack(namedtuple('DataPack',
                            'ctarget',
                            'labels',
                            'vocab',
-                           'graph'])):
+                           'graph',
+                           'stacking'])):
     '''
     A set of data that can be said to belong together.
 
@@ -174,10 +795,141 @@ class DataPack(namedtuple('DataPack',
     graph (None or Graph)
         if set, arrays representing the probabilities (or
         confidence scores) of attachment and labelling
+    stacking (None or (1D array(int), 1D array(int)))
+        for stacked datapacks (see :py:meth:`vstack`), the row and
+        the EDU at which each of the original datapacks starts,
+        followed by the number of rows and of EDUs; None otherwise
     '''
+    # pylint: disable=too-many-arguments
+    def __new__(cls, edus, pairings, data, target, ctarget, labels, vocab,
+                graph, stacking=None):
+        return super(DataPack, cls).__new__(cls, edus, pairings, data,
+                                            target, ctarget, labels, vocab,
+                                            graph, stacking)
+    # pylint: enable=too-many-arguments
+
+    # memos that only depend on the EDUs and the pairings
+    _PAIRING_MEMOS = ('_pairing_columns', '_edu_positions', '_edus_lead')
+
+    def _share_pairing_memos(self, dpack):
+        '''
+        Give a datapack with the same EDUs and pairings as this one
+        whatever we have already computed from them (see
+        :py:meth:`edu_positions`)
+
+        :rtype: :py:class:`DataPack`
+        '''
+        for key in self._PAIRING_MEMOS:
+            if key in self.__dict__:
+                dpack.__dict__[key] = self.__dict__[key]
+        return dpack
+
+    def _replace(self, **kwargs):
+        '''
+        Copy of the datapack with some fields replaced (the namedtuple
+        version would check the number of fields with `len`, which
+        for us is the number of pairings)
+
+        :rtype: :py:class:`DataPack`
+        '''
+        values = [kwargs.pop(f, v) for f, v in zip(self._fields, self)]
+        if kwargs:
+            raise ValueError('Got unexpected field names: ' +
+                             ', '.join(kwargs))
+        return type(self)(*values)
+
     def __len__(self):
         return len(self.pairings)
 
+    def pairing_columns(self):
+        '''
+        Columnar view of the pairings: the pairings themselves if they
+        are a :py:class:`Pairings`, otherwise one built (once) from
+        the list of tuples
+
+        :rtype: :py:class:`Pairings`
+        '''
+        if isinstance(self.pairings, Pairings):
+            return self.pairings
+        # pylint: disable=attribute-defined-outside-init
+        if '_pairing_columns' not in self.__dict__:
+            self._pairing_columns = Pairings.from_list(self.pairings,
+                                                       self.edus)
+        # pylint: enable=attribute-defined-outside-init
+        return self._pairing_columns
+
+    def edu_positions(self):
+        '''
+        Document order of the EDUs of this datapack, and the position
+        of the EDUs of each pairing in it. This is computed the first
+        time it is asked for, then kept with the datapack (which being
+        immutable, never needs it recomputed). Datapacks made by
+        `set_graph` share it, as they have the same EDUs and pairings;
+        those made by `selected` get their own.
+
+        Note that this only makes sense for single-document datapacks,
+        and that the EDUs of all pairings must be in `edus` (except
+        for the fake root, which is put first if the pairings use it)
+
+        :rtype: :py:class:`EduPositions`
+        '''
+        # pylint: disable=attribute-defined-outside-init
+        if '_edu_positions' not in self.__dict__:
+            table = self.edu_table
+            edus = list(self.edus)
+            root_row = table.index().get(FAKE_ROOT_ID)
+            if root_row is not None and\
+               all(e.id != FAKE_ROOT_ID for e in edus):
+                edus.append(table.edus[root_row])
+            edus.sort(key=lambda e: (e.id != FAKE_ROOT_ID, e.span()))
+            index = {e.id: i for i, e in enumerate(edus)}
+            row_pos = np.array([index.get(e.id, -1) for e in table.edus],
+                               dtype=np.intp)
+            src = row_pos[self.src_idx]
+            tgt = row_pos[self.tgt_idx]
+            missing = np.concatenate([self.src_idx[src < 0],
+                                      self.tgt_idx[tgt < 0]])
+            if len(missing):
+                raise KeyError(table.edus[missing[0]].id)
+            self._edu_positions = EduPositions(edus=edus,
+                                               index=index,
+                                               src=src,
+                                               tgt=tgt)
+        # pylint: enable=attribute-defined-outside-init
+        return self._edu_positions
+
+    def _edus_lead_table(self):
+        '''
+        True if the EDU table of the pairings starts with the EDUs of
+        this datapack, in the same order, so that positions in either
+        designate the same EDU
+
+        :rtype: bool
+        '''
+        # pylint: disable=attribute-defined-outside-init
+        if '_edus_lead' not in self.__dict__:
+            table_edus = self.edu_table.edus
+            self._edus_lead = (len(self.edus) <= len(table_edus) and
+                               all(x is y for x, y in
+                                   zip(self.edus, table_edus)))
+        # pylint: enable=attribute-defined-outside-init
+        return self._edus_lead
+
+    @property
+    def edu_table(self):
+        "EDU table for the pairings (see :py:class:`EduTable`)"
+        return self.pairing_columns().table
+
+    @property
+    def src_idx(self):
+        "index of the first EDU of each pairing in `edu_table`"
+        return self.pairing_columns().src_idx
+
+    @property
+    def tgt_idx(self):
+        "index of the second EDU of each pairing in `edu_table`"
+        return self.pairing_columns().tgt_idx
+
     # pylint: disable=too-many-arguments
     @classmethod
     def load(cls, edus, pairings, data, target, ctarget, labels, vocab):
@@ -207,14 +959,20 @@ class DataPack(namedtuple('DataPack',
 
         The labels and vocabulary for all packs must be the same
 
+        The combined datapack remembers where each of the original
+        ones starts, so that it can be split back into them with
+        :py:meth:`unstacked`
+
         :type dpacks: [DataPack]
         '''
+        dpacks = list(dpacks)
         if not dpacks:
             raise ValueError('need non-empty list of datapacks')
         dzero = dpacks[0]
-        return DataPack(edus=concat_l(d.edus for d in dpacks),
-                        pairings=concat_l(d.pairings for d in dpacks),
-                        data=scipy.sparse.vstack(d.data for d in dpacks),
+        pack = DataPack(edus=concat_l(d.edus for d in dpacks),
+                        pairings=Pairings.vstack(d.pairing_columns()
+                                                 for d in dpacks),
+                        data=_vstack_rows([d.data for d in dpacks]),
                         target=np.concatenate([d.target for d in dpacks]),
                         ctarget={grp_name: list(itertools.chain.from_iterable(
                             d.ctarget.get(grp_name, []) for d in dpacks))
@@ -223,7 +981,44 @@ class DataPack(namedtuple('DataPack',
                                      d.ctarget.keys() for d in dpacks))},
                         labels=dzero.labels,
                         vocab=dzero.vocab,
-                        graph=Graph.vstack(d.graph for d in dpacks))
+                        graph=Graph.vstack(d.graph for d in dpacks),
+                        stacking=(np.cumsum([0] + [len(d) for d in dpacks]),
+                                  np.cumsum([0] + [len(d.edus)
+                                                   for d in dpacks])))
+        return pack
+
+    def stack_offsets(self):
+        '''
+        Row at which each of the datapacks this one was stacked from
+        (see :py:meth:`vstack`) starts, followed by the number of rows.
+        A datapack that was not stacked counts as a single one.
+
+        :rtype: 1D array of int
+        '''
+        if self.stacking is None:
+            return np.array([0, len(self)])
+        return self.stacking[0]
+
+    def unstacked(self):
+        '''
+        Split a datapack made by :py:meth:`vstack` back into the
+        datapacks it was made from (or rather, views on its rows that
+        are equivalent to them)
+
+        Raise ValueError if this datapack was not made by stacking
+        others (selecting rows from a stacked datapack gives one that
+        was not)
+
+        :rtype: [DataPack]
+        '''
+        if self.stacking is None:
+            raise ValueError('Not a stacked datapack')
+        offsets, edu_offsets = self.stacking
+        return [self._selected(slice(start, stop),
+                               edus=self.edus[edu_start:edu_stop])
+                for start, stop, edu_start, edu_stop in
+                zip(offsets[:-1].tolist(), offsets[1:].tolist(),
+                    edu_offsets[:-1].tolist(), edu_offsets[1:].tolist())]
 
     def _check_target(self):
         '''
@@ -241,7 +1036,7 @@ class DataPack(namedtuple('DataPack',
                 'the number of possible target labels ({target}) in '
                 'the features file')
         max_class = len(self.labels) - 1
-        max_target = int(max(self.target))
+        max_target = int(np.max(self.target))
         if max_class < max_target:
             raise(DataPackException(oops.format(labels=max_class + 1,
                                                 target=max_target + 1)))
@@ -285,28 +1080,48 @@ class DataPack(namedtuple('DataPack',
     def selected(self, indices):
         '''
         Return only the items in the specified rows
+
+        If the rows form a contiguous range (eg. a document in a
+        multipack), the target, graph and pairings are views on those
+        of this datapack rather than copies.
+        '''
+        return self._selected(_as_slice(indices))
+
+    def _selected(self, indices, edus=None):
+        '''
+        Implementation of :py:meth:`selected` for row indices in
+        their final form; the EDUs of the selection can be given if
+        they are known
         '''
-        sel_targets = np.take(self.target, indices)
+        sel_targets = self.target[indices]
         if self.labels is None:
             sel_labels = None
         else:
             sel_labels = self.labels
-        sel_pairings = [self.pairings[x] for x in indices]
-        sel_edus_ = set()
-        for edu1, edu2 in sel_pairings:
-            sel_edus_.add(edu1)
-            sel_edus_.add(edu2)
-        sel_edus = [e for e in self.edus if e in sel_edus_]
+        sel_pairings, rows = \
+            self.pairing_columns().selected(indices).compacted()
+        if edus is not None:
+            sel_edus = edus
+        elif self._edus_lead_table():
+            # rows are sorted, so the EDUs from this datapack come first
+            nb_edus = np.searchsorted(rows, len(self.edus))
+            sel_edus = sel_pairings.table.edus[:nb_edus]
+        else:
+            edu_index = sel_pairings.table.index()
+            sel_edus = [e for e in self.edus if e.id in edu_index]
         # NEW ctarget
-        sel_groupings = set(groupings(sel_pairings).keys())
-        sel_ctargets = {grp_name: ctgt
-                        for grp_name, ctgt in self.ctarget.items()
-                        if grp_name in sel_groupings}
+        if self.ctarget:
+            sel_groupings = set(groupings(sel_pairings).keys())
+            sel_ctargets = {grp_name: ctgt
+                            for grp_name, ctgt in self.ctarget.items()
+                            if grp_name in sel_groupings}
+        else:
+            sel_ctargets = {}
         # FIXME restrict further, break RSTTree into forest of RSTTrees
         # that can be built using sel_pairings only (not sure this is
         # well-defined)
         # end NEW ctarget
-        sel_data = self.data[indices]
+        sel_data = _selected_rows(self.data, indices)
         if self.graph is None:
             graph = None
         else:
@@ -346,14 +1161,16 @@ class DataPack(namedtuple('DataPack',
                     '').format(got=graph.label.shape,
                                want=want_shape_2d)
             raise ValueError(oops)
-        return DataPack(edus=self.edus,
-                        pairings=self.pairings,
-                        data=self.data,
-                        target=self.target,
-                        ctarget=self.ctarget,
-                        labels=self.labels,
-                        vocab=self.vocab,
-                        graph=graph)
+        dpack = DataPack(edus=self.edus,
+                         pairings=self.pairings,
+                         data=self.data,
+                         target=self.target,
+                         ctarget=self.ctarget,
+                         labels=self.labels,
+                         vocab=self.vocab,
+                         graph=graph,
+                         stacking=self.stacking)
+        return self._share_pairing_memos(dpack)
 
     def get_label(self, i):
         '''
@@ -388,7 +1205,62 @@ class DataPack(namedtuple('DataPack',
         --------
         `get_label`
         '''
-        return self.labels.index(label)
+        return self.label_vocab().index(label)
+
+    def label_vocab(self):
+        '''
+        The labels of this datapack, as a :py:class:`LabelVocab`
+        (built once if the labels are a plain list)
+
+        :rtype: :py:class:`LabelVocab`
+        '''
+        if isinstance(self.labels, LabelVocab):
+            return self.labels
+        # pylint: disable=attribute-defined-outside-init
+        if '_label_vocab' not in self.__dict__:
+            self._label_vocab = LabelVocab(self.labels)
+        # pylint: enable=attribute-defined-outside-init
+        return self._label_vocab
+
+
+def _group_rows(keys):
+    """Group row indices by key (an integer code per row)
+
+    :rtype: [(int, 1D array of int)]
+    """
+    if not len(keys):
+        return []
+    order = np.argsort(keys, kind='mergesort')
+    sorted_keys = keys[order]
+    bounds = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+    firsts = np.concatenate([[0], bounds])
+    return list(zip(sorted_keys[firsts].tolist(), np.split(order, bounds)))
+
+
+def _grouping_codes(cols):
+    """Grouping of each pairing (see :py:func:`groupings`), as an index
+    in the grouping names of the EDU table
+
+    :type cols: :py:class:`Pairings`
+    :rtype: 1D array of int32
+    """
+    table = cols.table
+    grp1 = table.grouping[cols.src_idx]
+    grp2 = table.grouping[cols.tgt_idx]
+    if None in table.grouping_names:
+        no_grp = table.grouping_names.index(None)
+    else:
+        no_grp = -1
+    mismatch = (grp1 != no_grp) & (grp2 != no_grp) & (grp1 != grp2)
+    if mismatch.any():
+        edu1, edu2 = cols[np.flatnonzero(mismatch)[0]]
+        oops = ('Grouping mismatch: {edu1} is in group {grp1}, '
+                'but {edu2} is in {grp2}')
+        raise(DataPackException(oops.format(edu1=edu1,
+                                            edu2=edu2,
+                                            grp1=edu1.grouping,
+                                            grp2=edu2.grouping)))
+    return np.where(grp1 == no_grp, grp2, grp1)
 
 
 def groupings(pairings):
@@ -396,27 +1268,38 @@ def groupings(pairings):
     Given a list of EDU pairings, return a dictionary mapping
     grouping names to list of rows within the pairings.
 
-    :rtype: dict(string, [int])
+    :type pairings: [(EDU, EDU)] or :py:class:`Pairings`
+    :rtype: dict(string, 1D array of int)
     '''
-    res = defaultdict(list)
-    for i, (edu1, edu2) in enumerate(pairings):
-        grp1 = edu1.grouping
-        grp2 = edu2.grouping
-        if grp1 is None:
-            grp = grp2
-        elif grp2 is None:
-            grp = grp1
-        elif grp1 != grp2:
-            oops = ('Grouping mismatch: {edu1} is in group {grp1}, '
-                    'but {edu2} is in {grp2}')
-            raise(DataPackException(oops.format(edu1=edu1,
-                                                edu2=edu2,
-                                                grp1=grp1,
-                                                grp2=grp2)))
-        else:
-            grp = grp1
-        res[grp].append(i)
-    return res
+    cols = Pairings.from_list(pairings)
+    names = cols.table.grouping_names
+    return {names[code]: rows
+            for code, rows in _group_rows(_grouping_codes(cols))}
+
+
+def grouping_ranges(pairings):
+    '''
+    Like :py:func:`groupings`, but if the rows of each grouping are
+    contiguous (as they are in the files we produce), return them as
+    slices, which :py:meth:`DataPack.selected` turns into views.
+
+    :type pairings: [(EDU, EDU)] or :py:class:`Pairings`
+    :rtype: dict(string, slice or 1D array of int)
+    '''
+    cols = Pairings.from_list(pairings)
+    names = cols.table.grouping_names
+    grp = _grouping_codes(cols)
+    if not len(grp):
+        return {}
+    bounds = np.flatnonzero(grp[1:] != grp[:-1]) + 1
+    starts = np.concatenate([[0], bounds]).tolist()
+    stops = bounds.tolist() + [len(grp)]
+    codes = grp[starts].tolist()
+    if len(set(codes)) < len(codes):
+        # some grouping is split over several runs of rows
+        return {names[code]: rows for code, rows in _group_rows(grp)}
+    return {names[code]: slice(start, stop)
+            for code, start, stop in zip(codes, starts, stops)}
 
 
 def idxes_attached(dpack, target):
@@ -499,14 +1382,18 @@ def for_attachment(dpack, target):
         Transformed targets, with binary labels
     """
     unrelated = dpack.label_number(UNRELATED)
-    dpack = DataPack(edus=dpack.edus,
-                     pairings=dpack.pairings,
-                     data=dpack.data,
-                     target=np.where(dpack.target == unrelated, -1, 1),
-                     ctarget=dpack.ctarget,  # WIP
-                     labels=[UNKNOWN, UNRELATED],
-                     vocab=dpack.vocab,
-                     graph=dpack.graph)
+    # pylint: disable=protected-access
+    dpack = dpack._share_pairing_memos(
+        DataPack(edus=dpack.edus,
+                 pairings=dpack.pairings,
+                 data=dpack.data,
+                 target=np.where(dpack.target == unrelated, -1, 1),
+                 ctarget=dpack.ctarget,  # WIP
+                 labels=[UNKNOWN, UNRELATED],
+                 vocab=dpack.vocab,
+                 graph=dpack.graph,
+                 stacking=dpack.stacking))
+    # pylint: enable=protected-access
     target = np.where(target == unrelated, -1, 1)
     return dpack, target
 
@@ -538,12 +1425,25 @@ def for_labelling(dpack, target):
     return dpack, target
 
 
+def _intra_mask(dpack):
+    """Boolean mask for the pairings of EDUs from the same subgrouping,
+    and for the pairings from the fake root
+
+    :rtype: (1D array of bool, 1D array of bool)
+    """
+    table = dpack.edu_table
+    src = dpack.src_idx
+    tgt = dpack.tgt_idx
+    same = ((table.grouping[src] == table.grouping[tgt]) &
+            (table.subgrouping[src] == table.subgrouping[tgt]))
+    return same, table.is_root[src]
+
+
 def idxes_fakeroot(dpack):
     """Return datapack indices only the pairings which involve the
     fakeroot node
     """
-    return [i for i, (edu1, _) in enumerate(dpack.pairings)
-            if edu1.id == FAKE_ROOT_ID]
+    return np.flatnonzero(dpack.edu_table.is_root[dpack.src_idx])
 
 
 def grouped_intra_pairings(dpack, include_fake_root=False):
@@ -560,7 +1460,7 @@ def grouped_intra_pairings(dpack, include_fake_root=False):
 
     Returns
     -------
-    groups : dict from (string, string) to list of integers
+    groups : dict from (string, string) to 1D array of int
         Map each (grouping, subgrouping) to the list of pairing indices
         within the same subgrouping.
 
@@ -569,22 +1469,16 @@ def grouped_intra_pairings(dpack, include_fake_root=False):
     The result roughly corresponds to a hypothetical
     `dpack.pairings['intra'].groupby(['grouping', 'subgrouping']).groups`.
     """
-    groups = defaultdict(list)
-
-    if include_fake_root:
-        for i, (edu1, edu2) in enumerate(dpack.pairings):
-            key1 = (edu1.grouping, edu1.subgrouping)
-            key2 = (edu2.grouping, edu2.subgrouping)
-            if edu1.id == FAKE_ROOT_ID or key1 == key2:
-                groups[key2].append(i)
-    else:
-        for i, (edu1, edu2) in enumerate(dpack.pairings):
-            key1 = (edu1.grouping, edu1.subgrouping)
-            key2 = (edu2.grouping, edu2.subgrouping)
-            if edu1.id != FAKE_ROOT_ID and key1 == key2:
-                groups[key2].append(i)
-
-    return groups
+    table = dpack.edu_table
+    idxes = idxes_intra(dpack, include_fake_root=include_fake_root)
+    tgt = dpack.tgt_idx[idxes]
+    # one code per (grouping, subgrouping)
+    nb_subgroupings = len(table.subgrouping_names)
+    keys = (table.grouping[tgt].astype(np.int64) * nb_subgroupings +
+            table.subgrouping[tgt])
+    return {(table.grouping_names[key // nb_subgroupings],
+             table.subgrouping_names[key % nb_subgroupings]): idxes[rows]
+            for key, rows in _group_rows(keys)}
 
 
 def idxes_intra(dpack, include_fake_root=False):
@@ -600,20 +1494,14 @@ def idxes_intra(dpack, include_fake_root=False):
 
     Returns
     -------
-    idxes : list of int
+    idxes : 1D array of int
         Indices of the intra pairings.
     """
+    same, froot = _intra_mask(dpack)
     if include_fake_root:
-        idxes = [i for i, (edu1, edu2) in enumerate(dpack.pairings)
-                 if (edu1.id == FAKE_ROOT_ID or
-                     (edu1.grouping == edu2.grouping and
-                      edu1.subgrouping == edu2.subgrouping))]
+        return np.flatnonzero(froot | same)
     else:
-        idxes = [i for i, (edu1, edu2) in enumerate(dpack.pairings)
-                 if (edu1.id != FAKE_ROOT_ID and
-                     edu1.grouping == edu2.grouping and
-                     edu1.subgrouping == edu2.subgrouping)]
-    return idxes
+        return np.flatnonzero(~froot & same)
 
 
 def idxes_inter(dpack, include_fake_root=False):
@@ -629,20 +1517,14 @@ def idxes_inter(dpack, include_fake_root=False):
 
     Returns
     -------
-    idxes : list of int
+    idxes : 1D array of int
         Indices of the inter pairings.
     """
+    same, froot = _intra_mask(dpack)
     if include_fake_root:
-        idxes = [i for i, (edu1, edu2) in enumerate(dpack.pairings)
-                 if (edu1.id == FAKE_ROOT_ID or
-                     edu1.grouping != edu2.grouping or
-                     edu1.subgrouping != edu2.subgrouping)]
+        return np.flatnonzero(froot | ~same)
     else:
-        idxes = [i for i, (edu1, edu2) in enumerate(dpack.pairings)
-                 if (edu1.id != FAKE_ROOT_ID and
-                     (edu1.grouping != edu2.grouping or
-                      edu1.subgrouping != edu2.subgrouping))]
-    return idxes
+        return np.flatnonzero(~froot & ~same)
 
 
 class Multipack(dict):
@@ -656,18 +1538,14 @@ class Multipack(dict):
     pass
 
 
-def _edu_positions(dpack):
-    """Return a dictionary associating each EDU with a position
-    identifier. The fake root always has position 0.
+def _pairing_gaps(dpack):
+    """Return, for each pairing, the position of its second EDU minus
+    that of its first EDU (see :py:meth:`DataPack.edu_positions`)
 
-    Note that this will only work correctly on single-document
-    datapacks.
+    :rtype: 1D array of int
     """
-    position = {FAKE_ROOT_ID: 0}
-    sorted_edus = sorted(dpack.edus, key=lambda x: x.span()[0])
-    for i, edu in enumerate(sorted_edus):
-        position[edu.id] = i
-    return position
+    positions = dpack.edu_positions()
+    return positions.tgt - positions.src
 
 
 def select_window(dpack, window):
@@ -678,15 +1556,11 @@ def select_window(dpack, window):
     original datapack
 
     Note that will only work correctly on single-document datapacks
+    (see :py:meth:`DataPack.edu_positions`)
     '''
     if window is None:
         return dpack
-    position = _edu_positions(dpack)
-    indices = []
-    for i, (edu1, edu2) in enumerate(dpack.pairings):
-        gap = abs(position[edu2.id] - position[edu1.id])
-        if gap <= window:
-            indices.append(i)
+    indices = np.flatnonzero(np.abs(_pairing_gaps(dpack)) <= window)
     return dpack.selected(indices)
 
 
@@ -701,18 +1575,15 @@ def pairing_distances(dpack):
 
     :rtype dict(int, (int, int))
     """
-    position = _edu_positions(dpack)
-    max_l = defaultdict(int)
-    max_r = defaultdict(int)
-    for i, (edu1, edu2) in enumerate(dpack.pairings):
-        gap = position[edu2.id] - position[edu1.id]
-        lbl = dpack.target[i]
-        if gap < 0:
-            max_l[lbl] = max(max_l[lbl], -gap)
-        else:
-            max_r[lbl] = max(max_r[lbl], gap)
-    keys = frozenset(max_l.keys() + max_r.keys())
-    return {k: (max_l[k], max_r[k]) for k in keys}
+    gaps = _pairing_gaps(dpack)
+    lbls, lbl_idx = np.unique(dpack.target, return_inverse=True)
+    max_l = np.zeros(len(lbls), dtype=gaps.dtype)
+    max_r = np.zeros(len(lbls), dtype=gaps.dtype)
+    left = gaps < 0
+    np.maximum.at(max_l, lbl_idx[left], -gaps[left])
+    np.maximum.at(max_r, lbl_idx[~left], gaps[~left])
+    return {k: (int(dmax_l), int(dmax_r))
+            for k, dmax_l, dmax_r in zip(lbls.tolist(), max_l, max_r)}
 
 
 def mpack_pairing_distances(mpack):
@@ -741,6 +1612,35 @@ def get_label_string(labels, i):
     return labels[int(i)]
 
 
+def subpack_rows(dpack, subpacks):
+    """
+    Given a datapack and some of its subpacks, return for each subpack
+    the row in the datapack of each of its pairings (-1 for pairings
+    that are not in the datapack).
+
+    Subpacks made by selecting rows from the datapack (see
+    :py:meth:`DataPack.selected`), directly or not, simply remember
+    where their rows come from. The pairings of any other subpack are
+    matched against those of the datapack.
+
+    Returns
+    -------
+    [1D array of int]
+    """
+    res = []
+    pmap = None
+    for subpack in subpacks:
+        rows = subpack.pairing_columns().rows_in(dpack.pairing_columns())
+        if rows is None:
+            if pmap is None:
+                pmap = {pair: i for i, pair in enumerate(dpack.pairings)}
+            rows = np.fromiter((pmap.get(pair, -1)
+                                for pair in subpack.pairings),
+                               dtype=np.intp, count=len(subpack))
+        res.append(rows)
+    return res
+
+
 def locate_in_subpacks(dpack, subpacks):
     """
     Given a datapack and some of its subpacks, return a
@@ -750,13 +1650,21 @@ def locate_in_subpacks(dpack, subpacks):
     If a pair is not found in the list of subpacks, we
     return None instead of tuple
 
+    See also
+    --------
+    `subpack_rows`, which gives the same information in array form
+
     Returns
     -------
     [None or (DataPack, float)]
     """
     subpacks = list(subpacks)  # in case of iterable
-    pmap = {}
-    for subpack in subpacks:
-        for i, pair in enumerate(subpack.pairings):
-            pmap[pair] = subpack, i
-    return [pmap.get(x) for x in dpack.pairings]
+    which = np.empty(len(dpack), dtype=np.intp)
+    which[:] = -1
+    where = np.zeros(len(dpack), dtype=np.intp)
+    for k, rows in enumerate(subpack_rows(dpack, subpacks)):
+        found = np.flatnonzero(rows >= 0)
+        which[rows[found]] = k
+        where[rows[found]] = found
+    return [None if k < 0 else (subpacks[k], j)
+            for k, j in zip(which.tolist(), where.tolist())]
@@ -6,10 +6,16 @@ attelo tests
 # no-member: numpy
 
 from __future__ import print_function
+from os import path as fp
+import os
+import pickle
+import shutil
+import tempfile
 import unittest
 
 import scipy.sparse
 import numpy
+from sklearn.datasets import load_svmlight_file
 import numpy as np
 
 import attelo
@@ -17,10 +23,31 @@ import attelo.fold
 
 from .edu import EDU, FAKE_ROOT
 from .fold import select_training
+from .io import (IoException,
+                 iter_multipack,
+                 load_multipack,
+                 load_prediction_binary,
+                 load_predictions,
+                 load_svmlight_chunked,
+                 write_prediction_array,
+                 write_prediction_binary,
+                 write_predictions_output)
+from .score import (build_confusion_matrix,
+                    score_edges,
+                    score_edges_by_label,
+                    score_edus)
 from .table import (DataPack,
                     DataPackException,
+                    Graph,
+                    LabelVocab,
+                    Pairings,
                     attached_only,
-                    groupings)
+                    grouping_ranges,
+                    groupings,
+                    idxes_inter,
+                    idxes_intra,
+                    select_window,
+                    subpack_rows)
 
 MAX_FOLDS = 2
 
@@ -41,6 +68,7 @@ class DataPackTest(unittest.TestCase):
                        pairings=[(edus[0], edus[1])],
                        data=scipy.sparse.csr_matrix([[6, 8]]),
                        target=numpy.array([1]),
+                       ctarget=dict(),
                        labels=['__UNK__', 'x', 'UNRELATED'],
                        graph=None,
                        vocab=None)
@@ -50,6 +78,7 @@ class DataPackTest(unittest.TestCase):
                             data=scipy.sparse.csr_matrix([[6, 8],
                                                           [7, 0]]),
                             target=numpy.array([1, 0]),
+                            ctarget=dict(),
                             labels=['__UNK__', 'x', 'UNRELATED'],
                             graph=None,
                             vocab=None)
@@ -88,6 +117,7 @@ class DataPackTest(unittest.TestCase):
                           triv.pairings,
                           triv.data,
                           [1, 1],
+                          {},
                           ['__UNK__', 'UNRELATED', 'foo'],
                           None)
 
@@ -105,12 +135,14 @@ class DataPackTest(unittest.TestCase):
                                       [(self.edus[0], FAKE_ROOT)],
                                       triv.data,
                                       triv.target,
+                                      triv.ctarget,
                                       triv.labels,
                                       None))
         dpack2 = DataPack.load(triv.edus,
                                triv.pairings,
                                triv.data,
                                triv.target,
+                               triv.ctarget,
                                triv.labels,
                                None)
         self.assertEqualishDatapack(triv, dpack2)
@@ -124,6 +156,7 @@ class DataPackTest(unittest.TestCase):
                                   (self.edus[2], self.edus[0])],
                         data=scipy.sparse.csr_matrix([[6], [7], [1], [5]]),
                         target=numpy.array([2, 1, 1, 3]),
+                        ctarget=dict(),
                         labels=['__UNK__', 'x', 'y', 'UNRELATED'],
                         graph=None,
                         vocab=None)
@@ -131,6 +164,32 @@ class DataPackTest(unittest.TestCase):
         self.assertEqual(['y', 'x', 'x', 'UNRELATED'], labels)
 
 
+    def test_label_vocab(self):
+        'label vocabularies behave like label lists'
+        labels = ['__UNK__', 'x', 'y', 'UNRELATED']
+        vocab = LabelVocab(labels)
+        self.assertEqual(labels, vocab)
+        self.assertEqual(vocab, labels)
+        self.assertNotEqual(vocab, labels[1:])
+        self.assertEqual([labels.index(l) for l in labels],
+                         [vocab.index(l) for l in labels])
+        self.assertTrue('y' in vocab)
+        self.assertFalse('z' in vocab)
+        self.assertRaises(ValueError, vocab.index, 'z')
+        self.assertEqual(['x', 'y'], list(vocab[1:3]))
+
+        triv = self.trivial
+        pack = DataPack.load(edus=triv.edus,
+                             pairings=triv.pairings,
+                             data=triv.data,
+                             target=triv.target,
+                             ctarget=dict(),
+                             labels=vocab,
+                             vocab=None)
+        self.assertEqual(3, pack.label_number('UNRELATED'))
+        self.assertEqual(2, self.trivial.label_number('UNRELATED'))
+        self.assertTrue(pack.selected([0]).labels is vocab)
+
     def test_select_classes(self):
         'test that classes are filtered correctly'
         # pylint: disable=invalid-name
@@ -150,6 +209,7 @@ class DataPackTest(unittest.TestCase):
                                                            [7, 0],
                                                            [3, 9]]),
                              target=numpy.array([3, 4, 2]),
+                             ctarget=dict(),
                              labels=orig_classes,
                              vocab=None)
 
@@ -163,6 +223,290 @@ class DataPackTest(unittest.TestCase):
         pack3 = pack.selected([1, 2])
         self.assertEqual(orig_classes, pack3.labels)
 
+    def test_pairings(self):
+        'columnar pairings behave like the list of tuples'
+        # pylint: disable=invalid-name
+        a1 = EDU('a1', 'hi', 0, 1, 'a', 's1')
+        a2 = EDU('a2', 'there', 3, 8, 'a', 's1')
+        a3 = EDU('a3', 'you', 9, 12, 'a', 's2')
+        # pylint: enable=invalid-name
+        tuples = [(FAKE_ROOT, a1), (a1, a2), (a2, a3), (a3, a1)]
+        pairings = Pairings.from_list(tuples, edus=[a1, a2, a3])
+        self.assertEqual(len(tuples), len(pairings))
+        self.assertEqual(tuples, pairings)
+        self.assertEqual(tuples[2], pairings[2])
+        self.assertEqual(tuples[1:3], pairings.selected([1, 2]))
+        self.assertEqual(['a'], list(groupings(pairings)))
+
+        pack = DataPack.load(edus=[a1, a2, a3],
+                             pairings=pairings,
+                             data=scipy.sparse.csr_matrix([[1], [2],
+                                                           [3], [4]]),
+                             target=numpy.array([1, 2, 1, 2]),
+                             ctarget=dict(),
+                             labels=['__UNK__', 'x', 'UNRELATED'],
+                             vocab=None)
+        self.assertEqual(tuples[1:3], pack.selected([1, 2]).pairings)
+        self.assertEqual(idxes_intra(pack).tolist(), [1])
+        self.assertEqual(idxes_intra(pack, True).tolist(), [0, 1])
+        self.assertEqual(idxes_inter(pack).tolist(), [2, 3])
+        self.assertEqual(select_window(pack, 1).pairings,
+                         tuples[:3])
+
+    def test_grouping_ranges(self):
+        'rows of each grouping, as slices if possible'
+        # pylint: disable=invalid-name
+        a1 = EDU('a1', 'hi', 0, 1, 'a', 's1')
+        a2 = EDU('a2', 'there', 3, 8, 'a', 's1')
+        b1 = EDU('b1', 'this', 0, 4, 'b', 's2')
+        b2 = EDU('b2', 'is', 6, 8, 'b', 's2')
+        # pylint: enable=invalid-name
+        contiguous = [(FAKE_ROOT, a1), (a1, a2), (FAKE_ROOT, b1), (b2, b1)]
+        self.assertEqual({'a': slice(0, 2), 'b': slice(2, 4)},
+                         grouping_ranges(contiguous))
+        scattered = [(a1, a2), (FAKE_ROOT, b1), (a2, a1), (b2, b1)]
+        self.assertEqual({'a': [0, 2], 'b': [1, 3]},
+                         {k: v.tolist() for k, v in
+                          grouping_ranges(scattered).items()})
+        self.assertEqual({}, grouping_ranges([]))
+        self.assertRaises(DataPackException, grouping_ranges,
+                          [(a1, b1)])
+
+    def test_selected_range(self):
+        'selecting a contiguous range of rows gives views'
+        triv = self.trivial_bidi
+        pack = DataPack.load(edus=triv.edus,
+                             pairings=triv.pairings,
+                             data=triv.data,
+                             target=triv.target,
+                             ctarget=dict(),
+                             labels=triv.labels,
+                             vocab=None)
+        for idxs in ([1], numpy.array([0, 1]), slice(0, 1), []):
+            sel = pack.selected(idxs)
+            if isinstance(idxs, slice):
+                ref = list(range(len(pack)))[idxs]
+            else:
+                ref = list(idxs)
+            self.assertEqual([pack.pairings[i] for i in ref],
+                             sel.pairings)
+            self.assertEqual(pack.target[ref].tolist(), sel.target.tolist())
+            self.assertEqual(squish(pack.data[ref]), squish(sel.data))
+            self.assertEqual([e for e in self.edus
+                              if any(e in p for p in sel.pairings)],
+                             sel.edus)
+        sel = pack.selected([0, 1])
+        self.assertTrue(numpy.may_share_memory(sel.target, pack.target))
+        self.assertTrue(numpy.may_share_memory(sel.data.data,
+                                               pack.data.data))
+
+    def test_edu_positions(self):
+        'EDU positions are in document order, and kept with the pack'
+        edus = self.edus
+        pack = DataPack.load(edus=[edus[2], FAKE_ROOT, edus[0], edus[1]],
+                             pairings=[(FAKE_ROOT, edus[0]),
+                                       (edus[0], edus[2]),
+                                       (edus[2], edus[1])],
+                             data=scipy.sparse.csr_matrix([[1], [2], [3]]),
+                             target=numpy.array([1, 1, 2]),
+                             ctarget=dict(),
+                             labels=['__UNK__', 'x', 'UNRELATED'],
+                             vocab=None)
+        positions = pack.edu_positions()
+        self.assertEqual([FAKE_ROOT] + edus, positions.edus)
+        self.assertEqual(2, positions.index['e2'])
+        self.assertEqual([0, 1, 3], positions.src.tolist())
+        self.assertEqual([1, 3, 2], positions.tgt.tolist())
+        self.assertTrue(positions is pack.edu_positions())
+        # adding a graph keeps the EDUs and pairings, so the positions
+        graph = Graph(prediction=numpy.zeros(3, dtype=numpy.int16),
+                      attach=numpy.zeros(3),
+                      label=numpy.zeros((3, 3)))
+        self.assertTrue(positions is pack.set_graph(graph).edu_positions())
+        self.assertEqual([0, 1], pack.selected([0, 1]).edu_positions().src
+                         .tolist())
+        self.assertEqual([(FAKE_ROOT, edus[0]), (edus[2], edus[1])],
+                         select_window(pack, 1).pairings)
+
+    def test_vstack(self):
+        'stacking datapacks, and splitting them back'
+        # pylint: disable=invalid-name
+        a1 = EDU('a1', 'hi', 0, 1, 'a', 's1')
+        a2 = EDU('a2', 'there', 3, 8, 'a', 's1')
+        b1 = EDU('b1', 'this', 0, 4, 'b', 's2')
+        b2 = EDU('b2', 'is', 6, 8, 'b', 's2')
+        # pylint: enable=invalid-name
+        labels = ['__UNK__', 'x', 'UNRELATED']
+        pack_a = DataPack.load(edus=[FAKE_ROOT, a1, a2],
+                               pairings=[(FAKE_ROOT, a1), (a1, a2)],
+                               data=scipy.sparse.csr_matrix([[6, 8],
+                                                             [0, 1]]),
+                               target=numpy.array([1, 2]),
+                               ctarget=dict(),
+                               labels=labels,
+                               vocab=None)
+        pack_b = DataPack.load(edus=[FAKE_ROOT, b1, b2],
+                               pairings=[(FAKE_ROOT, b2), (b2, b1),
+                                         (b1, b2)],
+                               data=scipy.sparse.csr_matrix([[7, 0],
+                                                             [3, 9],
+                                                             [0, 0]]),
+                               target=numpy.array([1, 1, 2]),
+                               ctarget=dict(),
+                               labels=labels,
+                               vocab=None)
+        stacked = DataPack.vstack([pack_a, pack_b])
+        self.assertEqual(pack_a.edus + pack_b.edus, stacked.edus)
+        self.assertEqual(list(pack_a.pairings) + list(pack_b.pairings),
+                         stacked.pairings)
+        self.assertEqual([1, 2, 1, 1, 2], stacked.target.tolist())
+        self.assertEqual(pack_a.data.toarray().tolist() +
+                         pack_b.data.toarray().tolist(),
+                         stacked.data.toarray().tolist())
+        self.assertEqual([0, 2, 5], stacked.stack_offsets().tolist())
+        self.assertEqual({'a': [0, 1], 'b': [2, 3, 4]},
+                         {k: v.tolist() for k, v in
+                          groupings(stacked.pairings).items()})
+        # the fake root is only in the EDU table once
+        self.assertEqual([FAKE_ROOT, a1, a2, b1, b2],
+                         stacked.edu_table.edus)
+        for orig, back in zip([pack_a, pack_b], stacked.unstacked()):
+            self.assertEqualishDatapack(orig, back)
+        self.assertRaises(ValueError, pack_a.unstacked)
+        self.assertRaises(ValueError, stacked.selected([0, 1]).unstacked)
+        # the offsets survive adding a graph, pickling and _replace
+        graph = Graph(prediction=numpy.zeros(5, dtype=numpy.int16),
+                      attach=numpy.zeros(5),
+                      label=numpy.zeros((5, len(labels))))
+        weighted = stacked.set_graph(graph)
+        for pack in [weighted,
+                     pickle.loads(pickle.dumps(weighted, -1)),
+                     weighted._replace(target=weighted.target + 0)]:
+            self.assertEqual([0, 2, 5], pack.stack_offsets().tolist())
+            unstacked = pack.unstacked()
+            self.assertEqual([2, 3], [len(d) for d in unstacked])
+            for orig, back in zip([pack_a, pack_b], unstacked):
+                self.assertEqualishDatapack(orig, back)
+                self.assertEqual(len(orig), len(back.graph.attach))
+
+    def test_subpack_rows(self):
+        'locating the pairings of subpacks in their parent'
+        triv = self.trivial_bidi
+        pack = DataPack.load(edus=triv.edus,
+                             pairings=triv.pairings,
+                             data=triv.data,
+                             target=triv.target,
+                             ctarget=dict(),
+                             labels=triv.labels,
+                             vocab=None)
+        sub1 = pack.selected([1, 0])
+        sub2 = sub1.selected([1])
+        # a pack that is not derived from the parent
+        sub3 = DataPack.load(edus=triv.edus,
+                             pairings=[pack.pairings[1]],
+                             data=triv.data[[1]],
+                             target=triv.target[[1]],
+                             ctarget=dict(),
+                             labels=triv.labels,
+                             vocab=None)
+        self.assertEqual([[1, 0], [0], [1]],
+                         [r.tolist() for r in
+                          subpack_rows(pack, [sub1, sub2, sub3])])
+        self.assertEqual([-1, 0], subpack_rows(sub2, [sub1])[0].tolist())
+
+    def test_pickled_subpack(self):
+        'a selected document pickles without the rest of the corpus'
+        def doc_pack(docs):
+            'datapack with all pairings within each of the documents'
+            edus = []
+            pairings = []
+            for doc in docs:
+                doc_edus = [EDU('{}_e{}'.format(doc, i), 'word', i, i + 1,
+                                doc, 's1')
+                            for i in range(10)]
+                edus.extend(doc_edus)
+                pairings.extend((edu1, edu2)
+                                for edu1 in [FAKE_ROOT] + doc_edus
+                                for edu2 in doc_edus if edu1 != edu2)
+            return DataPack.load(edus=[FAKE_ROOT] + edus,
+                                 pairings=pairings,
+                                 data=scipy.sparse.csr_matrix(
+                                     numpy.ones((len(pairings), 2))),
+                                 target=numpy.ones(len(pairings), dtype=int),
+                                 ctarget=dict(),
+                                 labels=['__UNK__', 'x', 'UNRELATED'],
+                                 vocab=None)
+
+        corpus = doc_pack(['d{}'.format(i) for i in range(50)])
+        doc = corpus.selected(grouping_ranges(corpus.pairings)['d5'])
+        doc.pairings.tuples()
+        standalone = doc_pack(['d5'])
+        self.assertEqualishDatapack(standalone, doc)
+        self.assertLess(len(pickle.dumps(doc, pickle.HIGHEST_PROTOCOL)),
+                        2 * len(pickle.dumps(standalone,
+                                             pickle.HIGHEST_PROTOCOL)))
+        # subpacks of the unpickled document still know their rows
+        doc2 = pickle.loads(pickle.dumps(doc, pickle.HIGHEST_PROTOCOL))
+        sub = doc2.selected([5, 2])
+        self.assertEqual([[5, 2]], [r.tolist() for r in
+                                    subpack_rows(doc2, [sub])])
+        self.assertEqual(doc.pairings, doc2.pairings)
+
+    def test_compact_graph(self):
+        'compacted graphs keep the best labels'
+        label = numpy.array([[0.1, 0.5, 0.4],
+                             [0.3, 0.3, 0.3],
+                             [0.0, 0.2, 0.7]])
+        graph = Graph(prediction=numpy.array([0, 0, 0]),
+                      attach=numpy.array([0.5, 0.2, 0.9]),
+                      label=label)
+        for top_k in [None, 1, 2, 5]:
+            small = graph.compacted(top_k=top_k)
+            self.assertEqual(numpy.float32, small.attach.dtype)
+            self.assertEqual([1, 0, 2], small.best_label().tolist())
+            self.assertTrue(numpy.allclose([0.5, 0.3, 0.7],
+                                           small.best_label_weight()))
+            self.assertEqual([2, 1], small.selected([2, 0]).best_label()
+                             .tolist())
+            both = Graph.vstack([small, graph])
+            self.assertEqual([1, 0, 2] * 2, both.best_label().tolist())
+        small = graph.compacted(top_k=2)
+        self.assertTrue(numpy.allclose([[0, 0.5, 0.4],
+                                        [0.3, 0.3, 0],
+                                        [0, 0.2, 0.7]],
+                                       small.dense_label()))
+
+    def test_aligned_scores(self):
+        'scoring predictions given as arrays or as triples'
+        edus = self.edus
+        pairings = [(e1, e2) for e1 in edus for e2 in edus if e1 != e2]
+        labels = ['__UNK__', 'x', 'y', 'UNRELATED']
+        pack = DataPack.load(edus=edus,
+                             pairings=pairings,
+                             data=scipy.sparse.csr_matrix(
+                                 numpy.ones((len(pairings), 2))),
+                             target=numpy.array([1, 3, 3, 2, 3, 3]),
+                             ctarget=dict(),
+                             labels=labels,
+                             vocab=None)
+        for prediction in [[1, 3, 3, 2, 3, 3],
+                           [2, 3, 3, 2, 3, 3],
+                           [3, 1, 3, 3, 1, 3],
+                           [2, 2, 3, -1, 3, 1]]:
+            prediction = numpy.array(prediction, dtype=numpy.int16)
+            triples = [(e1.id, e2.id, labels[lbl])
+                       for (e1, e2), lbl in zip(pairings, prediction)
+                       if lbl >= 0]
+            self.assertEqual(score_edges(pack, triples),
+                             score_edges(pack, prediction))
+            self.assertEqual(score_edus(pack, triples),
+                             score_edus(pack, prediction))
+            self.assertEqual(list(score_edges_by_label(pack, triples)),
+                             list(score_edges_by_label(pack, prediction)))
+            self.assertEqual(build_confusion_matrix(pack, triples).tolist(),
+                             build_confusion_matrix(pack, prediction)
+                             .tolist())
+
     def test_folds(self):
         'test that fold selection does something sensible'
 
@@ -182,6 +526,7 @@ class DataPackTest(unittest.TestCase):
                                     pairings=[(a1, a2)],
                                     data=scipy.sparse.csr_matrix([[6, 8]]),
                                     target=numpy.array([1]),
+                                    ctarget=dict(),
                                     labels=labels,
                                     vocab=None),
                  'b': DataPack.load(edus=[b1, b2],
@@ -190,18 +535,21 @@ class DataPackTest(unittest.TestCase):
                                     data=scipy.sparse.csr_matrix([[7, 0],
                                                                   [3, 9]]),
                                     target=numpy.array([0, 1]),
+                                    ctarget=dict(),
                                     labels=labels,
                                     vocab=None),
                  'c': DataPack.load(edus=[c1, c2],
                                     pairings=[(c1, c2)],
                                     data=scipy.sparse.csr_matrix([[1, 1]]),
                                     target=numpy.array([1]),
+                                    ctarget=dict(),
                                     labels=labels,
                                     vocab=None),
                  'd': DataPack.load(edus=[d1, d2],
                                     pairings=[(d1, d2)],
                                     data=scipy.sparse.csr_matrix([[0, 4]]),
                                     target=numpy.array([0]),
+                                    ctarget=dict(),
                                     labels=labels,
                                     vocab=None)}
         fold_dict = {'a': 0,
@@ -218,3 +566,103 @@ class DataPackTest(unittest.TestCase):
                                ['a1', 'a2', 'c1', 'c2'])
         self.assertEqualEduIds(attelo.fold.select_testing(mpack, fold_dict, 1),
                                ['b1', 'b2', 'd1', 'd2'])
+
+
+class IoTest(unittest.TestCase):
+    """
+    Reading datapacks from disk
+    """
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpdir)
+
+    prefix = fp.join('doc', 'example-corpus', 'tiny.')
+    paths = [prefix + x for x in ['edus', 'pairings', 'features.sparse',
+                                  'features.sparse.vocab']]
+
+    def assertEqualMultipack(self, mpack1, mpack2):
+        'multipacks have the same contents'
+        self.assertEqual(sorted(mpack1), sorted(mpack2))
+        for key, dpack in mpack1.items():
+            other = mpack2[key]
+            self.assertEqual(dpack.edus, other.edus)
+            self.assertEqual(dpack.pairings, other.pairings)
+            self.assertEqual(dpack.labels, other.labels)
+            self.assertEqual(dpack.vocab, other.vocab)
+            self.assertEqual(dpack.target.tolist(), other.target.tolist())
+            self.assertEqual(squish(dpack.data), squish(other.data))
+
+    def test_multipack_cache(self):
+        'the binary cache gives back what was read from the files'
+        paths = self.paths
+        cache_dir = fp.join(self._tmpdir, 'cache')
+        expected = load_multipack(*paths)
+        cold = load_multipack(*paths, cache_dir=cache_dir)
+        self.assertEqual(1, len(os.listdir(cache_dir)))
+        warm = load_multipack(*paths, cache_dir=cache_dir)
+        self.assertEqualMultipack(expected, cold)
+        self.assertEqualMultipack(expected, warm)
+
+    def test_load_svmlight_chunked(self):
+        'reading the features in parallel chunks changes nothing'
+        feature_file = self.paths[2]
+        expected, expected_y = load_svmlight_file(feature_file)
+        for chunk_size in [1, 10, None]:
+            got, got_y = load_svmlight_chunked(feature_file, n_jobs=2,
+                                               chunk_size=chunk_size)
+            self.assertEqual(expected.shape, got.shape)
+            for name in ['data', 'indices', 'indptr']:
+                self.assertEqual(getattr(expected, name).tolist(),
+                                 getattr(got, name).tolist())
+            self.assertEqual(expected_y.tolist(), got_y.tolist())
+
+    def test_prediction_files(self):
+        'writing and reading back predictions'
+        # pylint: disable=invalid-name
+        a1 = EDU('a"1', 'hi', 0, 1, 'a', 's1')
+        a2 = EDU('a\t2', 'there', 3, 8, 'a', 's1')
+        # pylint: enable=invalid-name
+        pairings = [(FAKE_ROOT, a1), (FAKE_ROOT, a2), (a1, a2), (a2, a1)]
+        dpack = DataPack.load(edus=[FAKE_ROOT, a1, a2],
+                              pairings=pairings,
+                              data=scipy.sparse.csr_matrix((4, 2)),
+                              target=numpy.array([1, 3, 2, 3]),
+                              ctarget=dict(),
+                              labels=['__UNK__', 'x', 'y', 'UNRELATED'],
+                              vocab=None)
+        prediction = numpy.array([2, 1, 3, 3], dtype=numpy.int16)
+        expected = [(e1.id, e2.id, dpack.get_label(lbl))
+                    for (e1, e2), lbl in zip(pairings, prediction)]
+        path1 = fp.join(self._tmpdir, 'predictions')
+        path2 = fp.join(self._tmpdir, 'predictions_from_triples')
+        write_prediction_array(dpack, prediction, path1)
+        write_predictions_output(dpack,
+                                 [x for x in expected
+                                  if x[2] != 'UNRELATED'],
+                                 path2)
+        with open(path1, 'rb') as stream1, open(path2, 'rb') as stream2:
+            self.assertEqual(stream1.read(), stream2.read())
+        self.assertEqual(expected, load_predictions(path1))
+        path3 = fp.join(self._tmpdir, 'predictions.bin')
+        write_prediction_binary(prediction, path3)
+        self.assertEqual(prediction.tolist(),
+                         load_prediction_binary(path3, dpack).tolist())
+        self.assertRaises(IoException, load_prediction_binary, path3,
+                          dpack.selected([0, 1]))
+
+    def test_iter_multipack(self):
+        'streaming the groupings gives the same datapacks'
+        expected = load_multipack(*self.paths)
+        streamed = list(iter_multipack(*self.paths))
+        self.assertEqual(['d1', 'd2', 'd3'], [k for k, _ in streamed])
+        self.assertEqualMultipack(expected, dict(streamed))
+        # EDU groupings in a different order from the pairings
+        with open(self.paths[0], 'rb') as stream:
+            lines = stream.readlines()
+        edu_file = fp.join(self._tmpdir, 'tiny.edus')
+        with open(edu_file, 'wb') as stream:
+            stream.writelines(lines[3:6] + lines[:3] + lines[6:])
+        stream = iter_multipack(edu_file, *self.paths[1:])
+        self.assertRaises(IoException, list, stream)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Time the splitting of a synthetic corpus-wide datapack into one
+datapack per document, the way attelo.io.load_multipack does it,
+and the stacking of these datapacks back into one (as the learners
+and the report do), then its unstacking.
+
+Usage: ::
+
+    python benchmarks/bench_datapack.py [--docs 100 1000] [--edus 20]
+"""
+
+from __future__ import print_function
+import argparse
+import time
+
+import numpy as np
+import scipy.sparse
+from tabulate import tabulate
+
+from attelo.edu import EDU, FAKE_ROOT, FAKE_ROOT_ID
+from attelo.table import (DataPack, UNKNOWN, UNRELATED, grouping_ranges)
+
+
+def synthetic_corpus(nb_docs, nb_edus, rng):
+    """A datapack for `nb_docs` documents of `nb_edus` EDUs each, with
+    all ordered pairs of EDUs (and the fake root) within each document
+    """
+    edus = [FAKE_ROOT]
+    pairings = []
+    for doc in range(nb_docs):
+        doc_name = 'd{}'.format(doc)
+        doc_edus = [EDU('{}_e{}'.format(doc_name, i), '', i, i + 1,
+                        doc_name, '{}_s{}'.format(doc_name, i // 5))
+                    for i in range(nb_edus)]
+        edus.extend(doc_edus)
+        for edu1 in [FAKE_ROOT] + doc_edus:
+            for edu2 in doc_edus:
+                if edu1 is not edu2:
+                    pairings.append((edu1, edu2))
+    nb_pairs = len(pairings)
+    data = scipy.sparse.random(nb_pairs, 100, density=0.05,
+                               format='csr', random_state=rng)
+    target = rng.randint(1, 4, size=nb_pairs)
+    return DataPack.load(edus=edus,
+                         pairings=pairings,
+                         data=data,
+                         target=target,
+                         ctarget={},
+                         labels=[UNKNOWN, 'x', 'y', UNRELATED],
+                         vocab=None)
+
+
+def split(dpack):
+    "one datapack per document"
+    grouped = grouping_ranges(dpack.pairing_columns())
+    return {grp_name: dpack.selected(idxs)
+            for grp_name, idxs in grouped.items()}
+
+
+def timed(func, *args, **kwargs):
+    "Return the result of a function call and its duration in seconds"
+    start = time.time()
+    res = func(*args, **kwargs)
+    return res, time.time() - start
+
+
+def main():
+    "run the benchmark"
+    psr = argparse.ArgumentParser(description=__doc__.strip())
+    psr.add_argument('--docs', type=int, nargs='+',
+                     default=[100, 1000],
+                     help='number of documents')
+    psr.add_argument('--edus', type=int, default=20,
+                     help='number of EDUs per document')
+    psr.add_argument('--seed', type=int, default=0)
+    args = psr.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    rows = []
+    for nb_docs in args.docs:
+        dpack = synthetic_corpus(nb_docs, args.edus, rng)
+        # first call includes building the columnar pairings
+        _, t_first = timed(split, dpack)
+        mpack, t_split = timed(split, dpack)
+        assert sum(len(d) for d in mpack.values()) == len(dpack)
+        assert all(FAKE_ROOT_ID in [e.id for e in d.edus]
+                   for d in mpack.values())
+        dpacks = list(mpack.values())
+        stacked, t_stack = timed(DataPack.vstack, dpacks)
+        unstacked, t_unstack = timed(stacked.unstacked)
+        assert [len(d) for d in unstacked] == [len(d) for d in dpacks]
+        rows.append([nb_docs, len(dpack), t_first, t_split,
+                     t_stack, t_unstack])
+    print(tabulate(rows,
+                   headers=['docs', 'pairings',
+                            'first split (s)', 'split (s)',
+                            'vstack (s)', 'unstack (s)'],
+                   floatfmt='.4f'))
+
+
+if __name__ == '__main__':
+    main()
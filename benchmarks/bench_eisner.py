@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare the reference and vectorized Eisner charts on synthetic
+documents of increasing size.
+
+Usage: ::
+
+    python benchmarks/bench_eisner.py [--sizes 10 50 100 200]
+"""
+
+from __future__ import print_function
+import argparse
+import time
+
+import numpy as np
+from tabulate import tabulate
+
+from attelo.decoding.eisner import eisner_chart, eisner_edges
+from attelo.decoding.util import MIN_SCORE
+
+
+def eisner_chart_naive(score, unique_real_root=True):
+    """Fill the Eisner chart one cell at a time.
+
+    This is the straightforward (and slow) version of `eisner_chart`,
+    kept as a reference to time it against (the decoding tests have
+    their own copy).
+
+    Parameters
+    ----------
+    score : 2D array of float
+        Attachment scores, see `eisner_chart`.
+
+    unique_real_root : boolean, optional
+        If True, the fake root has a unique child.
+
+    Returns
+    -------
+    cscores : 4D array of float
+        Chart of scores, indexed by [start][end][dir][complete].
+
+    csplits : 4D array of int
+        Chart of backpointers (split points), same layout.
+    """
+    nb_edus = score.shape[0]
+
+    # Eisner algorithm
+    # arrays of substructures for dynamic programming
+    # [start][end][dir][complete]
+    # scores
+    cscores = np.zeros((nb_edus, nb_edus, 2, 2), dtype=np.float64)
+    # backpointers: index of split point
+    csplits = np.zeros((nb_edus, nb_edus, 2, 2), dtype=np.int32)
+
+    # iterate over all possible spans of increasing size
+    for span in range(1, nb_edus):
+        for start in range(nb_edus - span):
+            end = start + span
+
+            # left open
+            range_k = range(start, end)
+            # find argmax and max on range_k
+            cands = [(cscores[start][k][0][1] +
+                      cscores[k + 1][end][1][1] +
+                      (score[end][start] if start > 0 else MIN_SCORE))
+                     for k in range_k]
+            max_cand = np.nanmax(cands)
+            argmax_cand = (range_k[cands.index(max_cand)]
+                           if not np.isnan(max_cand)
+                           else range_k[0])
+            # update tables
+            cscores[start][end][1][0] = max_cand
+            csplits[start][end][1][0] = argmax_cand
+
+            # right open
+            # if start == 0, restricting range_k to [0]
+            # enforces that the tree has a unique real root
+            range_k = ([0] if unique_real_root and start == 0
+                       else range(start, end))
+            # find argmax and max on range_k
+            cands = [(cscores[start][k][0][1] +
+                      cscores[k + 1][end][1][1] +
+                      score[start][end])
+                     for k in range_k]
+            max_cand = np.nanmax(cands)
+            argmax_cand = (range_k[cands.index(max_cand)]
+                           if not np.isnan(max_cand)
+                           else range_k[0])
+            # update tables
+            cscores[start][end][0][0] = max_cand
+            csplits[start][end][0][0] = argmax_cand
+
+            # left closed
+            range_k = range(start, end)
+            # find argmax and max on range_k
+            cands = [(cscores[start][k][1][1] +
+                      cscores[k][end][1][0])
+                     for k in range_k]
+            max_cand = np.nanmax(cands)
+            argmax_cand = (range_k[cands.index(max_cand)]
+                           if not np.isnan(max_cand)
+                           else range_k[0])
+            # update tables
+            cscores[start][end][1][1] = max_cand
+            csplits[start][end][1][1] = argmax_cand
+
+            # right closed
+            range_k = range(start + 1, end + 1)
+            # find argmax and max on range_k
+            cands = [(cscores[start][k][0][0] +
+                      cscores[k][end][0][1])
+                     for k in range_k]
+            max_cand = np.nanmax(cands)
+            argmax_cand = (range_k[cands.index(max_cand)]
+                           if not np.isnan(max_cand)
+                           else range_k[0])
+            # update tables
+            cscores[start][end][0][1] = max_cand
+            csplits[start][end][0][1] = argmax_cand
+
+    return cscores, csplits
+
+
+def synthetic_scores(nb_edus, rng):
+    """Random log-probability attachment scores for a document of
+    `nb_edus` EDUs (including the fake root at position 0)"""
+    score = np.log(rng.uniform(size=(nb_edus, nb_edus)))
+    score[np.diag_indices(nb_edus)] = MIN_SCORE
+    score[:, 0] = MIN_SCORE
+    return score
+
+
+def timed(func, *args, **kwargs):
+    "Return the result of a function call and its duration in seconds"
+    start = time.time()
+    res = func(*args, **kwargs)
+    return res, time.time() - start
+
+
+def main():
+    "run the benchmark"
+    psr = argparse.ArgumentParser(description=__doc__.strip())
+    psr.add_argument('--sizes', type=int, nargs='+',
+                     default=[10, 25, 50, 100, 200],
+                     help='document sizes (in EDUs)')
+    psr.add_argument('--seed', type=int, default=0)
+    args = psr.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    rows = []
+    for nb_edus in args.sizes:
+        score = synthetic_scores(nb_edus, rng)
+        (_, splits_ref), t_ref = timed(eisner_chart_naive, score)
+        (_, splits_vec), t_vec = timed(eisner_chart, score)
+        same = (sorted(eisner_edges(splits_ref)) ==
+                sorted(eisner_edges(splits_vec)))
+        rows.append([nb_edus, t_ref, t_vec, t_ref / max(t_vec, 1e-9),
+                     same])
+    print(tabulate(rows,
+                   headers=['EDUs', 'reference (s)', 'vectorized (s)',
+                            'speedup', 'same tree'],
+                   floatfmt='.4f'))
+
+
+if __name__ == '__main__':
+    main()
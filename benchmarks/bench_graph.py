@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure the memory taken by the weights of the graphs of a synthetic
+corpus (all ordered pairs of EDUs in each document, about 20 labels),
+as they are and compacted (see `attelo.table.Graph.compacted`), and
+the time it takes to compact them.
+
+Usage: ::
+
+    python benchmarks/bench_graph.py [--docs 1000] [--edus 20]
+"""
+
+from __future__ import print_function
+import argparse
+import time
+
+import numpy as np
+import scipy.sparse
+from tabulate import tabulate
+
+from attelo.table import Graph
+
+
+def synthetic_graph(nb_pairs, nb_labels, rng):
+    """Graph with random attachment probabilities and label
+    distributions"""
+    label = rng.dirichlet(np.ones(nb_labels) * 0.3, size=nb_pairs)
+    return Graph(prediction=np.zeros(nb_pairs, dtype=np.int16),
+                 attach=rng.uniform(size=nb_pairs),
+                 label=label)
+
+
+def nbytes(graph):
+    "Memory taken by the weights of a graph, in bytes"
+    label = graph.label
+    if scipy.sparse.issparse(label):
+        size = (label.data.nbytes + label.indices.nbytes +
+                label.indptr.nbytes)
+    else:
+        size = label.nbytes
+    return graph.attach.nbytes + size
+
+
+def timed(func, *args, **kwargs):
+    "Return the result of a function call and its duration in seconds"
+    start = time.time()
+    res = func(*args, **kwargs)
+    return res, time.time() - start
+
+
+def main():
+    "run the benchmark"
+    psr = argparse.ArgumentParser(description=__doc__.strip())
+    psr.add_argument('--docs', type=int, default=1000,
+                     help='number of documents')
+    psr.add_argument('--edus', type=int, default=20,
+                     help='number of EDUs per document')
+    psr.add_argument('--labels', type=int, default=20,
+                     help='number of labels')
+    psr.add_argument('--top', type=int, nargs='+', default=[1, 3, 5],
+                     help='number of labels to keep')
+    psr.add_argument('--seed', type=int, default=0)
+    args = psr.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    nb_pairs = args.docs * args.edus * args.edus
+    graph = synthetic_graph(nb_pairs, args.labels, rng)
+    best = graph.best_label()
+    ref_size = nbytes(graph)
+    rows = [['float64', 'all', ref_size / 2.0 ** 20, 1.0, 0.0]]
+    for top_k in [None] + args.top:
+        small, t_compact = timed(graph.compacted, dtype=np.float32,
+                                 top_k=top_k)
+        assert (small.best_label() == best).all()
+        size = nbytes(small)
+        rows.append(['float32', 'all' if top_k is None else top_k,
+                     size / 2.0 ** 20, float(size) / ref_size, t_compact])
+    print('{} pairings, {} labels'.format(nb_pairs, args.labels))
+    print(tabulate(rows,
+                   headers=['dtype', 'labels kept', 'weights (MiB)',
+                            'ratio', 'compact (s)'],
+                   floatfmt='.4f'))
+
+
+if __name__ == '__main__':
+    main()
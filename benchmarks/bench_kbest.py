@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Time the k-best Eisner and MST engines on synthetic documents, for
+increasing values of k, next to the time it would take to run the
+1-best MST search k times (which the k-best MST search should beat,
+as it resumes earlier searches, see `attelo.decoding.mst.mst_kbest`).
+
+Usage: ::
+
+    python benchmarks/bench_kbest.py [--sizes 20 50 100] [--kvals 1 5 20 50]
+"""
+
+from __future__ import print_function
+import argparse
+import time
+
+import numpy as np
+from tabulate import tabulate
+
+from attelo.decoding.eisner import eisner_kbest
+from attelo.decoding.mst import mst_edges, mst_kbest
+from attelo.decoding.util import MIN_SCORE
+
+
+def synthetic_scores(nb_edus, rng):
+    """Random log-probability attachment scores for a document of
+    `nb_edus` EDUs (including the fake root at position 0)"""
+    score = np.log(rng.uniform(size=(nb_edus, nb_edus)))
+    score[np.diag_indices(nb_edus)] = MIN_SCORE
+    score[:, 0] = MIN_SCORE
+    return score
+
+
+def timed(func, *args, **kwargs):
+    "Return the result of a function call and its duration in seconds"
+    start = time.time()
+    res = func(*args, **kwargs)
+    return res, time.time() - start
+
+
+def main():
+    "run the benchmark"
+    psr = argparse.ArgumentParser(description=__doc__.strip())
+    psr.add_argument('--sizes', type=int, nargs='+',
+                     default=[20, 50, 100],
+                     help='document sizes (in EDUs)')
+    psr.add_argument('--kvals', type=int, nargs='+',
+                     default=[1, 5, 20, 50],
+                     help='number of trees')
+    psr.add_argument('--seed', type=int, default=0)
+    args = psr.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    rows = []
+    for nb_edus in args.sizes:
+        score = synthetic_scores(nb_edus, rng)
+        mst_score = np.where(score > MIN_SCORE, score, -np.inf)
+        _, t_mst1 = timed(mst_edges, mst_score, 0)
+        for k in args.kvals:
+            _, t_eisner = timed(eisner_kbest, score, k)
+            _, t_mst = timed(mst_kbest, mst_score, 0, k)
+            rows.append([nb_edus, k, t_eisner, t_mst, k * t_mst1])
+    print(tabulate(rows,
+                   headers=['EDUs', 'k', 'Eisner (s)', 'MST (s)',
+                            'k x 1-best MST (s)'],
+                   floatfmt='.4f'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Time the MST and MSDAG engines of attelo.decoding.mst on dense
+synthetic document graphs, against the depparse package (MST only)
+when it is installed.
+
+Usage: ::
+
+    python benchmarks/bench_mst.py [--sizes 10 50 100 200]
+"""
+
+from __future__ import print_function
+from collections import defaultdict
+import argparse
+import time
+
+import numpy as np
+from tabulate import tabulate
+
+from attelo.decoding.mst import (mst_edges, _msdag)
+
+try:
+    from depparse.graph import Digraph
+except ImportError:
+    Digraph = None
+
+
+def synthetic_scores(nb_nodes, rng):
+    """Random dense scores for a document of `nb_nodes` EDUs, rooted
+    at position 0"""
+    scores = rng.normal(size=(nb_nodes, nb_nodes))
+    scores[np.diag_indices(nb_nodes)] = -np.inf
+    scores[:, 0] = -np.inf
+    return scores
+
+
+def depparse_mst(scores):
+    "MST through the depparse package, fed the way attelo used to"
+    targets = defaultdict(list)
+    for src, tgt in zip(*np.nonzero(np.isfinite(scores))):
+        targets[src].append(tgt)
+    graph = Digraph(targets,
+                    lambda s, t: scores[s, t],
+                    lambda s, t: None)
+    return list(graph.mst().iteredges())
+
+
+def timed(func, *args, **kwargs):
+    "Return the result of a function call and its duration in seconds"
+    start = time.time()
+    res = func(*args, **kwargs)
+    return res, time.time() - start
+
+
+def main():
+    "run the benchmark"
+    psr = argparse.ArgumentParser(description=__doc__.strip())
+    psr.add_argument('--sizes', type=int, nargs='+',
+                     default=[10, 50, 100, 200, 400],
+                     help='document sizes (in EDUs)')
+    psr.add_argument('--seed', type=int, default=0)
+    args = psr.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    rows = []
+    for nb_nodes in args.sizes:
+        scores = synthetic_scores(nb_nodes, rng)
+        edges, t_native = timed(mst_edges, scores, 0)
+        _, t_msdag = timed(_msdag, scores, edges)
+        row = [nb_nodes, t_native, t_msdag]
+        if Digraph is not None:
+            ref_edges, t_ref = timed(depparse_mst, scores)
+            same = sorted(edges) == sorted(ref_edges)
+            row.extend([t_ref, same])
+        rows.append(row)
+    headers = ['EDUs', 'attelo (s)', 'attelo MSDAG (s)']
+    if Digraph is not None:
+        headers.extend(['depparse (s)', 'same tree'])
+    print(tabulate(rows, headers=headers, floatfmt='.4f'))
+
+
+if __name__ == '__main__':
+    main()
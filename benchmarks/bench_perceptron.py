@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Time the training of the (averaged) perceptron and passive-aggressive
+learners on synthetic sparse data, with the same number of active
+features per row for increasing sizes of the feature space. With
+sparse updates, the training time should hardly depend on the latter.
+
+Usage: ::
+
+    python benchmarks/bench_perceptron.py [--features 10000 1000000]
+"""
+
+from __future__ import print_function
+import argparse
+import time
+
+import numpy as np
+import scipy.sparse
+from tabulate import tabulate
+
+from attelo.learning.perceptron import PassiveAggressive, Perceptron
+
+
+def synthetic_data(nb_rows, nb_features, nb_active, rng):
+    """Binary features matrix with (about) `nb_active` features per
+    row, and random -1/+1 targets"""
+    indices = [np.unique(rng.randint(nb_features, size=nb_active))
+               for _ in range(nb_rows)]
+    indptr = np.cumsum([0] + [len(idx) for idx in indices])
+    indices = np.concatenate(indices)
+    data = scipy.sparse.csr_matrix((np.ones(len(indices)), indices, indptr),
+                                   shape=(nb_rows, nb_features))
+    target = np.where(rng.uniform(size=nb_rows) < 0.5, -1, 1)
+    return data, target
+
+
+def timed(func, *args, **kwargs):
+    "Return the result of a function call and its duration in seconds"
+    start = time.time()
+    res = func(*args, **kwargs)
+    return res, time.time() - start
+
+
+def main():
+    "run the benchmark"
+    psr = argparse.ArgumentParser(description=__doc__.strip())
+    psr.add_argument('--rows', type=int, default=5000,
+                     help='number of rows (pairings)')
+    psr.add_argument('--features', type=int, nargs='+',
+                     default=[10000, 100000, 1000000],
+                     help='sizes of the feature space')
+    psr.add_argument('--active', type=int, default=50,
+                     help='number of active features per row')
+    psr.add_argument('--iter', type=int, default=1,
+                     help='number of passes over the data')
+    psr.add_argument('--seed', type=int, default=0)
+    args = psr.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    rows = []
+    for nb_features in args.features:
+        data, target = synthetic_data(args.rows, nb_features, args.active,
+                                      rng)
+        _, t_perc = timed(Perceptron(n_iter=args.iter, average=True).fit,
+                          data, target)
+        _, t_pa = timed(PassiveAggressive(n_iter=args.iter,
+                                          average=True).fit,
+                        data, target)
+        rows.append([nb_features, t_perc, t_pa])
+    print('{} rows, {} active features per row'.format(args.rows,
+                                                       args.active))
+    print(tabulate(rows,
+                   headers=['features', 'perceptron (s)', 'PA (s)'],
+                   floatfmt='.3f'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Time the scoring part of the harness report (`full_report` on the
+whole data, then on its intra-sentential pairings) for random
+predictions of many configurations over all folds of a synthetic
+corpus, with the predictions read once into a
+`attelo.harness.report.PredictionStore`, and optionally as lists of
+triples read back from the text output files (much slower).
+
+Usage: ::
+
+    python benchmarks/bench_report.py [--configs 30] [--folds 10] [--legacy]
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import scipy.sparse
+from tabulate import tabulate
+
+from attelo.edu import EDU, FAKE_ROOT
+from attelo.fold import make_n_fold, select_testing
+from attelo.harness.parse import binary_output_path
+from attelo.harness.report import PredictionStore, Slice, full_report
+from attelo.io import (load_predictions, write_prediction_array,
+                       write_prediction_binary)
+from attelo.table import DataPack, UNKNOWN, UNRELATED, idxes_intra
+
+METRICS = ['edges', 'edges_by_label', 'edus']
+
+
+def synthetic_mpack(nb_docs, nb_edus, rng):
+    """A multipack of `nb_docs` documents of `nb_edus` EDUs each, with
+    all ordered pairs of EDUs (and the fake root) within each document,
+    and sparse gold attachments
+    """
+    labels = [UNKNOWN, 'x', 'y', 'z', UNRELATED]
+    mpack = {}
+    for doc in range(nb_docs):
+        doc_name = 'd{}'.format(doc)
+        edus = [EDU('{}_e{}'.format(doc_name, i), '', i, i + 1,
+                    doc_name, '{}_s{}'.format(doc_name, i // 5))
+                for i in range(nb_edus)]
+        pairings = [(edu1, edu2) for edu1 in [FAKE_ROOT] + edus
+                    for edu2 in edus if edu1 is not edu2]
+        target = np.where(rng.uniform(size=len(pairings)) < 0.05,
+                          rng.randint(1, 4, size=len(pairings)),
+                          labels.index(UNRELATED))
+        mpack[doc_name] = DataPack.load(
+            edus=[FAKE_ROOT] + edus,
+            pairings=pairings,
+            data=scipy.sparse.csr_matrix((len(pairings), 1)),
+            target=target,
+            ctarget={},
+            labels=labels,
+            vocab=None)
+    return mpack
+
+
+def write_outputs(mpack, fold_dict, configs, tmpdir, rng):
+    """Write random predictions for each configuration and fold, in the
+    layout of the harness decoding outputs (documents in sorted order,
+    with binary versions); return their paths
+    """
+    paths = {}
+    for fold in sorted(set(fold_dict.values())):
+        f_mpack = select_testing(mpack, fold_dict, fold)
+        for config in configs:
+            path = os.path.join(tmpdir, '{}-{}.csv'.format(config, fold))
+            predictions = []
+            with open(path, 'wb'):
+                pass
+            for grouping in sorted(f_mpack):
+                dpack = f_mpack[grouping]
+                prediction = np.where(rng.uniform(size=len(dpack)) < 0.7,
+                                      dpack.target,
+                                      rng.randint(0, len(dpack.labels),
+                                                  size=len(dpack)))
+                prediction = prediction.astype(np.int16)
+                write_prediction_array(dpack, prediction, path + '.tmp')
+                with open(path, 'ab') as out, \
+                        open(path + '.tmp', 'rb') as seg:
+                    out.write(seg.read())
+                predictions.append(prediction)
+            write_prediction_binary(np.concatenate(predictions),
+                                    binary_output_path(path))
+            os.remove(path + '.tmp')
+            paths[(config, fold)] = path
+    return paths
+
+
+def slices(mpack, fold_dict, configs, paths, store):
+    """Report slices, read into the store (or as triples if the store
+    is None)"""
+    for fold in sorted(set(fold_dict.values())):
+        groupings = [g for g in mpack if fold_dict[g] == fold]
+        for config in configs:
+            path = paths[(config, fold)]
+            if store is None:
+                predictions = load_predictions(path)
+            else:
+                store.load(config, path, groupings)
+                predictions = store.predictions(config)
+            yield Slice(fold=fold,
+                        configuration=(config,),
+                        predictions=predictions,
+                        enable_details=True)
+
+
+def run_report(mpack, fold_dict, configs, paths, use_store):
+    "score everything, on the whole data then on the intra pairings"
+    res = []
+    for adjust_pack in [None, lambda d: d.selected(idxes_intra(d))]:
+        store = PredictionStore(mpack, configs) if use_store else None
+        res.append(full_report(mpack, fold_dict,
+                               slices(mpack, fold_dict, configs, paths,
+                                      store),
+                               METRICS,
+                               adjust_pack=adjust_pack))
+    return res
+
+
+def timed(func, *args, **kwargs):
+    "Return the result of a function call and its duration in seconds"
+    start = time.time()
+    res = func(*args, **kwargs)
+    return res, time.time() - start
+
+
+def main():
+    "run the benchmark"
+    psr = argparse.ArgumentParser(description=__doc__.strip())
+    psr.add_argument('--docs', type=int, default=200,
+                     help='number of documents')
+    psr.add_argument('--edus', type=int, default=20,
+                     help='number of EDUs per document')
+    psr.add_argument('--configs', type=int, default=30,
+                     help='number of configurations')
+    psr.add_argument('--folds', type=int, default=10,
+                     help='number of folds')
+    psr.add_argument('--legacy', action='store_true',
+                     help='also score the predictions as triples')
+    psr.add_argument('--seed', type=int, default=0)
+    args = psr.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    mpack = synthetic_mpack(args.docs, args.edus, rng)
+    fold_dict = make_n_fold(mpack, args.folds, random.Random(args.seed))
+    configs = ['c{}'.format(i) for i in range(args.configs)]
+    tmpdir = tempfile.mkdtemp()
+    try:
+        paths = write_outputs(mpack, fold_dict, configs, tmpdir, rng)
+        rpacks, t_store = timed(run_report, mpack, fold_dict, configs,
+                                paths, True)
+        rows = [['prediction store', t_store]]
+        if args.legacy:
+            ref_rpacks, t_legacy = timed(run_report, mpack, fold_dict,
+                                         configs, paths, False)
+            for rpack, ref_rpack in zip(rpacks, ref_rpacks):
+                for key, matrix in ref_rpack.confusion.items():
+                    assert (rpack.confusion[key] == matrix).all()
+            rows.append(['triples', t_legacy])
+    finally:
+        shutil.rmtree(tmpdir)
+    print('{} pairings, {} configurations, {} folds'.format(
+        sum(len(d) for d in mpack.values()), args.configs, args.folds))
+    print(tabulate(rows, headers=['predictions', 'time (s)'],
+                   floatfmt='.2f'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure the throughput of reading a (synthetic) svmlight features file
+with `load_svmlight_file`, and with `attelo.io.load_svmlight_chunked`
+for increasing numbers of processes (with a single process, the latter
+just calls the former).
+
+Usage: ::
+
+    python benchmarks/bench_svmlight.py [--rows 400000] [--jobs 1 2 4]
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from sklearn.datasets import load_svmlight_file
+from tabulate import tabulate
+
+from attelo.io import load_svmlight_chunked
+
+
+def write_features(path, nb_rows, nb_features, nb_active, rng):
+    """Write a features file with `nb_active` binary features per row
+    (one-based indices, as in our feature files)"""
+    with open(path, 'w') as stream:
+        stream.write('# labels: elaboration narration UNRELATED ROOT\n')
+        for _ in range(nb_rows):
+            feats = np.sort(rng.choice(nb_features, nb_active,
+                                       replace=False)) + 1
+            stream.write('{} {}\n'.format(
+                rng.randint(1, 5),
+                ' '.join('{}:1'.format(f) for f in feats)))
+
+
+def timed(func, *args, **kwargs):
+    "Return the result of a function call and its duration in seconds"
+    start = time.time()
+    res = func(*args, **kwargs)
+    return res, time.time() - start
+
+
+def main():
+    "run the benchmark"
+    psr = argparse.ArgumentParser(description=__doc__.strip())
+    psr.add_argument('--rows', type=int, default=400000,
+                     help='number of rows (pairings)')
+    psr.add_argument('--features', type=int, default=10000,
+                     help='number of features')
+    psr.add_argument('--active', type=int, default=20,
+                     help='number of active features per row')
+    psr.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 4],
+                     help='numbers of processes')
+    psr.add_argument('--seed', type=int, default=0)
+    args = psr.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'features.sparse')
+        write_features(path, args.rows, args.features, args.active, rng)
+        size_mb = os.path.getsize(path) / 2.0 ** 20
+        (ref, ref_y), t_ref = timed(load_svmlight_file, path,
+                                    n_features=args.features)
+        rows = [['load_svmlight_file', 1, t_ref, size_mb / t_ref]]
+        for n_jobs in args.jobs:
+            (mat, tgt), t_chunked = timed(load_svmlight_chunked, path,
+                                          n_features=args.features,
+                                          n_jobs=n_jobs)
+            assert (mat.indptr == ref.indptr).all()
+            assert (mat.indices == ref.indices).all()
+            assert (mat.data == ref.data).all()
+            assert (tgt == ref_y).all()
+            rows.append(['load_svmlight_chunked', n_jobs, t_chunked,
+                         size_mb / t_chunked])
+    finally:
+        shutil.rmtree(tmpdir)
+    print('{:.1f} MB file'.format(size_mb))
+    print(tabulate(rows,
+                   headers=['loader', 'processes', 'time (s)', 'MB/s'],
+                   floatfmt='.2f'))
+
+
+if __name__ == '__main__':
+    main()